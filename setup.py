@@ -26,6 +26,10 @@ setup(
     "BeanPorter.bpcml": "src/BeanPorter/bpcml",
   },
   install_requires = install_requires,
+  extras_require = {
+    # Accelerates the columnar engine.
+    'columnar': ['numpy'],
+  },
   package_data={
     'BeanPorter': ['bean_porter_config.yaml']
   },
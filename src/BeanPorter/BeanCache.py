@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+__copyright__ = "Copyright (C) 2021 WeZZard"
+__license__ = "MIT"
+
+from typing import Optional
+
+import os
+
+# Overrides the directory persistent caches are stored in. Setting it to an
+# empty string disables persistent caches.
+CACHE_DIRECTORY_ENVIRONMENT_VARIABLE = 'BEAN_PORTER_CACHE_DIR'
+
+
+def get_cache_directory() -> Optional[str]:
+  """
+  Returns the directory persistent caches are stored in, or None when
+  persistent caches are disabled.
+  """
+  directory = os.environ.get(CACHE_DIRECTORY_ENVIRONMENT_VARIABLE)
+
+  if directory is None:
+    xdg_cache_home = os.environ.get('XDG_CACHE_HOME')
+    if xdg_cache_home is None or len(xdg_cache_home) == 0:
+      xdg_cache_home = os.path.join(os.path.expanduser('~'), '.cache')
+    directory = os.path.join(xdg_cache_home, 'bean-porter')
+
+  if len(directory) == 0:
+    return None
+
+  return directory
+
+
+def get_cache_path(name: str) -> Optional[str]:
+  """
+  Returns the path of a named persistent cache, creating the cache directory
+  if needed. Returns None when persistent caches are disabled or the cache
+  directory cannot be created.
+  """
+  directory = get_cache_directory()
+
+  if directory is None:
+    return None
+
+  try:
+    # Caches are only for the user, as some are unpickled.
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+  except OSError:
+    return None
+
+  return os.path.join(directory, name)
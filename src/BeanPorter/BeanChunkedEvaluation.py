@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+__copyright__ = "Copyright (C) 2021 WeZZard"
+__license__ = "MIT"
+
+from typing import Callable, Deque, Iterable, Iterator, List, Optional
+
+import collections
+import concurrent.futures
+import itertools
+
+from beancount.core import data
+
+from BeanPorter.bpcml.BPCML import Importer
+from BeanPorter.BeanColumnarEngine import BeanColumnarEngine
+from BeanPorter.BeanExtractContext import BeanExtractContext
+from BeanPorter.BeanExtractRuleset import BeanExtractRuleset
+
+DEFAULT_JOBS = 1
+
+DEFAULT_CHUNK_SIZE = 16 * 1024
+
+# Chunks submitted ahead of the one being stitched, per worker.
+_CHUNKS_IN_FLIGHT_PER_JOB = 2
+
+# Evaluates a chunk of rows in a worker process, made once by the
+# initializer.
+_WORKER_EVALUATE_CHUNK: Optional[Callable[[List[List[str]]], List[data.Transaction]]] = None
+
+
+def iter_evaluate_rows(
+  importer: Importer,
+  header: List[str],
+  ruleset: BeanExtractRuleset,
+  rows: Iterable[List[str]],
+  flag: str
+) -> Iterator[data.Transaction]:
+  """
+  Evaluates rows one after another with the engine selected by the
+  importer, yielding the transactions made.
+  """
+  if importer.engine == 'columnar':
+    columnar_engine = BeanColumnarEngine(ruleset)
+    txns = columnar_engine.iter_evaluate_rows(rows, flag)
+  else:
+    extract_context = BeanExtractContext(flag, importer, header, ruleset)
+    txns = (extract_context.evaluate(r, flag) for r in rows)
+
+  for each_txn in txns:
+    if each_txn is not None:
+      yield each_txn
+
+
+def _initialize_worker(importer: Importer, header: List[str], flag: str):
+  global _WORKER_EVALUATE_CHUNK
+  ruleset = BeanExtractRuleset.make(importer, header)
+  _WORKER_EVALUATE_CHUNK = lambda rows: list(iter_evaluate_rows(importer, header, ruleset, rows, flag))
+
+
+def _evaluate_chunk_in_worker(rows: List[List[str]]) -> List[data.Transaction]:
+  return _WORKER_EVALUATE_CHUNK(rows)
+
+
+def iter_chunks(rows: Iterable[List[str]], chunk_size: int) -> Iterator[List[List[str]]]:
+  """
+  Splits rows into consecutive chunks of at most `chunk_size` rows.
+  """
+  rows = iter(rows)
+  while True:
+    chunk = list(itertools.islice(rows, chunk_size))
+    if len(chunk) == 0:
+      return
+    yield chunk
+
+
+def iter_evaluate_chunks(
+  importer: Importer,
+  header: List[str],
+  ruleset: BeanExtractRuleset,
+  rows: Iterable[List[str]],
+  flag: str,
+  jobs: int,
+  chunk_size: int
+) -> Iterator[data.Transaction]:
+  """
+  Evaluates rows in chunks on `jobs` worker processes, yielding the
+  transactions in the order of the rows, the same as `iter_evaluate_rows`.
+
+  Each worker compiles the importer's ruleset for the header once and keeps
+  its own evaluation state. Only a bounded number of chunks are in flight,
+  so rows are still streamed. Rows fitting in one chunk are evaluated in
+  process with `ruleset`.
+  """
+  assert(jobs > 1)
+  assert(chunk_size > 0)
+
+  chunks = iter_chunks(rows, chunk_size)
+  first_chunks = list(itertools.islice(chunks, 2))
+
+  if len(first_chunks) <= 1:
+    for each_chunk in first_chunks:
+      yield from iter_evaluate_rows(importer, header, ruleset, each_chunk, flag)
+    return
+
+  with concurrent.futures.ProcessPoolExecutor(
+    max_workers=jobs,
+    initializer=_initialize_worker,
+    initargs=(importer, header, flag)
+  ) as executor:
+    pending_chunks: Deque[concurrent.futures.Future] = collections.deque()
+
+    for each_chunk in itertools.chain(first_chunks, chunks):
+      pending_chunks.append(executor.submit(_evaluate_chunk_in_worker, each_chunk))
+      if len(pending_chunks) >= jobs * _CHUNKS_IN_FLIGHT_PER_JOB:
+        yield from pending_chunks.popleft().result()
+
+    while len(pending_chunks) > 0:
+      yield from pending_chunks.popleft().result()
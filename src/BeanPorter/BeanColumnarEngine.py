@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+__copyright__ = "Copyright (C) 2021 WeZZard"
+__license__ = "MIT"
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import itertools
+
+from beancount.core import data
+
+from BeanPorter.bpcml.BPCML import TRANSACTION_PROPERTY_SLOTS
+from BeanPorter.bpcml.RuleCompiler import CompiledRule
+from BeanPorter.BeanExtractContext import BeanExtractContext
+from BeanPorter.BeanExtractRuleset import BeanExtractRuleset
+from BeanPorter.BeanTransformerDispatcher import ColumnPatternAutomaton
+from BeanPorter.BeanTransformerPlan import BeanTransformerPlan
+
+DEFAULT_BATCH_SIZE = 64 * 1024
+
+_SLOT_COUNT = len(TRANSACTION_PROPERTY_SLOTS)
+
+# A set of rows in a batch.
+Mask = Any
+
+
+def import_numpy() -> Optional[Any]:
+  """
+  Imports NumPy, which is slow to import, when an engine first uses it.
+  Returns None when NumPy is not installed.
+  """
+  try:
+    import numpy
+  except ImportError:
+    return None
+  return numpy
+
+
+class _BitMasks(object):
+  """
+  Masks as Python ints, bit i standing for row i.
+  """
+
+  def __init__(self, row_count: int):
+    self.row_count = row_count
+    self.full: Mask = (1 << row_count) - 1
+    self.empty: Mask = 0
+
+  def make(self, indices: List[int]) -> Mask:
+    if len(indices) == 0:
+      return 0
+    bits = bytearray(b'0') * self.row_count
+    for i in indices:
+      bits[i] = ord('1')
+    return int(bits[::-1], 2)
+
+  def intersect(self, lhs: Mask, rhs: Mask) -> Mask:
+    return lhs & rhs
+
+  def subtract(self, lhs: Mask, rhs: Mask) -> Mask:
+    return lhs & ~rhs
+
+  def any(self, mask: Mask) -> bool:
+    return mask != 0
+
+  def indices(self, mask: Mask) -> List[int]:
+    bits = bin(mask)[:1:-1]
+    return [i for (i, b) in enumerate(bits) if b == '1']
+
+
+class _NumpyMasks(object):
+  """
+  Masks as NumPy boolean arrays.
+  """
+
+  def __init__(self, numpy: Any, row_count: int):
+    self.numpy = numpy
+    self.row_count = row_count
+    self.full: Mask = numpy.ones(row_count, dtype=bool)
+    self.empty: Mask = numpy.zeros(row_count, dtype=bool)
+
+  def make(self, indices: List[int]) -> Mask:
+    mask = self.numpy.zeros(self.row_count, dtype=bool)
+    mask[indices] = True
+    return mask
+
+  def intersect(self, lhs: Mask, rhs: Mask) -> Mask:
+    return lhs & rhs
+
+  def subtract(self, lhs: Mask, rhs: Mask) -> Mask:
+    return lhs & ~rhs
+
+  def any(self, mask: Mask) -> bool:
+    return bool(mask.any())
+
+  def indices(self, mask: Mask) -> List[int]:
+    return self.numpy.flatnonzero(mask).tolist()
+
+
+class BeanColumnarEngine(object):
+  """
+  Evaluates transformers column-wise over batches of rows, producing the
+  same transactions as evaluating rows one by one with BeanExtractContext.
+
+  The rows matched by all the patterns on a column are found in one pass
+  over the column with a ColumnPatternAutomaton, then combined into masks of
+  the rows matched by each transformer. For
+  each key, transformers are visited from the most specific, each winning
+  the rows of its mask not won yet, and its rule is evaluated on those rows
+  only. NumPy accelerates masks when it is installed.
+  """
+
+  def __init__(self, ruleset: BeanExtractRuleset, batch_size: int = DEFAULT_BATCH_SIZE, uses_numpy: Optional[bool] = None):
+    self.ruleset = ruleset
+    self.batch_size = batch_size
+    self.uses_numpy = uses_numpy if uses_numpy is not None else import_numpy() is not None
+    assert(not self.uses_numpy or import_numpy() is not None)
+
+    self.prototype_values = ruleset.prototype_slot_values
+    self.unconditional_rules: Dict[int, CompiledRule] = dict(ruleset.unconditional_rule_slots)
+
+    # Plans defining each slot, most specific first, then in declaration
+    # order. Plans without patterns are kept apart as they never override
+    # prototype values.
+    self.specific_slot_plans: List[List[Tuple[BeanTransformerPlan, CompiledRule]]] = [list() for _ in range(_SLOT_COUNT)]
+    self.unspecific_slot_plans: List[List[Tuple[BeanTransformerPlan, CompiledRule]]] = [list() for _ in range(_SLOT_COUNT)]
+    for each_plan in ruleset.dispatched_plans:
+      if not each_plan.can_match():
+        continue
+      for (slot, evaluate) in each_plan.rule_slots:
+        if each_plan.specificity > 0:
+          self.specific_slot_plans[slot].append((each_plan, evaluate))
+        else:
+          self.unspecific_slot_plans[slot].append((each_plan, evaluate))
+    for each_plans in self.specific_slot_plans:
+      each_plans.sort(key=lambda x: (-x[0].specificity, x[0].index))
+
+    automatons: Dict[int, ColumnPatternAutomaton] = dict()
+    pattern_ids: Dict[Tuple[int, str], int] = dict()
+    self.plan_pattern_ids: Dict[int, List[int]] = dict()
+    for each_plan in ruleset.dispatched_plans:
+      if not each_plan.can_match():
+        continue
+      plan_pattern_ids: List[int] = list()
+      for each_column_pattern in each_plan.column_patterns:
+        pattern_id = pattern_ids.get(each_column_pattern)
+        if pattern_id is None:
+          pattern_id = len(pattern_ids)
+          pattern_ids[each_column_pattern] = pattern_id
+          (column_index, raw_pattern) = each_column_pattern
+          automaton = automatons.get(column_index)
+          if automaton is None:
+            automaton = ColumnPatternAutomaton(column_index)
+            automatons[column_index] = automaton
+          automaton.add(pattern_id, raw_pattern)
+        plan_pattern_ids.append(pattern_id)
+      self.plan_pattern_ids[each_plan.index] = plan_pattern_ids
+    for each_automaton in automatons.values():
+      each_automaton.freeze()
+    self.automatons: List[ColumnPatternAutomaton] = list(automatons.values())
+    self.pattern_count = len(pattern_ids)
+
+  def iter_evaluate_rows(self, rows: Iterable[List[str]], flags: str) -> Iterator[Optional[data.Transaction]]:
+    """
+    Evaluates rows batch by batch, yielding a transaction or None per row.
+    """
+    rows = iter(rows)
+    while True:
+      batch = list(itertools.islice(rows, self.batch_size))
+      if len(batch) == 0:
+        return
+      yield from self.evaluate_rows(batch, flags)
+
+  def evaluate_rows(self, rows: List[List[str]], flags: str) -> List[Optional[data.Transaction]]:
+    row_count = len(rows)
+    if row_count == 0:
+      return list()
+
+    masks = _NumpyMasks(import_numpy(), row_count) if self.uses_numpy else _BitMasks(row_count)
+
+    # One pass over each pattern column finds the rows every pattern matches.
+    pattern_rows: List[List[int]] = [list() for _ in range(self.pattern_count)]
+    for each_automaton in self.automatons:
+      column_index = each_automaton.column_index
+      for (i, each_row) in enumerate(rows):
+        matched_pattern_ids: List[int] = list()
+        each_automaton.collect_cell_matches(each_row[column_index], matched_pattern_ids)
+        for each_pattern_id in matched_pattern_ids:
+          pattern_rows[each_pattern_id].append(i)
+    pattern_masks = [masks.make(r) for r in pattern_rows]
+
+    plan_masks: Dict[int, Mask] = dict()
+
+    def get_plan_mask(plan: BeanTransformerPlan) -> Mask:
+      mask = plan_masks.get(plan.index)
+      if mask is None:
+        mask = masks.full
+        for each_pattern_id in self.plan_pattern_ids[plan.index]:
+          mask = masks.intersect(mask, pattern_masks[each_pattern_id])
+        plan_masks[plan.index] = mask
+      return mask
+
+    def assign(value_column: List[Optional[str]], evaluate: CompiledRule, mask: Mask):
+      for i in masks.indices(mask):
+        value_column[i] = evaluate(rows[i])
+
+    value_columns: List[List[Optional[str]]] = list()
+
+    for slot in range(_SLOT_COUNT):
+      value_column: List[Optional[str]] = [self.prototype_values[slot]] * row_count
+      remaining = masks.full
+
+      for (each_plan, evaluate) in self.specific_slot_plans[slot]:
+        won = masks.intersect(get_plan_mask(each_plan), remaining)
+        if masks.any(won):
+          remaining = masks.subtract(remaining, won)
+          assign(value_column, evaluate, won)
+
+      unconditional_rule = self.unconditional_rules.get(slot)
+      if unconditional_rule is not None:
+        assign(value_column, unconditional_rule, remaining)
+        remaining = masks.empty
+      elif self.prototype_values[slot] is not None:
+        remaining = masks.empty
+
+      for (each_plan, evaluate) in self.unspecific_slot_plans[slot]:
+        won = masks.intersect(get_plan_mask(each_plan), remaining)
+        if masks.any(won):
+          remaining = masks.subtract(remaining, won)
+          assign(value_column, evaluate, won)
+
+      value_columns.append(value_column)
+
+    fingerprint_row = self.ruleset.fingerprint_row
+    timestamp_parser = self.ruleset.timestamp_parser
+    return [BeanExtractContext.make_transaction(list(values), row, flags, timestamp_parser, fingerprint_row(row)) for (values, row) in zip(zip(*value_columns), rows)]
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+__copyright__ = "Copyright (C) 2021 WeZZard"
+__license__ = "MIT"
+
+from typing import Hashable, Iterable, Iterator, List, Optional, Set, Tuple
+
+import datetime
+
+from decimal import Decimal
+
+from beancount.core import data
+
+from BeanPorter.BeanImportState import FINGERPRINT_META_KEY
+
+# What to do with transactions found in existing entries: mark them with
+# beancount's duplicate metadata, which comments them out when printed, or
+# drop them.
+DUPLICATE_ACTIONS: Set[str] = frozenset(['flag', 'drop'])
+
+DEFAULT_DUPLICATE_ACTION = 'flag'
+
+
+def normalize_payee(payee: Optional[str]) -> str:
+  """
+  Normalizes a payee for comparison: case folded, blanks collapsed.
+  """
+  if payee is None:
+    return ''
+  return ' '.join(payee.split()).casefold()
+
+
+# Units of a posting: account, number and currency.
+PostingUnits = Tuple[str, Decimal, str]
+
+
+def iter_keys(date: datetime.date, payee: Optional[str], fingerprint: Optional[str], postings: Iterable[PostingUnits]) -> Iterator[Hashable]:
+  """
+  Yields the keys a transaction is indexed by: its fingerprint if any, and
+  the date, account, amount and normalized payee of each posting.
+  """
+  if fingerprint is not None:
+    yield (FINGERPRINT_META_KEY, fingerprint)
+
+  payee = normalize_payee(payee)
+  for (account, number, currency) in postings:
+    yield (date, account, number, currency, payee)
+
+
+def iter_transaction_keys(txn: data.Transaction) -> Iterator[Hashable]:
+  """
+  Yields the keys a transaction is indexed by.
+  """
+  fingerprint = txn.meta.get(FINGERPRINT_META_KEY) if txn.meta is not None else None
+  postings = [(p.account, p.units.number, p.units.currency) for p in txn.postings if p.units is not None and p.units.number is not None]
+  return iter_keys(txn.date, txn.payee, fingerprint, postings)
+
+
+class BeanDuplicateIndex(object):
+  """
+  A hash index of existing transactions. A new transaction is a duplicate
+  when it has the fingerprint of an existing one, or shares a posting with
+  one on the same date with the same payee. Each check takes constant time
+  however many entries are indexed.
+  """
+
+  def __init__(self, keys: Set[Hashable]):
+    self.keys = keys
+
+  @staticmethod
+  def make(entries: Iterable[data.Directive]) -> 'BeanDuplicateIndex':
+    keys: Set[Hashable] = set()
+    for each_entry in entries:
+      if isinstance(each_entry, data.Transaction):
+        keys.update(iter_transaction_keys(each_entry))
+    return BeanDuplicateIndex(keys)
+
+  def update(self, keys: Iterable[Hashable]):
+    self.keys.update(keys)
+
+  def has_fingerprint(self, fingerprint: str) -> bool:
+    return (FINGERPRINT_META_KEY, fingerprint) in self.keys
+
+  def is_duplicate(self, txn: data.Transaction) -> bool:
+    keys = self.keys
+    return any(k in keys for k in iter_transaction_keys(txn))
+
+  def apply(self, txns: Iterable[data.Transaction], action: str = DEFAULT_DUPLICATE_ACTION) -> List[data.Transaction]:
+    """
+    Flags or drops the duplicates among new transactions.
+    """
+    if action not in DUPLICATE_ACTIONS:
+      raise AssertionError('Unrecognized duplicate action: {}'.format(action))
+
+    # Importing beancount.ingest imports pytest, so it is left to the
+    # extraction paths.
+    from beancount.ingest.extract import DUPLICATE_META
+
+    results: List[data.Transaction] = list()
+
+    for each_txn in txns:
+      if not self.is_duplicate(each_txn):
+        results.append(each_txn)
+      elif action == 'flag':
+        marked_meta = each_txn.meta.copy()
+        marked_meta[DUPLICATE_META] = True
+        results.append(each_txn._replace(meta=marked_meta))
+
+    return results
@@ -1,203 +1,135 @@
 #!/usr/bin/env python3
 
-from typing import List, Dict, Optional, Tuple, Any
+from typing import List, Optional
 
-import re
-import dateutil
-import distutils.util
 import logging
 
 from beancount.core import data
 from beancount.core.amount import Amount
 from beancount.core.number import D as to_decimal
-from beancount.utils.date_utils import parse_date_liberally
 
-from BeanPorter.bpcml.BPCML import Transformer, Importer
-from BeanPorter.bpcml.BPCML import TRANSACTION_PROPERTY_KEYS, REQUIRED_TRANSACTION_PROPERTY_KEYS
+from BeanPorter.bpcml.BPCML import Importer
+from BeanPorter.bpcml.BPCML import TRANSACTION_PROPERTY_KEYS, TRANSACTION_PROPERTY_SLOTS, REQUIRED_TRANSACTION_PROPERTY_KEYS
+from BeanPorter.bpcml.RuleCompiler import CompiledRule
+from BeanPorter.bpcml.TimestampParser import TimestampParser
 
+from BeanPorter.BeanExtractRuleset import BeanExtractRuleset
+from BeanPorter.BeanImportState import FINGERPRINT_META_KEY
 
-class _VariableColumnMap(object):
-  
-  def __init__(self, variable_map: Dict[str, str], header: List[str]):
-    variable_column_map: Dict[str, Tuple[re.Pattern, int]] = {}
-    for variable_name in variable_map:
-      column = variable_map[variable_name]
-      column_index = header.index(column)
-      if column_index is not None:
-        if variable_name in variable_column_map.keys():
-          logging.debug('Duplicate variable mapping: {n1} => {i1}, {n2} => {i2}. The latest is used.'.format(n1=variable_name, i1=variable_column_map[variable_name][1], n2=variable_name, i2=column_index))
-        variable_column_map[variable_name] = tuple([re.compile(re.escape(variable_name)), column_index])
-    self.variable_column_map = variable_column_map
-
-  def get_column_for_term(self, searched_term: str) -> Optional[int]:
-    for variable_name in self.variable_column_map:
-      pattern_and_index = self.variable_column_map[variable_name]
-      pattern: re.Pattern = pattern_and_index[0]
-      index: int = pattern_and_index[1]
-      if pattern.match(searched_term) is not None:
-        return index
-    
-    return None
+_SLOT_COUNT = len(TRANSACTION_PROPERTY_SLOTS)
 
-class BeanExtractRecord(object):
+_TRUE_STRINGS = frozenset(['y', 'yes', 't', 'true', 'on', '1'])
 
-  def __init__(self, key: str, value: object, transformer: Transformer):
-    assert(isinstance(key, str))
-    assert(isinstance(transformer, Transformer))
-    self.key = key
-    self.value = value
-    self.transformer = transformer
+_FALSE_STRINGS = frozenset(['n', 'no', 'f', 'false', 'off', '0'])
 
-class BeanExtractContext(object):
 
-  def __init__(self, flag: str, importer: Importer, header: List[str]):
-    self.flag = flag
-    self.importer = importer
-    self.header = header
-    self._dynamic_records: Dict[str, BeanExtractRecord] = dict()
-    self._current_transformer: Optional[Transformer] = None
-  
-  def __setattr__(self, __name: str, __value: Any):
-    if __name in TRANSACTION_PROPERTY_KEYS:
-      self._set_dynamic_attr(__name, __value)
-    else:
-      super().__setattr__(__name, __value)
-
-  def __getattr__(self, __name: str) -> Any:
-    if __name in TRANSACTION_PROPERTY_KEYS:
-      return self._get_dynamic_attr(__name)
-    else:
-      return super().__getattr__(__name)
-  
-  def _set_dynamic_attr(self, name: str, value: Any):
-    assert(name in TRANSACTION_PROPERTY_KEYS)
-    self._dynamic_records[name] = BeanExtractRecord(name, value, self._current_transformer)
-  
-  def _get_dynamic_attr(self, name: str) -> Any:
-    assert(name in TRANSACTION_PROPERTY_KEYS)
-    record = self._dynamic_records.get(name)
-    if record is None:
-      return None
-    return record.value
-  
-  def _has_dynamic_attr(self, name: str) -> bool:
-    assert(name in TRANSACTION_PROPERTY_KEYS)
-    return name in self._dynamic_records
-  
-  def _get_latest_transformer_for_dynamic_attr(self, name: str) -> Optional[Transformer]:
-    assert(name in TRANSACTION_PROPERTY_KEYS)
-    record = self._dynamic_records.get(name)
-    if record is None:
-      return None
-    return record.transformer
+def _strtobool(string: str) -> bool:
+  # What `distutils.util.strtobool` does, without importing distutils.
+  lowered = string.lower()
+  if lowered in _TRUE_STRINGS:
+    return True
+  if lowered in _FALSE_STRINGS:
+    return False
+  raise ValueError('invalid truth value {!r}'.format(string))
 
-  def _push_transformer(self, transformer: Transformer):
-    self._current_transformer = transformer
-  
-  def _pop_transformer(self) -> Transformer:
-    assert(self._current_transformer is not None)
-    retVal = self._current_transformer
-    self._current_transformer = None
-    return retVal
-  
-  def _cleanup(self):
-    self._dynamic_records = dict()
-  
-  def _apply(self, transformer: Transformer, variables: Dict[str, str]):
-    for each_key in TRANSACTION_PROPERTY_KEYS:
-      self._apply_key_if_needed(each_key, transformer, variables)
-  
-  def _apply_key_if_needed(self, key: str, transformer: Transformer, variables: Dict[str, str]):
-    value = transformer.map_value(key, variables)
-    if value is not None:
-      needs_set = True
-      if self._has_dynamic_attr(key):
-        previous_transformer = self._get_latest_transformer_for_dynamic_attr(key)
-        needs_set = len(transformer.patterns) > len(previous_transformer.patterns)
-      if needs_set:
-        logging.debug('Apply {key} with {value}'.format(key=key, value=value))
-        self._set_dynamic_attr(key, value)
-  
-  def _should_apply(self, transformer: Transformer, row: List[str], term_column_map: _VariableColumnMap) -> bool:
-    """
-    Check should apply the transformer to the row with terminology-column map.
-    """
-    
-    all_pattenrs_matched = True
+_REQUIRED_SLOTS = [(k, TRANSACTION_PROPERTY_SLOTS[k]) for k in sorted(REQUIRED_TRANSACTION_PROPERTY_KEYS)]
 
-    for each_term in transformer.patterns:
+_COMPLETE = TRANSACTION_PROPERTY_SLOTS['complete']
+_TIMESTAMP = TRANSACTION_PROPERTY_SLOTS['timestamp']
+_TIME = TRANSACTION_PROPERTY_SLOTS['time']
+_PAYEE = TRANSACTION_PROPERTY_SLOTS['payee']
+_TRANSACTION_NAME = TRANSACTION_PROPERTY_SLOTS['transaction_name']
+_DEBIT_ACCOUNT = TRANSACTION_PROPERTY_SLOTS['debit_account']
+_DEBIT_AMOUNT = TRANSACTION_PROPERTY_SLOTS['debit_amount']
+_DEBIT_CURRENCY = TRANSACTION_PROPERTY_SLOTS['debit_currency']
+_CREDIT_ACCOUNT = TRANSACTION_PROPERTY_SLOTS['credit_account']
+_CREDIT_AMOUNT = TRANSACTION_PROPERTY_SLOTS['credit_amount']
+_CREDIT_CURRENCY = TRANSACTION_PROPERTY_SLOTS['credit_currency']
 
-      column_index = term_column_map.get_column_for_term(each_term)
+# Specificity of slots no transformer has set.
+_UNSET = -1
 
-      if column_index is None:
-        logging.info('Cannot find column index for term: {t!r}.'.format(t=each_term))
-        all_pattenrs_matched = False
-          
-      if not all_pattenrs_matched:
-        return False
 
-      column = row[column_index]
+class BeanExtractState(object):
+  """
+  The transaction properties of a row being evaluated, stored at fixed
+  slots and reused across rows.
 
-      raw_pattern = transformer.patterns[each_term]
+  `specificities` keeps the specificity of the transformer owning each slot,
+  and `rules` the rule of it, which is only evaluated once every
+  transformer matching the row has been considered.
+  """
 
-      assert(raw_pattern is not None)
+  __slots__ = ('values', 'specificities', 'rules')
 
-      #substitute terms in raw_pattern
-      if raw_pattern.startswith('r\'') and raw_pattern.endswith('\''):
-        # The raw pattern is decalred itself as a Python regex literal.
-        # Thus compile it directory
-        pattern = re.compile(raw_pattern[2:-1])
-      else:
-        # The raw pattern is not decalred itself as a Python regex literal.
-        # Thus compile it after escaping.
-        pattern = re.compile(re.escape(raw_pattern))
+  def __init__(self):
+    self.values: List[Optional[str]] = [None] * _SLOT_COUNT
+    self.specificities: List[int] = [_UNSET] * _SLOT_COUNT
+    self.rules: List[Optional[CompiledRule]] = [None] * _SLOT_COUNT
 
-      if pattern.match(column) is not None:
-        logging.debug('Pattern {p!r} is matched: {c!r}'.format(p=pattern.pattern, c=column))
-      else:
-        all_pattenrs_matched = False
-        logging.debug('Pattern {p!r} is not matched: {c!r}'.format(p=pattern.pattern, c=column))
-    
-    return all_pattenrs_matched
-  
-  def _make_variables_with_row(self, row: List[str]) -> Dict[str, str]:
-    variables = dict()
-
-    for each_variable_name in self.importer.variable_map:
-      each_column = self.importer.variable_map[each_variable_name]
-      column_index: Optional[int] = None
-      for (index, column_content) in enumerate(self.header):
-        if column_content == each_column:
-          column_index = index
-          break
-      assert(column_index != None)
-      variables[each_variable_name] = row[column_index]
-    
-    return variables
+  def get(self, key: str) -> Optional[str]:
+    return self.values[TRANSACTION_PROPERTY_SLOTS[key]]
+
+
+class BeanExtractContext(object):
 
+  """
+  Evaluates rows with a ruleset. The ruleset may be shared, while the state
+  of the row being evaluated belongs to the context, so threads evaluating
+  rows at the same time each use their own context.
+  """
+
+  __slots__ = ('flag', 'importer', 'header', 'ruleset', 'state', '_prototype_specificities')
+
+  def __init__(self, flag: str, importer: Importer, header: List[str], ruleset: Optional[BeanExtractRuleset] = None):
+    self.flag = flag
+    self.importer = importer
+    self.header = header
+    self.ruleset = ruleset if ruleset is not None else BeanExtractRuleset.make(importer, header)
+    self.state = BeanExtractState()
+
+    # Rows start from the values of transformers without patterns.
+    self._prototype_specificities: List[int] = [0 if v is not None else _UNSET for v in self.ruleset.prototype_slot_values]
+
+  def get_value(self, key: str) -> Optional[str]:
+    """
+    Returns the transaction property of the row evaluated last.
+    """
+    assert(key in TRANSACTION_PROPERTY_KEYS)
+    return self.state.get(key)
+
+  def _cleanup(self):
+    state = self.state
+    state.values[:] = self.ruleset.prototype_slot_values
+    state.specificities[:] = self._prototype_specificities
+    rules = state.rules
+    for i in range(_SLOT_COUNT):
+      rules[i] = None
+  
   @staticmethod
   def _make_row_description(row: List[str]) -> str:
     return '| {} |'.format(' | '.join([column for column in row]))
   
-  def _validate(self, row: List[str]):
-    for each_required_key in REQUIRED_TRANSACTION_PROPERTY_KEYS:
-      if each_required_key not in self._dynamic_records:
+  @staticmethod
+  def _validate(values: List[Optional[str]], row: List[str]):
+    for (each_required_key, slot) in _REQUIRED_SLOTS:
+      if values[slot] is None:
         logging.info('Required key {key} is missing for row: {row}'.format(key=each_required_key, row=BeanExtractContext._make_row_description(row)))
         return False
     
-    is_transaction_complete = self.complete
+    is_transaction_complete = values[_COMPLETE]
 
     if is_transaction_complete is None:
       logging.fatal('Transaction completion info is not found for row: {}'.format(BeanExtractContext._make_row_description(row)))
       return False
 
-    if self.debit_account is None or self.debit_amount is None:
+    if values[_DEBIT_ACCOUNT] is None or values[_DEBIT_AMOUNT] is None:
       logging.info('Debit posting is missing for row: {}'.format(BeanExtractContext._make_row_description(row)))
 
-    if self.credit_account is None or self.credit_amount is None:
+    if values[_CREDIT_ACCOUNT] is None or values[_CREDIT_AMOUNT] is None:
       logging.info('Credit posting is missing for row: {}'.format(BeanExtractContext._make_row_description(row)))
 
-    if not distutils.util.strtobool(is_transaction_complete):
+    if not _strtobool(is_transaction_complete):
       logging.info('Transaction is not complete for row: {}'.format(BeanExtractContext._make_row_description(row)))
       return False
     
@@ -208,45 +140,73 @@ class BeanExtractContext(object):
     # Clean up reults of previous evaluation.
     self._cleanup()
 
-    variable_column_map = _VariableColumnMap(self.importer.variable_map, self.header)
+    state = self.state
+    values = state.values
+    specificities = state.specificities
+    rules = state.rules
 
-    variables = self._make_variables_with_row(row)
+    # Decide the transformer winning each key before evaluating any rule: a
+    # transformer overrides a key only with more patterns than the previous
+    # one. Prototype values come from transformers without patterns.
+    for (slot, evaluate) in self.ruleset.unconditional_rule_slots:
+      rules[slot] = evaluate
+      specificities[slot] = 0
 
-    for each_transformer in self.importer.transformers:
-      self._push_transformer(each_transformer)
-      if self._should_apply(each_transformer, row, variable_column_map):
-        self._apply(each_transformer, variables)
-      self._pop_transformer()
-    
-    if not self._validate(row):
+    for each_plan in self.ruleset.dispatcher.get_matching_plans(row):
+      specificity = each_plan.specificity
+      for (slot, evaluate) in each_plan.rule_slots:
+        if specificity > specificities[slot]:
+          specificities[slot] = specificity
+          rules[slot] = evaluate
+
+    for slot in range(_SLOT_COUNT):
+      evaluate = rules[slot]
+      if evaluate is not None:
+        values[slot] = evaluate(row)
+
+    return BeanExtractContext.make_transaction(values, row, flags, self.ruleset.timestamp_parser, self.ruleset.fingerprint_row(row))
+
+  @staticmethod
+  def make_transaction(values: List[Optional[str]], row: List[str], flags: str, timestamp_parser: TimestampParser, fingerprint: Optional[str] = None) -> Optional[data.Transaction]:
+    """
+    Makes the transaction of a row from its evaluated transaction properties,
+    or returns None if they do not make a complete transaction. Timestamps
+    are parsed with the timestamp parser of the ruleset. The row fingerprint
+    is kept in the metadata when given.
+    """
+    if not BeanExtractContext._validate(values, row):
       return None
 
-    date = parse_date_liberally(self.timestamp)
-    time = dateutil.parser.parse(self.timestamp).time()
+    timestamp = timestamp_parser.parse(values[_TIMESTAMP])
+    date = timestamp.date()
+    time = timestamp.time()
 
     meta = data.new_metadata('', 0)
     meta['date'] = date
 
-    if self.time is not None:
+    if values[_TIME] is not None:
       meta['time'] = time
 
+    if fingerprint is not None:
+      meta[FINGERPRINT_META_KEY] = fingerprint
+
     postings: List[data.Posting] = list()
 
-    if self.debit_account and self.debit_amount:
+    if values[_DEBIT_ACCOUNT] and values[_DEBIT_AMOUNT]:
       postings.append(
         data.Posting(
-          self.debit_account, 
-          Amount(to_decimal(self.debit_amount), self.debit_currency), 
+          values[_DEBIT_ACCOUNT], 
+          Amount(to_decimal(values[_DEBIT_AMOUNT]), values[_DEBIT_CURRENCY]), 
           None,
           None,
           None,
           None))
 
-    if self.credit_account and self.credit_amount:
+    if values[_CREDIT_ACCOUNT] and values[_CREDIT_AMOUNT]:
       postings.append(
         data.Posting(
-          self.credit_account, 
-          Amount(to_decimal(self.credit_amount), self.credit_currency), 
+          values[_CREDIT_ACCOUNT], 
+          Amount(to_decimal(values[_CREDIT_AMOUNT]), values[_CREDIT_CURRENCY]), 
           None,
           None,
           None,
@@ -256,8 +216,8 @@ class BeanExtractContext(object):
       meta,
       date,
       flags,
-      self.payee,
-      self.transaction_name,
+      values[_PAYEE],
+      values[_TRANSACTION_NAME],
       set(), # tags
       set(), # links
       postings # postings
@@ -3,102 +3,222 @@
 __copyright__ = "Copyright (C) 2021 WeZZard"
 __license__ = "MIT"
 
-from typing import List, Optional, Union
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
 
 import os
 import datetime
-import chardet
+import threading
 
+from beancount.core import data
 from beancount.ingest import importer
 from beancount.ingest import cache
 
 from BeanPorter.bpcml.BPCML import BPCML, Importer
+from BeanPorter.bpcml.ConfigCache import ConfigCache
 
-from BeanPorter.BeanExtractContext import BeanExtractContext
-
-def _make_converter_with_encoding(encoding: Optional[str]):
-  def contents(filename: str):
-    """A converter that just reads the entire contents of a file.
-
-    Args:
-      num_bytes: The number of bytes to read.
-    Returns:
-      A converter function.
-    """
-    # Attempt to detect the input encoding automatically, using chardet and a
-    # decent amount of input.
-    if encoding is None:
-      with open(filename, 'rb') as infile:
-          rawdata = infile.read()
-      detected = chardet.detect(rawdata)
-      detected_encoding = detected['encoding']
-
-    final_encoding = encoding if encoding is not None else detected_encoding
-
-    with open(filename, encoding=final_encoding) as file:
-      return file.read()
-  return contents
+from BeanPorter.BeanChunkedEvaluation import DEFAULT_CHUNK_SIZE, DEFAULT_JOBS, iter_evaluate_chunks, iter_evaluate_rows
+from BeanPorter.BeanDuplicateIndex import DEFAULT_DUPLICATE_ACTION, DUPLICATE_ACTIONS, BeanDuplicateIndex
+from BeanPorter.BeanExtractRuleset import BeanExtractRuleset
+from BeanPorter.BeanFileDecoder import BeanDecodedContentsCache, BeanEncodingCache, BeanFileHead
+from BeanPorter.BeanImportState import BeanImportStateStore, get_fingerprints
 
+# Yes, only support csv.
+MIMETYPE = 'text/csv'
 
 class BeanExtractImporter(importer.ImporterProtocol):
   
-  def __init__(self, importer: Importer):
+  def __init__(
+    self, 
+    importer: Importer, 
+    contents_cache: Optional[BeanDecodedContentsCache] = None, 
+    state_store: Optional[BeanImportStateStore] = None,
+    duplicate_action: Optional[str] = None,
+    duplicate_index: Optional[BeanDuplicateIndex] = None,
+    max_jobs: Optional[int] = None
+  ):
     assert(isinstance(importer, Importer))
+    if duplicate_action is not None and duplicate_action not in DUPLICATE_ACTIONS:
+      raise AssertionError('Unrecognized duplicate action: {}'.format(duplicate_action))
     self.importer = importer
+    self.contents_cache = contents_cache if contents_cache is not None else BeanDecodedContentsCache()
+    self.state_store = state_store
+    self.duplicate_action = duplicate_action if duplicate_action is not None else DEFAULT_DUPLICATE_ACTION
+    self.duplicate_index = duplicate_index
+    # Caps the processes evaluating the rows of a file, as when files are
+    # extracted on worker processes already.
+    self.max_jobs = max_jobs
+    self._rulesets: Dict[Tuple[str, ...], BeanExtractRuleset] = dict()
+    self._rulesets_lock = threading.Lock()
+    self._duplicate_index: Optional[Tuple[List, BeanDuplicateIndex]] = None
+    self._duplicate_index_lock = threading.Lock()
+    self._file_dates: Dict[str, datetime.date] = dict()
   
   def name(self) -> str:
     return self.importer.name
 
+  def get_ruleset(self, header: List[str]) -> BeanExtractRuleset:
+    """
+    Returns the importer's transformers compiled against the table header.
+    Compiled once per header, even when threads extract files at once.
+    """
+    key = tuple(header)
+    with self._rulesets_lock:
+      ruleset = self._rulesets.get(key)
+      if ruleset is None:
+        ruleset = BeanExtractRuleset.make(self.importer, header)
+        self._rulesets[key] = ruleset
+    return ruleset
+
   def identify(self, file: cache._FileMemo) -> bool:
-    # Yes, only support csv.
-    if file.mimetype() != "text/csv":
+    if self.contents_cache.mimetype(file.name) != MIMETYPE:
       return False
 
-    return self.importer.probe.test(file)
+    if self.importer.probe.test(file):
+      return True
+
+    return self.importer.probe.probes_header() and self.identify_header(self.contents_cache.head(file.name))
+
+  def identify_header(self, head: BeanFileHead) -> bool:
+    """
+    Tells whether the table header in the head of a file has all the
+    columns of the importer's variables.
+    """
+    required_columns = self.importer.get_required_columns()
+    if len(required_columns) == 0:
+      return False
+
+    header = self.importer.find_header_row(head.get_lines(self.importer.encoding))
+    return header is not None and set(required_columns).issubset(header)
   
+  def get_duplicate_index(self, existing_entries: List) -> BeanDuplicateIndex:
+    """
+    Returns the duplicate index of existing entries. Indexed once for the
+    same list of entries.
+    """
+    with self._duplicate_index_lock:
+      if self._duplicate_index is None or self._duplicate_index[0] is not existing_entries:
+        self._duplicate_index = (existing_entries, BeanDuplicateIndex.make(existing_entries))
+      return self._duplicate_index[1]
+
   def extract(self, file: cache._FileMemo, existing_entries: Optional[List]=None) -> List:
-    converter = _make_converter_with_encoding(self.importer.encoding)
-    normalized_file_contents = self.importer.normalize(file.convert(converter))
+    txns = list(self.iter_extract(file))
 
-    entries = list()
+    if self.duplicate_index is not None:
+      txns = self.duplicate_index.apply(txns, self.duplicate_action)
 
-    # Returns empty entries when no real contents
-    if len(normalized_file_contents) <= 1:
-      return entries
+    if existing_entries is not None and len(existing_entries) > 0:
+      txns = self.get_duplicate_index(existing_entries).apply(txns, self.duplicate_action)
 
-    normalized_file_header = normalized_file_contents[0]
-    normalized_file__body = normalized_file_contents[1:]
+    return txns
 
-    extract_context = BeanExtractContext(
-      self.FLAG,
-      self.importer, 
-      normalized_file_header
-    )
+  def iter_extract(self, file: cache._FileMemo) -> Iterator[data.Transaction]:
+    """
+    Extracts transactions from the file as a stream: lines are decoded,
+    stripped, normalized and evaluated one row at a time, so only a bounded
+    window of the file is kept in memory. Importers with more than one job
+    evaluate rows in chunks on worker processes instead.
+
+    With a state store, rows whose fingerprints the importer has extracted
+    before are skipped. The fingerprints of the transactions extracted are
+    not recorded here but by `record_extracted`, once they are written out.
+    Rows whose fingerprints are in the duplicate index are skipped as well
+    when duplicates are dropped. The latest date extracted is kept for
+    `file_date`.
+    """
+    with self.contents_cache.open(file.name, self.importer.encoding) as lines:
+      normalized_rows = self.importer.iter_normalized_rows(lines)
 
-    for each_row in normalized_file__body:
-      txn = extract_context.evaluate(each_row, self.FLAG)
-      if txn is not None:
-        entries.append(txn)
+      normalized_file_header = next(normalized_rows, None)
 
-    return entries
+      # Yields nothing when no real contents
+      if normalized_file_header is None:
+        return
+
+      ruleset = self.get_ruleset(normalized_file_header)
+
+      state_store = self.state_store
+
+      fingerprint_row = ruleset.fingerprint_row
+
+      if state_store is not None:
+        known_fingerprints = state_store.get_fingerprints(self.importer.name)
+        normalized_rows = (r for r in normalized_rows if fingerprint_row(r) not in known_fingerprints)
+
+      if self.duplicate_index is not None and self.duplicate_action == 'drop':
+        duplicate_index = self.duplicate_index
+        normalized_rows = (r for r in normalized_rows if not duplicate_index.has_fingerprint(fingerprint_row(r)))
+
+      jobs = self.get_jobs()
+
+      if jobs > 1:
+        chunk_size = self.importer.chunk_size if self.importer.chunk_size is not None else DEFAULT_CHUNK_SIZE
+        txns = iter_evaluate_chunks(self.importer, normalized_file_header, ruleset, normalized_rows, self.FLAG, jobs, chunk_size)
+      else:
+        txns = iter_evaluate_rows(self.importer, normalized_file_header, ruleset, normalized_rows, self.FLAG)
+
+      latest_date: Optional[datetime.date] = None
+      for each_txn in txns:
+        if latest_date is None or each_txn.date > latest_date:
+          latest_date = each_txn.date
+        yield each_txn
+
+      if latest_date is not None:
+        self._file_dates[os.path.abspath(file.name)] = latest_date
+  
+  def get_jobs(self) -> int:
+    """
+    Returns the number of processes evaluating the rows of a file: the jobs
+    of the importer, at most `max_jobs`.
+    """
+    jobs = self.importer.jobs if self.importer.jobs is not None else DEFAULT_JOBS
+    if self.max_jobs is not None:
+      jobs = min(jobs, self.max_jobs)
+    return jobs
+
+  def record_extracted(self, txns: List[data.Transaction]):
+    """
+    Records the fingerprints of transactions the importer has extracted in
+    the state store, so later extractions skip their rows. Call it once the
+    transactions are written out: rows recorded are never extracted again.
+    """
+    if self.state_store is not None:
+      self.state_store.add_fingerprints(self.importer.name, get_fingerprints(txns))
   
   def file_date(self, file: cache._FileMemo) -> Optional[datetime.date]:
-    pass
+    """
+    Returns the latest date of the transactions last extracted from the file,
+    or None when the importer has not extracted it. The file is not extracted
+    again only to date it.
+    """
+    return self._file_dates.get(os.path.abspath(file.name))
 
   @staticmethod
-  def make_importers(config_files: Optional[Union[str, List[str]]]) -> List['BeanExtractImporter']:
+  def make_importers(
+    config_files: Optional[Union[str, List[str]]], 
+    state_store: Optional[BeanImportStateStore] = None,
+    duplicate_action: Optional[str] = None,
+    duplicate_index: Optional[BeanDuplicateIndex] = None,
+    max_jobs: Optional[int] = None,
+    config_cache: Optional[ConfigCache] = None,
+    encoding_cache: Optional[BeanEncodingCache] = None
+  ) -> List['BeanExtractImporter']:
     """
     Makes importers from .bean_porter_config.yaml and user config files.
 
-    Disabled importers would not be returned.
+    Disabled importers would not be returned. The returned importers share
+    one decoded contents cache recording detected encodings in the encoding
+    cache if any, and the state store and duplicate index if any. With a
+    config cache, config files are compiled once per path and
+    contents. The processes evaluating the rows of a file are capped by
+    `max_jobs`.
 
     """
     module_dir = os.path.dirname(os.path.abspath(__file__))
 
     root_config_file = os.path.join(module_dir, 'bean_porter_config.yaml')
 
-    root_config = BPCML.make_with_serialization_at_path(root_config_file)
+    root_config = BPCML.make_with_serialization_at_path(root_config_file, config_cache)
 
     if root_config is None:
       return list()
@@ -110,7 +230,7 @@ class BeanExtractImporter(importer.ImporterProtocol):
     if isinstance(config_files, list):
       paths.extend(config_files)
 
-    user_config_files = list(filter(lambda x : x is not None, [BPCML.make_with_serialization_at_path(p) for p in paths]))
+    user_config_files = list(filter(lambda x : x is not None, [BPCML.make_with_serialization_at_path(p, config_cache) for p in paths]))
 
     for each_user_config in user_config_files:
       root_config.extend_with_config(each_user_config)
@@ -119,4 +239,6 @@ class BeanExtractImporter(importer.ImporterProtocol):
 
     enabled_importers = filter(lambda i : i.name not in root_config.disabled_importers, root_config.importers)
     
-    return [BeanExtractImporter(i) for i in enabled_importers]
+    contents_cache = BeanDecodedContentsCache(encoding_cache=encoding_cache)
+    
+    return [BeanExtractImporter(i, contents_cache, state_store, duplicate_action, duplicate_index, max_jobs) for i in enabled_importers]
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+__copyright__ = "Copyright (C) 2021 WeZZard"
+__license__ = "MIT"
+
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import types
+
+from BeanPorter.bpcml.BPCML import Importer, Transformer, TRANSACTION_PROPERTY_SLOTS
+from BeanPorter.bpcml.RuleCompiler import CompiledRule, fold_rule
+from BeanPorter.bpcml.TimestampParser import TimestampParser
+
+from BeanPorter.BeanImportState import RowFingerprinter, make_row_fingerprinter
+from BeanPorter.BeanTransformerPlan import BeanHeaderBinding, BeanRowVariables, BeanTransformerPlan
+from BeanPorter.BeanTransformerDispatcher import BeanTransformerDispatcher
+
+
+class BeanExtractRuleset(object):
+  """
+  The transformers of an importer compiled against a table header. Compiled
+  once per importer and header, then shared by every row evaluated. A
+  ruleset is never modified once made, so threads may share it, each
+  evaluating rows with its own state.
+
+  Transformers without patterns apply to every row, and are hoisted out of
+  dispatch: their constant rules are folded into `prototype_values`, which
+  every row starts from, and the rest go to `unconditional_rules`. The
+  other transformers are `dispatched_plans`.
+
+  The timestamps of the rows are parsed with the ruleset's own
+  `timestamp_parser`, which learns the timestamp format of its header only.
+  """
+
+  def __init__(
+    self, 
+    importer: Importer, 
+    header: List[str], 
+    header_binding: BeanHeaderBinding, 
+    transformer_plans: List[BeanTransformerPlan], 
+    dispatched_plans: List[BeanTransformerPlan], 
+    dispatcher: BeanTransformerDispatcher,
+    prototype_values: Dict[str, Tuple[str, Transformer]],
+    unconditional_rules: List[Tuple[str, CompiledRule, Transformer]]
+  ):
+    self.importer = importer
+    self.header: Sequence[str] = tuple(header)
+    self.header_binding = header_binding
+    self.fingerprint_row: RowFingerprinter = make_row_fingerprinter(header_binding)
+    self.timestamp_parser = TimestampParser()
+    self.transformer_plans: Sequence[BeanTransformerPlan] = tuple(transformer_plans)
+    self.dispatched_plans: Sequence[BeanTransformerPlan] = tuple(dispatched_plans)
+    self.dispatcher = dispatcher
+    self.prototype_values: Mapping[str, Tuple[str, Transformer]] = types.MappingProxyType(dict(prototype_values))
+    self.unconditional_rules: Sequence[Tuple[str, CompiledRule, Transformer]] = tuple(unconditional_rules)
+
+    # Prototype values and unconditional rules at the slots of evaluation
+    # states.
+    prototype_slot_values: List[Optional[str]] = [None] * len(TRANSACTION_PROPERTY_SLOTS)
+    for (each_key, (value, _)) in self.prototype_values.items():
+      prototype_slot_values[TRANSACTION_PROPERTY_SLOTS[each_key]] = value
+    self.prototype_slot_values: Sequence[Optional[str]] = tuple(prototype_slot_values)
+    self.unconditional_rule_slots: Sequence[Tuple[int, CompiledRule]] = tuple([(TRANSACTION_PROPERTY_SLOTS[k], e) for (k, e, _) in self.unconditional_rules])
+
+  def make_row_variables(self) -> BeanRowVariables:
+    return BeanRowVariables(self.header_binding)
+
+  @staticmethod
+  def make(importer: Importer, header: List[str]) -> 'BeanExtractRuleset':
+    header_binding = BeanHeaderBinding.make(importer, header)
+
+    transformer_plans = [BeanTransformerPlan.make(i, t, header_binding, importer.evaluator) for (i, t) in enumerate(importer.transformers)]
+
+    prototype_values: Dict[str, Tuple[str, Transformer]] = dict()
+    unconditional_rules: List[Tuple[str, CompiledRule, Transformer]] = list()
+
+    if importer.evaluator == 'interpreter':
+      # Keep the interpreter a plain reference of the transformers.
+      dispatched_plans = transformer_plans
+    else:
+      dispatched_plans = list()
+      for each_plan in transformer_plans:
+        if each_plan.can_match() and len(each_plan.column_patterns) == 0:
+          BeanExtractRuleset._hoist_unconditional_plan(each_plan, prototype_values, unconditional_rules)
+        else:
+          dispatched_plans.append(each_plan)
+
+    dispatcher = BeanTransformerDispatcher.make(dispatched_plans, importer.matcher)
+
+    return BeanExtractRuleset(importer, header, header_binding, transformer_plans, dispatched_plans, dispatcher, prototype_values, unconditional_rules)
+
+  @staticmethod
+  def _hoist_unconditional_plan(
+    plan: BeanTransformerPlan, 
+    prototype_values: Dict[str, Tuple[str, Transformer]], 
+    unconditional_rules: List[Tuple[str, CompiledRule, Transformer]]
+  ):
+    """
+    Transformers without patterns never override each other, so the first one
+    defining a key wins. Transformers with patterns override them all.
+    """
+    defined_keys = set(prototype_values).union([k for (k, _, _) in unconditional_rules])
+
+    for (each_key, evaluate) in plan.rule_evaluators.items():
+      if each_key in defined_keys:
+        continue
+      value = fold_rule(plan.transformer.rules[each_key])
+      if value is not None:
+        prototype_values[each_key] = (value, plan.transformer)
+      else:
+        unconditional_rules.append((each_key, evaluate, plan.transformer))
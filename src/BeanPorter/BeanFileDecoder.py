@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+
+__copyright__ = "Copyright (C) 2021 WeZZard"
+__license__ = "MIT"
+
+from typing import ContextManager, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import os
+import json
+import codecs
+import contextlib
+import collections
+import hashlib
+import logging
+import tempfile
+import threading
+
+from BeanPorter.BeanCache import get_cache_path
+
+# Maximum number of bytes to read in order to detect the encoding of a file.
+HEAD_DETECT_MAX_BYTES = 128 * 1024
+
+# Maximum number of bytes to read in order to find the table header of a
+# file.
+HEAD_PROBE_MAX_BYTES = 8 * 1024
+
+# Number of bytes read at a time while hashing a file.
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+_ENCODING_CACHE_NAME = 'detected_encodings.json'
+
+# Maximum number of detection results kept in the encoding cache. The
+# earliest results are dropped first.
+_ENCODING_CACHE_CAPACITY = 4096
+
+# A sample may only show the part of the file which the detected encoding
+# shares with a wider one, e.g. an ASCII-only head of an UTF-8 file. Decoding
+# with the wider encoding gives the same results for the sample and tolerates
+# the rest of the file.
+_ENCODING_SUPERSETS: Dict[str, str] = {
+  'ascii': 'utf-8',
+  'gb2312': 'gb18030',
+  'gbk': 'gb18030',
+}
+
+# Encodings tried in order when a line cannot be decoded with the detected
+# encoding.
+_FALLBACK_ENCODINGS: List[str] = ['utf-8', 'gb18030']
+
+# Files larger than this are streamed from disk every time instead of being
+# kept decoded in a contents cache. Files are not kept by default, so memory
+# stays bounded however large bills are.
+DEFAULT_MAX_CACHED_FILE_SIZE = 0
+
+# Total size of files a contents cache keeps decoded. The least recently used
+# files are dropped first.
+DEFAULT_CONTENTS_CACHE_CAPACITY = 0
+
+# Number of file heads a contents cache keeps. The least recently used heads
+# are dropped first.
+_HEAD_CACHE_CAPACITY = 64
+
+# Encodings whose line breaks are not the b'\n' byte.
+_NON_ASCII_COMPATIBLE_ENCODING_PREFIXES: List[str] = ['utf-16', 'utf-32']
+
+
+def _normalize_encoding(encoding: str) -> str:
+  name = codecs.lookup(encoding).name
+  return _ENCODING_SUPERSETS.get(name, name)
+
+
+def hash_file(filename: str) -> str:
+  """
+  Hashes the contents of a file without reading it into memory at once.
+  """
+  hasher = hashlib.sha256()
+  with open(filename, 'rb') as infile:
+    for chunk in iter(lambda: infile.read(_HASH_CHUNK_SIZE), b''):
+      hasher.update(chunk)
+  return hasher.hexdigest()
+
+
+class BeanEncodingCache(object):
+  """
+  A persistent map from file content hashes to the encodings the files were
+  decoded with. A cache sent to a worker process loads the file afresh.
+  """
+
+  def __init__(self, path: str):
+    self.path = path
+    self._encodings: Optional[Dict[str, str]] = None
+    self._lock = threading.Lock()
+
+  def __getstate__(self) -> Dict[str, str]:
+    return {'path': self.path}
+
+  def __setstate__(self, state: Dict[str, str]):
+    self.__init__(state['path'])
+
+  @staticmethod
+  def make_default() -> Optional['BeanEncodingCache']:
+    """
+    Makes the encoding cache in the default cache directory. Returns None when
+    persistent caches are disabled.
+    """
+    path = get_cache_path(_ENCODING_CACHE_NAME)
+    if path is None:
+      return None
+    return BeanEncodingCache(path)
+
+  def _load(self) -> Dict[str, str]:
+    try:
+      with open(self.path, 'r', encoding='utf-8') as cache_file:
+        encodings = json.load(cache_file)
+    except (OSError, ValueError):
+      return dict()
+    if not isinstance(encodings, dict):
+      return dict()
+    return encodings
+
+  def get(self, content_hash: str) -> Optional[str]:
+    with self._lock:
+      if self._encodings is None:
+        self._encodings = self._load()
+      return self._encodings.get(content_hash)
+
+  def set(self, content_hash: str, encoding: str):
+    with self._lock:
+      self._set(content_hash, encoding)
+
+  def _set(self, content_hash: str, encoding: str):
+    if self._encodings is None:
+      self._encodings = self._load()
+
+    if self._encodings.get(content_hash) == encoding:
+      return
+
+    # Merges with results recorded by other processes in the meantime.
+    encodings = self._load()
+    encodings.update(self._encodings)
+    encodings.pop(content_hash, None)
+    encodings[content_hash] = encoding
+    while len(encodings) > _ENCODING_CACHE_CAPACITY:
+      encodings.pop(next(iter(encodings)))
+    self._encodings = encodings
+
+    try:
+      (fd, temp_path) = tempfile.mkstemp(dir=os.path.dirname(self.path))
+      with os.fdopen(fd, 'w', encoding='utf-8') as temp_file:
+        json.dump(encodings, temp_file)
+      os.replace(temp_path, self.path)
+    except OSError as error:
+      logging.debug('Cannot write encoding cache at {p}: {e}'.format(p=self.path, e=error))
+
+
+def _detect_sample_encoding(sample: bytes) -> str:
+  # Loaded on demand: files of importers with an encoding need no detection.
+  import chardet
+
+  detected_encoding = chardet.detect(sample)['encoding']
+
+  if detected_encoding is None:
+    detected_encoding = _FALLBACK_ENCODINGS[0]
+
+  return _normalize_encoding(detected_encoding)
+
+
+def detect_encoding(filename: str, encoding_cache: Optional[BeanEncodingCache] = None) -> Tuple[str, Optional[str]]:
+  """
+  Detects the encoding of a file from a bounded sample of its head.
+
+  Returns the encoding and the content hash of the file. The content hash is
+  None when no encoding cache is used.
+  """
+  (encoding, content_hash, _) = _detect_encoding(filename, encoding_cache)
+  return (encoding, content_hash)
+
+
+def _detect_encoding(filename: str, encoding_cache: Optional[BeanEncodingCache]) -> Tuple[str, Optional[str], Optional[bytes]]:
+  # Also returns the sample the encoding is detected from, which is None when
+  # the encoding is found in the encoding cache.
+  content_hash: Optional[str] = None
+
+  if encoding_cache is not None:
+    content_hash = hash_file(filename)
+    cached_encoding = encoding_cache.get(content_hash)
+    if cached_encoding is not None:
+      return (cached_encoding, content_hash, None)
+
+  with open(filename, 'rb') as infile:
+    sample = infile.read(HEAD_DETECT_MAX_BYTES)
+
+  encoding = _detect_sample_encoding(sample)
+
+  if encoding_cache is not None:
+    encoding_cache.set(content_hash, encoding)
+
+  return (encoding, content_hash, sample)
+
+
+class BeanDecodedFile(object):
+  """
+  Decoded lines of a file, read and decoded incrementally.
+
+  When fallback encodings are given, the whole file is checked before any
+  line is yielded. A file the encoding cannot decode is decoded with the
+  first fallback encoding that decodes all of it, or with undecodable bytes
+  replaced when none does. Every line of a file is decoded with one codec,
+  the same on every run.
+
+  An encoding trusted to decode the file is not checked first. A line it
+  cannot decode switches the rest of the file to the encoding the whole file
+  would be decoded with.
+  """
+
+  def __init__(self, filename: str, encoding: str, fallback_encodings: Optional[List[str]] = None, is_trusted: bool = False):
+    self.filename = filename
+    self.encoding = encoding
+    self.fallback_encodings = fallback_encodings if fallback_encodings is not None else list()
+    self.is_trusted = is_trusted
+    self.errors = 'strict'
+    self._file = None
+    # The whole contents of the file when read already, to check encodings
+    # without reading the file again.
+    self._contents: Optional[bytes] = None
+
+  def __enter__(self) -> 'BeanDecodedFile':
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def close(self):
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+
+  def __iter__(self) -> Iterator[str]:
+    codec_name = codecs.lookup(self.encoding).name
+    is_ascii_compatible = not any(codec_name.startswith(p) for p in _NON_ASCII_COMPATIBLE_ENCODING_PREFIXES)
+
+    # Files not split into lines by bytes cannot fall back line by line.
+    if len(self.fallback_encodings) > 0 and not (self.is_trusted and is_ascii_compatible):
+      (self.encoding, self.errors) = self._choose_encoding()
+      codec_name = codecs.lookup(self.encoding).name
+      is_ascii_compatible = not any(codec_name.startswith(p) for p in _NON_ASCII_COMPATIBLE_ENCODING_PREFIXES)
+
+    if not is_ascii_compatible:
+      self._file = open(self.filename, encoding=self.encoding, errors=self.errors)
+      yield from self._file
+      return
+
+    self._file = open(self.filename, 'rb')
+    decoder = codecs.getincrementaldecoder(self.encoding)(errors=self.errors)
+
+    for raw_line in self._file:
+      try:
+        line = decoder.decode(raw_line)
+      except UnicodeDecodeError as error:
+        if len(self.fallback_encodings) == 0:
+          raise
+        (decoder, line) = self._fall_back(raw_line, error)
+      yield line.replace('\r\n', '\n')
+
+    line = decoder.decode(b'', final=True)
+    if len(line) > 0:
+      yield line
+
+  def _fall_back(self, raw_line: bytes, error: UnicodeDecodeError) -> Tuple[codecs.IncrementalDecoder, str]:
+    (self.encoding, self.errors) = self._choose_encoding(error)
+    decoder = codecs.getincrementaldecoder(self.encoding)(errors=self.errors)
+    return (decoder, decoder.decode(raw_line))
+
+  def _find_decode_error(self, encoding: str) -> Optional[UnicodeDecodeError]:
+    decoder = codecs.getincrementaldecoder(encoding)()
+    try:
+      if self._contents is not None:
+        decoder.decode(self._contents, final=True)
+        return None
+      with open(self.filename, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(_HASH_CHUNK_SIZE), b''):
+          decoder.decode(chunk)
+      decoder.decode(b'', final=True)
+    except UnicodeDecodeError as error:
+      return error
+    return None
+
+  def _choose_encoding(self, error: Optional[UnicodeDecodeError] = None) -> Tuple[str, str]:
+    # The error is given when the encoding is known not to decode the file.
+    if error is None:
+      error = self._find_decode_error(self.encoding)
+    if error is None:
+      return (self.encoding, 'strict')
+
+    for each_encoding in self.fallback_encodings:
+      if codecs.lookup(each_encoding).name == codecs.lookup(self.encoding).name:
+        continue
+      if self._find_decode_error(each_encoding) is None:
+        logging.warning('Cannot decode {f} with {e1}: {err}. Falls back to {e2}.'.format(f=self.filename, e1=self.encoding, err=error, e2=each_encoding))
+        return (each_encoding, 'strict')
+
+    logging.warning('Cannot decode {f} with {e}: {err}. Undecodable bytes are replaced.'.format(f=self.filename, e=self.encoding, err=error))
+    return (self.encoding, 'replace')
+
+
+class _DetectedDecodedFile(BeanDecodedFile):
+  """
+  Decoded lines of a file whose encoding was detected.
+
+  An encoding detected from a sample is checked against the whole file
+  first, in memory when the sample is the whole file. An encoding found in
+  the encoding cache is trusted, as it is recorded for the same contents.
+  The encoding fallen back to is recorded once the whole file is decoded, so
+  later runs start from it.
+  """
+
+  def __init__(self, filename: str, encoding: str, content_hash: Optional[str], encoding_cache: Optional[BeanEncodingCache], sample: Optional[bytes]):
+    super().__init__(filename, encoding, _FALLBACK_ENCODINGS, is_trusted=sample is None)
+    if sample is not None and len(sample) < HEAD_DETECT_MAX_BYTES:
+      self._contents = sample
+    self.detected_encoding = encoding
+    self.content_hash = content_hash
+    self.encoding_cache = encoding_cache
+
+  def __iter__(self) -> Iterator[str]:
+    yield from super().__iter__()
+    if self.encoding_cache is not None and self.encoding != self.detected_encoding:
+      self.encoding_cache.set(self.content_hash, self.encoding)
+
+
+def open_decoded(filename: str, encoding: Optional[str], encoding_cache: Optional[BeanEncodingCache] = None) -> BeanDecodedFile:
+  """
+  Opens a file as a stream of decoded lines. The encoding is detected when it
+  is not specified, with results cached by file content in `encoding_cache`.
+  """
+  if encoding is not None:
+    return BeanDecodedFile(filename, encoding)
+
+  (detected_encoding, content_hash, sample) = _detect_encoding(filename, encoding_cache)
+
+  return _DetectedDecodedFile(filename, detected_encoding, content_hash, encoding_cache, sample)
+
+
+class BeanFileHead(object):
+  """
+  The first bytes of a file, read once and decoded into complete lines once
+  per encoding. The encoding is detected from the head itself when it is not
+  specified. Undecodable bytes are replaced.
+  """
+
+  def __init__(self, filename: str, max_bytes: int = HEAD_PROBE_MAX_BYTES):
+    self.filename = filename
+    with open(filename, 'rb') as infile:
+      head = infile.read(max_bytes + 1)
+    self.is_truncated = len(head) > max_bytes
+    self.head = head[:max_bytes]
+    self._lines: Dict[Optional[str], List[str]] = dict()
+
+  def get_lines(self, encoding: Optional[str]) -> List[str]:
+    lines = self._lines.get(encoding)
+    if lines is None:
+      lines = self._decode(encoding)
+      self._lines[encoding] = lines
+    return lines
+
+  def _decode(self, encoding: Optional[str]) -> List[str]:
+    if encoding is None:
+      encoding = _detect_sample_encoding(self.head)
+
+    lines = self.head.decode(encoding, errors='replace').replace('\r\n', '\n').split('\n')
+
+    # The last line of a truncated head may be cut.
+    if self.is_truncated or len(lines[-1]) == 0:
+      lines.pop()
+
+    return [l + '\n' for l in lines]
+
+
+class BeanDecodedContentsCache(object):
+  """
+  A per-run cache of file contents shared by importers.
+
+  The MIME types and heads of files are kept, so importers identifying a file
+  share one guess and one bounded read of it. Decoded contents are streamed
+  from disk on each read by default. Given a `max_cached_file_size` and a
+  `capacity`, files up to that size are kept decoded instead, keyed by path,
+  modification time and encoding, so each is read and decoded at most once
+  however many importers extract it.
+
+  Detected encodings are recorded in `encoding_cache` when given. A contents
+  cache may be shared by threads.
+  """
+
+  def __init__(
+    self,
+    max_cached_file_size: int = DEFAULT_MAX_CACHED_FILE_SIZE,
+    capacity: int = DEFAULT_CONTENTS_CACHE_CAPACITY,
+    encoding_cache: Optional[BeanEncodingCache] = None
+  ):
+    self.max_cached_file_size = max_cached_file_size
+    self.capacity = capacity
+    self.encoding_cache = encoding_cache
+    self._lock = threading.RLock()
+    self._contents: 'collections.OrderedDict[Tuple[str, int, Optional[str]], Tuple[List[str], int]]' = collections.OrderedDict()
+    self._contents_size = 0
+    self._mimetypes: Dict[Tuple[str, int], str] = dict()
+    self._heads: 'collections.OrderedDict[Tuple[str, int], BeanFileHead]' = collections.OrderedDict()
+
+  @staticmethod
+  def _stat(filename: str) -> Tuple[str, int, int]:
+    path = os.path.abspath(filename)
+    stat = os.stat(path)
+    return (path, stat.st_mtime_ns, stat.st_size)
+
+  def _open_decoded(self, path: str, encoding: Optional[str]) -> BeanDecodedFile:
+    return open_decoded(path, encoding, self.encoding_cache)
+
+  def mimetype(self, filename: str) -> str:
+    (path, mtime, _) = BeanDecodedContentsCache._stat(filename)
+    key = (path, mtime)
+    with self._lock:
+      mimetype = self._mimetypes.get(key)
+    if mimetype is None:
+      from beancount.utils import file_type
+      mimetype = file_type.guess_file_type(path)
+      with self._lock:
+        self._mimetypes[key] = mimetype
+    return mimetype
+
+  def head(self, filename: str) -> BeanFileHead:
+    """
+    Returns the head of a file, read once while the file is unchanged.
+    """
+    (path, mtime, _) = BeanDecodedContentsCache._stat(filename)
+    key = (path, mtime)
+    with self._lock:
+      head = self._heads.get(key)
+      if head is not None:
+        self._heads.move_to_end(key)
+        return head
+
+    head = BeanFileHead(path)
+
+    with self._lock:
+      self._heads[key] = head
+      while len(self._heads) > _HEAD_CACHE_CAPACITY:
+        self._heads.popitem(last=False)
+    return head
+
+  def open(self, filename: str, encoding: Optional[str]) -> ContextManager[Iterable[str]]:
+    """
+    Opens a file as decoded lines, from the cache when possible.
+    """
+    (path, mtime, size) = BeanDecodedContentsCache._stat(filename)
+    key = (path, mtime, encoding)
+
+    with self._lock:
+      cached = self._contents.get(key)
+      if cached is not None:
+        self._contents.move_to_end(key)
+        return contextlib.nullcontext(cached[0])
+
+    if size > self.max_cached_file_size or size > self.capacity:
+      return self._open_decoded(path, encoding)
+
+    # Files are decoded outside the lock. Threads opening the same file at
+    # once may both decode it, and the first result is kept.
+    with self._open_decoded(path, encoding) as decoded_file:
+      lines = list(decoded_file)
+
+    with self._lock:
+      cached = self._contents.get(key)
+      if cached is not None:
+        return contextlib.nullcontext(cached[0])
+
+      self._contents[key] = (lines, size)
+      self._contents_size += size
+      while self._contents_size > self.capacity:
+        (_, (_, evicted_size)) = self._contents.popitem(last=False)
+        self._contents_size -= evicted_size
+
+    return contextlib.nullcontext(lines)
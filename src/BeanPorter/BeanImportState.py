@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+__copyright__ = "Copyright (C) 2021 WeZZard"
+__license__ = "MIT"
+
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator, List, Set
+
+import contextlib
+import hashlib
+import sqlite3
+
+if TYPE_CHECKING:
+  from BeanPorter.BeanTransformerPlan import BeanHeaderBinding
+
+# The variable whose cell identifies a row in the system exporting bills.
+FINGERPRINT_VARIABLE_NAME = 'system_transaction_id'
+
+# The metadata key transactions carry their row fingerprints with.
+FINGERPRINT_META_KEY = 'fingerprint'
+
+# Separates cells of a row when hashing it. Never found in csv cells.
+_CELL_SEPARATOR = '\x1f'
+
+# Seconds to wait for another process writing the state store.
+_STORE_TIMEOUT = 30
+
+# Tells a row fingerprint stable across exports of the same row.
+RowFingerprinter = Callable[[List[str]], str]
+
+
+def hash_row(row: List[str]) -> str:
+  """
+  Hashes the stripped cells of a row.
+  """
+  return hashlib.sha1(_CELL_SEPARATOR.join(row).encode('utf-8')).hexdigest()
+
+
+def make_row_fingerprinter(header_binding: 'BeanHeaderBinding') -> RowFingerprinter:
+  """
+  Makes a function fingerprinting rows: the system transaction id when the
+  importer maps one to a column and the row has it, otherwise the hash of
+  the row.
+  """
+  column_index = header_binding.variable_columns.get(FINGERPRINT_VARIABLE_NAME)
+
+  if column_index is None:
+    return hash_row
+
+  def fingerprint_row(row: List[str]) -> str:
+    transaction_id = row[column_index]
+    if len(transaction_id) > 0:
+      return transaction_id
+    return hash_row(row)
+
+  return fingerprint_row
+
+
+def get_fingerprints(entries: Iterable[Any]) -> List[str]:
+  """
+  Returns the row fingerprints extracted entries carry in their metadata.
+  """
+  return [e.meta[FINGERPRINT_META_KEY] for e in entries if e.meta is not None and FINGERPRINT_META_KEY in e.meta]
+
+
+class BeanImportStateStore(object):
+  """
+  A SQLite database of the row fingerprints each importer has extracted.
+
+  Rows already extracted are skipped before any transformer runs, so
+  re-importing overlapping bills only yields new transactions. A connection
+  is opened per operation, so a store may be shared by threads and sent to
+  worker processes.
+  """
+
+  def __init__(self, path: str):
+    self.path = path
+    with self._connect() as connection:
+      connection.execute('CREATE TABLE IF NOT EXISTS fingerprints (importer TEXT NOT NULL, fingerprint TEXT NOT NULL, PRIMARY KEY (importer, fingerprint)) WITHOUT ROWID')
+
+  @contextlib.contextmanager
+  def _connect(self) -> Iterator[sqlite3.Connection]:
+    # Commits on success and rolls back on failure.
+    connection = sqlite3.connect(self.path, timeout=_STORE_TIMEOUT)
+    try:
+      with connection:
+        yield connection
+    finally:
+      connection.close()
+
+  def get_fingerprints(self, importer_name: str) -> Set[str]:
+    with self._connect() as connection:
+      return set([f for (f,) in connection.execute('SELECT fingerprint FROM fingerprints WHERE importer = ?', (importer_name,))])
+
+  def add_fingerprints(self, importer_name: str, fingerprints: Iterable[str]):
+    with self._connect() as connection:
+      connection.executemany('INSERT OR IGNORE INTO fingerprints (importer, fingerprint) VALUES (?, ?)', [(importer_name, f) for f in fingerprints])
+
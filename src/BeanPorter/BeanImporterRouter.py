@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+__copyright__ = "Copyright (C) 2021 WeZZard"
+__license__ = "MIT"
+
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import collections
+import logging
+import os
+import re
+
+from BeanPorter.BeanExtractImporter import MIMETYPE, BeanExtractImporter
+
+
+class _Trie(object):
+  """
+  A character trie finding the keys a string starts with.
+  """
+
+  # Key of the values of a node. Never a character.
+  _VALUES = None
+
+  def __init__(self):
+    self.root: Dict[Any, Any] = dict()
+
+  def add(self, key: str, value: int):
+    node = self.root
+    for each_char in key:
+      node = node.setdefault(each_char, dict())
+    node.setdefault(_Trie._VALUES, list()).append(value)
+
+  def iter_values(self, string: str) -> Iterator[int]:
+    """
+    Yields the values of the keys the string starts with.
+    """
+    node = self.root
+    yield from node.get(_Trie._VALUES, ())
+    for each_char in string:
+      node = node.get(each_char)
+      if node is None:
+        return
+      yield from node.get(_Trie._VALUES, ())
+
+
+class BeanImporterRouter(object):
+  """
+  Finds the importers identifying a file in one lookup of its name, instead
+  of asking every importer in turn.
+
+  File name probes are indexed by kind: prefixes of the last path component
+  in a trie, suffixes of the file name in a trie of reversed suffixes, and
+  patterns in one regex with a lookahead group per pattern. Importers
+  probing neither file names nor headers are candidates for every file. The
+  MIME type of a file is only guessed when it has candidates, once for all
+  of them.
+
+  Importers probing table headers are indexed by the columns their headers
+  must have. Files their names do not route to them are routed by one
+  bounded read of their heads, with each header row counted against the
+  index once.
+  """
+
+  def __init__(self, importers: List[BeanExtractImporter]):
+    self.importers = importers
+    self._unconditional_indices: List[int] = list()
+    self._prefix_trie = _Trie()
+    self._suffix_trie = _Trie()
+    self._pattern_indices: List[int] = list()
+    self._pattern: Optional[re.Pattern] = None
+    self._header_indices: List[int] = list()
+    self._column_indices: Dict[str, List[int]] = dict()
+    self._column_counts: Dict[int, int] = dict()
+
+    patterns: List[str] = list()
+
+    for (index, each_importer) in enumerate(importers):
+      probe = each_importer.importer.probe
+
+      if probe.probes_header():
+        required_columns = each_importer.importer.get_required_columns()
+        # Headers without required columns tell nothing.
+        if len(required_columns) > 0:
+          self._header_indices.append(index)
+          self._column_counts[index] = len(required_columns)
+          for each_column in required_columns:
+            self._column_indices.setdefault(each_column, list()).append(index)
+
+      file_name_probe = probe.get_file_name_probe()
+      if file_name_probe is None:
+        if not probe.probes_header():
+          self._unconditional_indices.append(index)
+        continue
+      kind = file_name_probe.kind()
+      if kind == 'prefix':
+        self._prefix_trie.add(file_name_probe.prefix, index)
+      elif kind == 'suffix':
+        self._suffix_trie.add(file_name_probe.suffix[::-1], index)
+      elif kind == 'pattern':
+        # Group names tell which patterns match; patterns match from the
+        # start of the file name as each probe does.
+        patterns.append('(?:(?={p})(?P<p{i}>))?'.format(p=file_name_probe.pattern.pattern, i=len(patterns)))
+        self._pattern_indices.append(index)
+      else:
+        raise AssertionError('Unrecognized file name probe kind: {}'.format(kind))
+
+    if len(patterns) > 0:
+      self._pattern = re.compile(''.join(patterns))
+
+  def get_candidates(self, filename: str) -> List[BeanExtractImporter]:
+    """
+    Returns the importers whose probes accept the file name, in the order of
+    the importers.
+    """
+    return [self.importers[i] for i in sorted(self._get_candidate_indices(filename))]
+
+  def _get_candidate_indices(self, filename: str) -> Set[int]:
+    indices = list(self._unconditional_indices)
+
+    last_component = os.path.basename(os.path.normpath(filename))
+    indices.extend(self._prefix_trie.iter_values(last_component))
+    indices.extend(self._suffix_trie.iter_values(filename[::-1]))
+
+    if self._pattern is not None:
+      # Always matches, as every group is optional.
+      match = self._pattern.match(filename)
+      for (i, each_index) in enumerate(self._pattern_indices):
+        if match.group('p{}'.format(i)) is not None:
+          indices.append(each_index)
+
+    return set(indices)
+
+  def identify(self, filename: str) -> List[BeanExtractImporter]:
+    """
+    Returns the importers identifying the file, as asking each importer
+    would.
+    """
+    indices = self._get_candidate_indices(filename)
+    header_indices = [i for i in self._header_indices if i not in indices]
+    if len(indices) == 0 and len(header_indices) == 0:
+      return list()
+
+    try:
+      mimetype = self.importers[0].contents_cache.mimetype(filename)
+    except Exception as exc:
+      logging.exception("Cannot guess the MIME type of %s: %s", filename, exc)
+      return list()
+
+    if mimetype != MIMETYPE:
+      return list()
+
+    if len(header_indices) > 0:
+      indices.update(self._identify_headers(filename, header_indices))
+
+    return [self.importers[i] for i in sorted(indices)]
+
+  def _identify_headers(self, filename: str, header_indices: List[int]) -> List[int]:
+    try:
+      head = self.importers[0].contents_cache.head(filename)
+    except OSError as exc:
+      logging.warning('Cannot read the head of {f}: {e}'.format(f=filename, e=exc))
+      return list()
+
+    # Importers finding the same header row share its count.
+    header_rows: Dict[Tuple[str, ...], List[int]] = dict()
+    for each_index in header_indices:
+      importer = self.importers[each_index].importer
+      # An importer failing to probe a file must not keep others from it, as
+      # beancount isolates the identification of each importer.
+      try:
+        header = importer.find_header_row(head.get_lines(importer.encoding))
+      except Exception as exc:
+        logging.exception("Importer %s cannot probe the header of %s: %s", importer.name, filename, exc)
+        continue
+      if header is not None:
+        header_rows.setdefault(tuple(header), list()).append(each_index)
+
+    identified_indices: List[int] = list()
+
+    for (header, indices) in header_rows.items():
+      column_counts: Dict[int, int] = collections.Counter()
+      for each_column in set(header):
+        column_counts.update(self._column_indices.get(each_column, ()))
+      identified_indices.extend([i for i in indices if column_counts[i] == self._column_counts[i]])
+
+    return identified_indices
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+
+__copyright__ = "Copyright (C) 2021 WeZZard"
+__license__ = "MIT"
+
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+import contextlib
+import datetime
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+
+from decimal import Decimal, InvalidOperation
+
+from beancount.core.number import D
+
+from BeanPorter.BeanCache import get_cache_path
+from BeanPorter.BeanDuplicateIndex import BeanDuplicateIndex, PostingUnits, iter_keys
+from BeanPorter.BeanImportState import FINGERPRINT_META_KEY
+
+_LEDGER_INDEX_NAME = 'ledger_index.sqlite3'
+
+# Version of the index tables. Indexes of other versions are dropped.
+_INDEX_VERSION = 2
+
+# Number of bytes read at a time while hashing the indexed part of a file.
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+# Seconds to wait for another process writing the index.
+_INDEX_TIMEOUT = 30
+
+_STRING = r'"((?:[^"\\]|\\.)*)"'
+
+_INCLUDE_PATTERN = re.compile(r'include\s+' + _STRING)
+
+_TRANSACTION_PATTERN = re.compile(r'(\d{4}[-/]\d{2}[-/]\d{2})\s+(?:txn|[*!&#?%PSTCURM])(?=\s|$)(?:\s+' + _STRING + r')?(?:\s+' + _STRING + r')?')
+
+_META_PATTERN = re.compile(r'\s+' + FINGERPRINT_META_KEY + r':\s*' + _STRING)
+
+_POSTING_PATTERN = re.compile(r'\s+(?:[*!]\s+)?([A-Z][^\s:]*(?::[^\s:]+)+)\s+([-+]?[\d,]*\.?\d+)\s+([A-Z][A-Z0-9\'._-]*)')
+
+_ESCAPE_PATTERN = re.compile(r'\\(.)')
+
+
+class BeanLedgerTransaction(NamedTuple):
+  """
+  What the index keeps of a ledger transaction.
+  """
+  offset: int
+  date: datetime.date
+  payee: Optional[str]
+  fingerprint: Optional[str]
+  postings: List[PostingUnits]
+
+
+def _unescape(string: str) -> str:
+  return _ESCAPE_PATTERN.sub(r'\1', string)
+
+
+def _parse_date(string: str) -> datetime.date:
+  return datetime.date(int(string[0:4]), int(string[5:7]), int(string[8:10]))
+
+
+def scan_ledger_file(file: BinaryIO, offset: int) -> Tuple[List[BeanLedgerTransaction], List[str]]:
+  """
+  Scans the transactions and includes of a ledger file from a byte offset
+  at the start of a line.
+
+  Only what duplicate checks need is read: dates, payees, fingerprints and
+  postings with explicit amounts. Postings whose amounts are left to be
+  interpolated are not indexed.
+  """
+  transactions: List[BeanLedgerTransaction] = list()
+  includes: List[str] = list()
+  current: Optional[BeanLedgerTransaction] = None
+
+  file.seek(offset)
+
+  for raw_line in file:
+    line_offset = offset
+    offset += len(raw_line)
+    line = raw_line.decode('utf-8', errors='replace').rstrip('\r\n')
+
+    if len(line) == 0 or line[0] == ';':
+      continue
+
+    if not line[0].isspace():
+      current = None
+      match = _TRANSACTION_PATTERN.match(line)
+      if match is not None:
+        (date, first_string, second_string) = match.groups()
+        # A single string is the narration.
+        payee = _unescape(first_string) if second_string is not None else None
+        current = BeanLedgerTransaction(line_offset, _parse_date(date), payee, None, list())
+        transactions.append(current)
+        continue
+      match = _INCLUDE_PATTERN.match(line)
+      if match is not None:
+        includes.append(_unescape(match.group(1)))
+      continue
+
+    if current is None:
+      continue
+
+    match = _POSTING_PATTERN.match(line)
+    if match is not None:
+      (account, number, currency) = match.groups()
+      try:
+        current.postings.append((account, D(number), currency))
+      except InvalidOperation:
+        pass
+      continue
+
+    match = _META_PATTERN.match(line)
+    if match is not None:
+      current = current._replace(fingerprint=_unescape(match.group(1)))
+      transactions[-1] = current
+
+  return (transactions, includes)
+
+
+def _hash_prefix(file: BinaryIO, offset: int) -> str:
+  # Hashes the whole indexed part of a file, so that an edit anywhere in it
+  # is told from an append.
+  hasher = hashlib.sha256()
+  file.seek(0)
+  remaining = offset
+  while remaining > 0:
+    chunk = file.read(min(_HASH_CHUNK_SIZE, remaining))
+    if len(chunk) == 0:
+      break
+    hasher.update(chunk)
+    remaining -= len(chunk)
+  return hasher.hexdigest()
+
+
+class BeanLedgerIndex(object):
+  """
+  A SQLite index of the transactions in a ledger and the files it includes.
+
+  Files are rescanned only when they change. A file that grew with its
+  indexed contents untouched, as appending imports does, is only scanned
+  from the last transaction indexed. The index stands in for loading the
+  ledger with beancount for duplicate and fingerprint checks.
+  """
+
+  def __init__(self, path: str):
+    self.path = path
+    with self._connect() as connection:
+      if connection.execute('PRAGMA user_version').fetchone()[0] != _INDEX_VERSION:
+        connection.execute('DROP TABLE IF EXISTS files')
+        connection.execute('DROP TABLE IF EXISTS transactions')
+        connection.execute('PRAGMA user_version = {}'.format(_INDEX_VERSION))
+      connection.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime INTEGER NOT NULL, size INTEGER NOT NULL, resume_offset INTEGER NOT NULL, prefix_hash TEXT NOT NULL, includes TEXT NOT NULL)')
+      connection.execute('CREATE TABLE IF NOT EXISTS transactions (path TEXT NOT NULL, offset INTEGER NOT NULL, date TEXT NOT NULL, payee TEXT, fingerprint TEXT, postings TEXT NOT NULL, PRIMARY KEY (path, offset)) WITHOUT ROWID')
+
+  @staticmethod
+  def make_default() -> Optional['BeanLedgerIndex']:
+    """
+    Makes the ledger index in the default cache directory. Returns None when
+    persistent caches are disabled.
+    """
+    path = get_cache_path(_LEDGER_INDEX_NAME)
+    if path is None:
+      return None
+    return BeanLedgerIndex(path)
+
+  @contextlib.contextmanager
+  def _connect(self) -> Iterator[sqlite3.Connection]:
+    # Commits on success and rolls back on failure.
+    connection = sqlite3.connect(self.path, timeout=_INDEX_TIMEOUT)
+    try:
+      with connection:
+        yield connection
+    finally:
+      connection.close()
+
+  def update(self, ledger_path: str) -> List[str]:
+    """
+    Brings the index of a ledger and the files it includes up to date.
+    Returns the paths of the files of the ledger.
+    """
+    paths: List[str] = list()
+    visited: Set[str] = set()
+    pending = [os.path.abspath(ledger_path)]
+
+    with self._connect() as connection:
+      while len(pending) > 0:
+        path = pending.pop(0)
+        if path in visited:
+          continue
+        visited.add(path)
+        paths.append(path)
+
+        for each_include in self._update_file(connection, path):
+          pattern = os.path.join(os.path.dirname(path), each_include)
+          pending.extend(sorted([os.path.abspath(p) for p in glob.glob(pattern)]))
+
+    return paths
+
+  def _update_file(self, connection: sqlite3.Connection, path: str) -> List[str]:
+    try:
+      stat = os.stat(path)
+    except OSError as error:
+      logging.warning('Cannot index ledger file {p}: {e}'.format(p=path, e=error))
+      return list()
+
+    row = connection.execute('SELECT mtime, size, resume_offset, prefix_hash, includes FROM files WHERE path = ?', (path,)).fetchone()
+
+    with open(path, 'rb') as file:
+      resume_offset = 0
+      includes: List[str] = list()
+
+      if row is not None:
+        (mtime, size, indexed_resume_offset, prefix_hash, indexed_includes) = row
+        if mtime == stat.st_mtime_ns and size == stat.st_size:
+          return json.loads(indexed_includes)
+        if stat.st_size >= size and _hash_prefix(file, indexed_resume_offset) == prefix_hash:
+          resume_offset = indexed_resume_offset
+          includes = json.loads(indexed_includes)
+
+      connection.execute('DELETE FROM transactions WHERE path = ? AND offset >= ?', (path, resume_offset))
+
+      (transactions, scanned_includes) = scan_ledger_file(file, resume_offset)
+      includes.extend([i for i in scanned_includes if i not in includes])
+
+      connection.executemany(
+        'INSERT OR REPLACE INTO transactions (path, offset, date, payee, fingerprint, postings) VALUES (?, ?, ?, ?, ?, ?)',
+        [(path, t.offset, t.date.isoformat(), t.payee, t.fingerprint, json.dumps([(a, str(n), c) for (a, n, c) in t.postings])) for t in transactions])
+
+      # The last transaction may still get lines appended, so the next scan
+      # resumes from it.
+      last_offset = connection.execute('SELECT MAX(offset) FROM transactions WHERE path = ?', (path,)).fetchone()[0]
+      next_resume_offset = last_offset if last_offset is not None else stat.st_size
+
+      connection.execute(
+        'INSERT OR REPLACE INTO files (path, mtime, size, resume_offset, prefix_hash, includes) VALUES (?, ?, ?, ?, ?, ?)',
+        (path, stat.st_mtime_ns, stat.st_size, next_resume_offset, _hash_prefix(file, next_resume_offset), json.dumps(includes)))
+
+    return includes
+
+  def iter_transactions(self, paths: List[str]) -> Iterator[BeanLedgerTransaction]:
+    with self._connect() as connection:
+      for each_path in paths:
+        for (offset, date, payee, fingerprint, postings) in connection.execute('SELECT offset, date, payee, fingerprint, postings FROM transactions WHERE path = ? ORDER BY offset', (each_path,)):
+          yield BeanLedgerTransaction(offset, datetime.date.fromisoformat(date), payee, fingerprint, [(a, Decimal(n), c) for (a, n, c) in json.loads(postings)])
+
+  def make_duplicate_index(self, ledger_path: str) -> BeanDuplicateIndex:
+    """
+    Updates the index of a ledger, then makes the duplicate index of its
+    transactions.
+    """
+    paths = self.update(ledger_path)
+    duplicate_index = BeanDuplicateIndex(set())
+    for each_transaction in self.iter_transactions(paths):
+      duplicate_index.update(iter_keys(each_transaction.date, each_transaction.payee, each_transaction.fingerprint, each_transaction.postings))
+    return duplicate_index
+
+
+def make_ledger_duplicate_index(ledger_path: str) -> BeanDuplicateIndex:
+  """
+  Makes the duplicate index of a ledger with the default ledger index, or
+  by loading the ledger with beancount when persistent caches are disabled.
+  """
+  ledger_index = BeanLedgerIndex.make_default()
+
+  if ledger_index is None:
+    # Slow to import, and only needed without the ledger index.
+    from beancount import loader
+    (entries, _, _) = loader.load_file(ledger_path)
+    return BeanDuplicateIndex.make(entries)
+
+  return ledger_index.make_duplicate_index(ledger_path)
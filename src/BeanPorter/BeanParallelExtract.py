@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+__copyright__ = "Copyright (C) 2021 WeZZard"
+__license__ = "MIT"
+
+from typing import Callable, List, Optional, TextIO, Tuple
+
+import concurrent.futures
+import datetime
+import logging
+import os
+
+from beancount.core import data
+from beancount.ingest import identify
+from beancount.ingest.extract import HEADER, extract_from_file, find_duplicate_entries, print_extracted_entries
+from beancount.utils import file_utils
+
+from BeanPorter.bpcml.ConfigCache import ConfigCache
+from BeanPorter.BeanDuplicateIndex import BeanDuplicateIndex
+from BeanPorter.BeanExtractImporter import BeanExtractImporter
+from BeanPorter.BeanFileDecoder import BeanEncodingCache
+from BeanPorter.BeanImporterRouter import BeanImporterRouter
+from BeanPorter.BeanImportState import BeanImportStateStore, get_fingerprints
+
+# Entries extracted from a file by an importer.
+ExtractedEntries = Tuple[str, List[data.Directive]]
+
+# Row fingerprints of the entries an importer has extracted, to record in the
+# state store once the entries are written.
+ExtractedFingerprints = Tuple[str, List[str]]
+
+# What extracting a file gives: the entries and the fingerprints to record.
+ExtractedFile = Tuple[List[ExtractedEntries], List[ExtractedFingerprints]]
+
+# Importers and options of a worker process, made once by the initializer.
+_WORKER_ROUTER: Optional[BeanImporterRouter] = None
+_WORKER_ENTRIES: Optional[List[data.Directive]] = None
+_WORKER_MINDATE: Optional[datetime.date] = None
+
+
+def _initialize_worker(
+  config_files: List[str], 
+  entries: Optional[List[data.Directive]], 
+  mindate: Optional[datetime.date], 
+  state_store: Optional[BeanImportStateStore],
+  duplicate_action: Optional[str],
+  duplicate_index: Optional[BeanDuplicateIndex],
+  config_cache: Optional[ConfigCache],
+  encoding_cache: Optional[BeanEncodingCache]
+):
+  global _WORKER_ROUTER, _WORKER_ENTRIES, _WORKER_MINDATE
+  # Files are extracted in parallel already: evaluating their rows on more
+  # processes would multiply the processes by the jobs of importers.
+  _WORKER_ROUTER = BeanImporterRouter(BeanExtractImporter.make_importers(config_files, state_store, duplicate_action, duplicate_index, max_jobs=1, config_cache=config_cache, encoding_cache=encoding_cache))
+  _WORKER_ENTRIES = entries
+  _WORKER_MINDATE = mindate
+
+
+def _extract_file_in_worker(filename: str) -> ExtractedFile:
+  return extract_file(_WORKER_ROUTER, filename, _WORKER_ENTRIES, _WORKER_MINDATE)
+
+
+def extract_file(
+  router: BeanImporterRouter,
+  filename: str,
+  entries: Optional[List[data.Directive]] = None,
+  mindate: Optional[datetime.date] = None
+) -> ExtractedFile:
+  """
+  Identifies and extracts a file as beancount's `extract` does, returning
+  the entries extracted by each importer identifying the file, with the row
+  fingerprints of importers having a state store. Importers are found with
+  the router instead of asking each one.
+
+  Files larger than beancount's threshold are skipped as beancount does,
+  except by importers setting `jobs` to more than 1, which are meant for
+  big files.
+  """
+  new_entries_list: List[ExtractedEntries] = list()
+  fingerprints_list: List[ExtractedFingerprints] = list()
+
+  importers = router.identify(filename)
+
+  size = os.path.getsize(filename)
+  if size > identify.FILE_TOO_LARGE_THRESHOLD:
+    large_file_importers = [i for i in importers if i.importer.jobs is not None and i.importer.jobs > 1]
+    if len(large_file_importers) < len(importers):
+      logging.warning("File too large: '{}' ({} bytes); skipping importers without jobs.".format(filename, size))
+    importers = large_file_importers
+
+  for each_importer in importers:
+    try:
+      new_entries = extract_from_file(filename, each_importer, existing_entries=entries, min_date=mindate)
+      new_entries_list.append((filename, new_entries))
+      if each_importer.state_store is not None:
+        fingerprints_list.append((each_importer.importer.name, get_fingerprints(new_entries)))
+    except Exception as exc:
+      logging.exception("Importer %s.extract() raised an unexpected error: %s", each_importer.name(), exc)
+
+  return (new_entries_list, fingerprints_list)
+
+
+def extract(
+  config_files: List[str],
+  files_or_directories: List[str],
+  output: TextIO,
+  jobs: int = 1,
+  entries: Optional[List[data.Directive]] = None,
+  mindate: Optional[datetime.date] = None,
+  ascending: bool = True,
+  hooks: Optional[List[Callable]] = None,
+  state_store: Optional[BeanImportStateStore] = None,
+  duplicate_action: Optional[str] = None,
+  duplicate_index: Optional[BeanDuplicateIndex] = None,
+  config_cache: Optional[ConfigCache] = None,
+  encoding_cache: Optional[BeanEncodingCache] = None
+):
+  """
+  Extracts files and directories with the importers made from config files,
+  fanning files out to `jobs` worker processes. Each worker makes the
+  importers once. Results are merged in the order files are found, so the
+  output is the same as extracting serially.
+
+  Rows extracted in earlier runs are skipped when a state store is given.
+  Rows extracted now are recorded in it only once the output is written, so
+  a run failing before then leaves the store as it was.
+  Transactions found in existing entries or the duplicate index are flagged
+  or dropped as `duplicate_action` tells. Config files are compiled through
+  the config cache and detected encodings are recorded in the encoding cache
+  when they are given.
+  """
+  filenames = list(file_utils.find_files(files_or_directories))
+
+  new_entries_list: List[ExtractedEntries] = list()
+  fingerprints_list: List[ExtractedFingerprints] = list()
+
+  if jobs <= 1 or len(filenames) <= 1:
+    router = BeanImporterRouter(BeanExtractImporter.make_importers(config_files, state_store, duplicate_action, duplicate_index, config_cache=config_cache, encoding_cache=encoding_cache))
+    for each_filename in filenames:
+      (each_new_entries_list, each_fingerprints_list) = extract_file(router, each_filename, entries, mindate)
+      new_entries_list.extend(each_new_entries_list)
+      fingerprints_list.extend(each_fingerprints_list)
+  else:
+    with concurrent.futures.ProcessPoolExecutor(
+      max_workers=min(jobs, len(filenames)),
+      initializer=_initialize_worker,
+      initargs=(config_files, entries, mindate, state_store, duplicate_action, duplicate_index, config_cache, encoding_cache)
+    ) as executor:
+      for (each_new_entries_list, each_fingerprints_list) in executor.map(_extract_file_in_worker, filenames):
+        new_entries_list.extend(each_new_entries_list)
+        fingerprints_list.extend(each_fingerprints_list)
+
+  write_extracted_entries(new_entries_list, output, entries, ascending, hooks)
+
+  if state_store is not None:
+    for (importer_name, fingerprints) in fingerprints_list:
+      state_store.add_fingerprints(importer_name, fingerprints)
+
+
+def write_extracted_entries(
+  new_entries_list: List[ExtractedEntries],
+  output: TextIO,
+  entries: Optional[List[data.Directive]] = None,
+  ascending: bool = True,
+  hooks: Optional[List[Callable]] = None
+):
+  """
+  Runs the hooks on extracted entries and prints them as beancount's
+  `extract` does, with beancount's `find_duplicate_entries` when no hooks are
+  given. It flags entries similar to existing ones, on top of the duplicates
+  importers find with a hash index as they extract.
+  """
+  if hooks is None:
+    hooks = [find_duplicate_entries]
+  for each_hook in hooks:
+    new_entries_list = each_hook(new_entries_list, entries)
+
+  output.write(HEADER)
+  for (key, new_entries) in new_entries_list:
+    output.write(identify.SECTION.format(key))
+    output.write('\n')
+    if not ascending:
+      new_entries.reverse()
+    print_extracted_entries(new_entries, output)
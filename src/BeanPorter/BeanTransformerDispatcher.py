@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+
+__copyright__ = "Copyright (C) 2021 WeZZard"
+__license__ = "MIT"
+
+from abc import abstractmethod
+from typing import Dict, List, Optional, Pattern, Set, Tuple
+
+import logging
+import re
+
+from BeanPorter.BeanTransformerPlan import BeanTransformerPlan, is_regex_pattern
+
+DEFAULT_MATCHER = 'index'
+
+
+class BeanTransformerDispatcher(object):
+  """
+  Finds the transformers matching a row. Matching transformers are returned
+  in the order they are declared in the importer, which is the order they
+  must be applied in.
+  """
+
+  @abstractmethod
+  def get_matching_plans(self, row: List[str]) -> List[BeanTransformerPlan]:
+    pass
+
+  @staticmethod
+  def make(transformer_plans: List[BeanTransformerPlan], matcher: Optional[str] = None) -> 'BeanTransformerDispatcher':
+    """
+    Makes the dispatcher named by `matcher`: `naive`, `index` or `automaton`.
+    """
+    if matcher is None:
+      matcher = DEFAULT_MATCHER
+    dispatcher_class = _DISPATCHER_CLASSES.get(matcher)
+    if dispatcher_class is None:
+      raise AssertionError('Unrecognized matcher name: {}'.format(matcher))
+    return dispatcher_class(transformer_plans)
+
+
+class _NaiveTransformerDispatcher(BeanTransformerDispatcher):
+  """
+  Tests every transformer against every row.
+  """
+
+  def __init__(self, transformer_plans: List[BeanTransformerPlan]):
+    self.transformer_plans = [p for p in transformer_plans if p.can_match()]
+
+  def get_matching_plans(self, row: List[str]) -> List[BeanTransformerPlan]:
+    return [p for p in self.transformer_plans if p.matches(row)]
+
+
+class _LiteralPrefixTable(object):
+  """
+  Transformers indexed by the literal patterns they have on a column.
+
+  Literal patterns match cells beginning with them, so literals are grouped
+  by length and a cell is looked up once per distinct literal length.
+  """
+
+  def __init__(self, column_index: int):
+    self.column_index = column_index
+    self.plans_by_length_and_literal: Dict[int, Dict[str, List[BeanTransformerPlan]]] = dict()
+    # Made by `freeze` once every literal is added.
+    self.lookups: List[Tuple[int, Dict[str, List[BeanTransformerPlan]]]] = list()
+
+  def add(self, literal: str, plan: BeanTransformerPlan):
+    plans_by_literal = self.plans_by_length_and_literal.setdefault(len(literal), dict())
+    plans_by_literal.setdefault(literal, list()).append(plan)
+
+  def freeze(self):
+    self.lookups = list(self.plans_by_length_and_literal.items())
+
+  def collect_candidates(self, row: List[str], candidates: List[BeanTransformerPlan]):
+    cell = row[self.column_index]
+    for (length, plans_by_literal) in self.lookups:
+      plans = plans_by_literal.get(cell[:length])
+      if plans is not None:
+        candidates.extend(plans)
+
+
+class _IndexedTransformerDispatcher(BeanTransformerDispatcher):
+  """
+  Looks up candidate transformers in hash tables built on literal patterns.
+
+  Each transformer having a literal pattern is indexed under one of them,
+  taken from the column with the most distinct literals. Only transformers
+  found in the tables, plus the residual ones without literal patterns, are
+  tested against a row.
+  """
+
+  def __init__(self, transformer_plans: List[BeanTransformerPlan]):
+    matchable_plans = [p for p in transformer_plans if p.can_match()]
+
+    distinct_literals: Dict[int, set] = dict()
+    for each_plan in matchable_plans:
+      for (column_index, raw_pattern) in each_plan.column_patterns:
+        if not is_regex_pattern(raw_pattern):
+          distinct_literals.setdefault(column_index, set()).add(raw_pattern)
+
+    tables: Dict[int, _LiteralPrefixTable] = dict()
+    residual_plans: List[BeanTransformerPlan] = list()
+
+    for each_plan in matchable_plans:
+      anchor = _IndexedTransformerDispatcher._choose_anchor(each_plan, distinct_literals)
+      if anchor is None:
+        residual_plans.append(each_plan)
+        continue
+      (column_index, literal) = anchor
+      table = tables.get(column_index)
+      if table is None:
+        table = _LiteralPrefixTable(column_index)
+        tables[column_index] = table
+      table.add(literal, each_plan)
+
+    for each_table in tables.values():
+      each_table.freeze()
+
+    self.tables: List[_LiteralPrefixTable] = list(tables.values())
+    self.residual_plans = residual_plans
+
+  @staticmethod
+  def _choose_anchor(plan: BeanTransformerPlan, distinct_literals: Dict[int, set]) -> Optional[Tuple[int, str]]:
+    anchor: Optional[Tuple[int, str]] = None
+    for (column_index, raw_pattern) in plan.column_patterns:
+      if is_regex_pattern(raw_pattern):
+        continue
+      if anchor is None or len(distinct_literals[column_index]) > len(distinct_literals[anchor[0]]):
+        anchor = (column_index, raw_pattern)
+    return anchor
+
+  def get_matching_plans(self, row: List[str]) -> List[BeanTransformerPlan]:
+    candidates: List[BeanTransformerPlan] = list(self.residual_plans)
+
+    for each_table in self.tables:
+      each_table.collect_candidates(row, candidates)
+
+    if len(candidates) > 1:
+      candidates.sort(key=_plan_index)
+
+    return [p for p in candidates if p.matches(row)]
+
+
+class _TrieNode(object):
+
+  __slots__ = ('children', 'pattern_ids')
+
+  def __init__(self):
+    self.children: Dict[str, '_TrieNode'] = dict()
+    self.pattern_ids: List[int] = list()
+
+
+# Regexes referring to their own groups cannot be merged with others, as
+# merging renumbers the groups.
+_GROUP_REFERENCE_PATTERN = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
+
+
+class ColumnPatternAutomaton(object):
+  """
+  All the patterns transformers have on a column, matched in one pass over a
+  cell.
+
+  Literal patterns are kept in a prefix trie, so walking the cell once finds
+  every literal it begins with. Regex patterns are merged into a single regex
+  of optional lookaheads, each capturing into a named group when its pattern
+  matches at the beginning of the cell.
+  """
+
+  def __init__(self, column_index: int):
+    self.column_index = column_index
+    self.root = _TrieNode()
+    self.regex_pattern_ids: Dict[str, List[int]] = dict()
+    # Made by `freeze` once every pattern is added.
+    self.has_literals = False
+    self.separate_regexes: List[Tuple[Pattern, List[int]]] = list()
+    self.combined_regex: Optional[Pattern] = None
+    self.combined_group_pattern_ids: Dict[str, List[int]] = dict()
+
+  def add(self, pattern_id: int, raw_pattern: str):
+    if is_regex_pattern(raw_pattern):
+      self.regex_pattern_ids.setdefault(raw_pattern[2:-1], list()).append(pattern_id)
+      return
+    node = self.root
+    for each_char in raw_pattern:
+      child = node.children.get(each_char)
+      if child is None:
+        child = _TrieNode()
+        node.children[each_char] = child
+      node = child
+    node.pattern_ids.append(pattern_id)
+
+  def freeze(self):
+    self.has_literals = bool(self.root.children) or bool(self.root.pattern_ids)
+
+    mergeable_sources: List[str] = list()
+    self.separate_regexes = list()
+    for (each_source, pattern_ids) in self.regex_pattern_ids.items():
+      if _GROUP_REFERENCE_PATTERN.search(each_source):
+        self.separate_regexes.append((re.compile(each_source), pattern_ids))
+      else:
+        mergeable_sources.append(each_source)
+
+    self.combined_regex = None
+    self.combined_group_pattern_ids = dict()
+
+    if not mergeable_sources:
+      return
+
+    try:
+      self.combined_regex = re.compile(''.join(['(?:(?=(?P<p{i}>{s})))?'.format(i=i, s=s) for (i, s) in enumerate(mergeable_sources)]))
+    except re.error as error:
+      logging.debug('Cannot merge regex patterns for column {c}: {e}'.format(c=self.column_index, e=error))
+      self.separate_regexes.extend([(re.compile(s), self.regex_pattern_ids[s]) for s in mergeable_sources])
+      return
+
+    for (i, each_source) in enumerate(mergeable_sources):
+      self.combined_group_pattern_ids['p{}'.format(i)] = self.regex_pattern_ids[each_source]
+
+  def collect_matches(self, row: List[str], matched_pattern_ids: List[int]):
+    self.collect_cell_matches(row[self.column_index], matched_pattern_ids)
+
+  def collect_cell_matches(self, cell: str, matched_pattern_ids: List[int]):
+    if self.has_literals:
+      node = self.root
+      matched_pattern_ids.extend(node.pattern_ids)
+      for each_char in cell:
+        node = node.children.get(each_char)
+        if node is None:
+          break
+        matched_pattern_ids.extend(node.pattern_ids)
+
+    if self.combined_regex is not None:
+      match = self.combined_regex.match(cell)
+      for (group_name, group) in match.groupdict().items():
+        if group is not None:
+          matched_pattern_ids.extend(self.combined_group_pattern_ids[group_name])
+
+    for (regex, pattern_ids) in self.separate_regexes:
+      if regex.match(cell):
+        matched_pattern_ids.extend(pattern_ids)
+
+
+class _AutomatonTransformerDispatcher(BeanTransformerDispatcher):
+  """
+  Matches all the patterns on each column at once with a per-column
+  automaton, then finds the transformers having all of their patterns
+  matched.
+  """
+
+  def __init__(self, transformer_plans: List[BeanTransformerPlan]):
+    automatons: Dict[int, ColumnPatternAutomaton] = dict()
+    pattern_ids: Dict[Tuple[int, str], int] = dict()
+    self.unconditional_plans: List[BeanTransformerPlan] = list()
+    self.plans_by_pattern_id: List[List[BeanTransformerPlan]] = list()
+    self.required_match_counts: Dict[int, int] = dict()
+
+    for each_plan in transformer_plans:
+      if not each_plan.can_match():
+        continue
+
+      plan_pattern_ids: Set[int] = set()
+      for each_column_pattern in each_plan.column_patterns:
+        pattern_id = pattern_ids.get(each_column_pattern)
+        if pattern_id is None:
+          pattern_id = len(pattern_ids)
+          pattern_ids[each_column_pattern] = pattern_id
+          self.plans_by_pattern_id.append(list())
+          (column_index, raw_pattern) = each_column_pattern
+          automaton = automatons.get(column_index)
+          if automaton is None:
+            automaton = ColumnPatternAutomaton(column_index)
+            automatons[column_index] = automaton
+          automaton.add(pattern_id, raw_pattern)
+        plan_pattern_ids.add(pattern_id)
+
+      if not plan_pattern_ids:
+        self.unconditional_plans.append(each_plan)
+        continue
+
+      for each_pattern_id in plan_pattern_ids:
+        self.plans_by_pattern_id[each_pattern_id].append(each_plan)
+      self.required_match_counts[each_plan.index] = len(plan_pattern_ids)
+
+    for each_automaton in automatons.values():
+      each_automaton.freeze()
+
+    self.automatons: List[ColumnPatternAutomaton] = list(automatons.values())
+
+  def get_matching_plans(self, row: List[str]) -> List[BeanTransformerPlan]:
+    matched_pattern_ids: List[int] = list()
+    for each_automaton in self.automatons:
+      each_automaton.collect_matches(row, matched_pattern_ids)
+
+    match_counts: Dict[int, int] = dict()
+    plans: List[BeanTransformerPlan] = list(self.unconditional_plans)
+    for each_pattern_id in matched_pattern_ids:
+      for each_plan in self.plans_by_pattern_id[each_pattern_id]:
+        match_count = match_counts.get(each_plan.index, 0) + 1
+        match_counts[each_plan.index] = match_count
+        if match_count == self.required_match_counts[each_plan.index]:
+          plans.append(each_plan)
+
+    if len(plans) > 1:
+      plans.sort(key=_plan_index)
+
+    return plans
+
+
+def _plan_index(plan: BeanTransformerPlan) -> int:
+  return plan.index
+
+
+_DISPATCHER_CLASSES = {
+  'naive': _NaiveTransformerDispatcher,
+  'index': _IndexedTransformerDispatcher,
+  'automaton': _AutomatonTransformerDispatcher,
+}
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+__copyright__ = "Copyright (C) 2021 WeZZard"
+__license__ = "MIT"
+
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import re
+import collections.abc
+import logging
+import operator
+
+from BeanPorter.bpcml.BPCML import Transformer, Importer, TRANSACTION_PROPERTY_SLOTS
+from BeanPorter.bpcml.Decls import RuleDecl
+from BeanPorter.bpcml.RuleCompiler import CompiledRule, compile_rule
+
+# A matcher tells if a cell matches a pattern by its truthiness.
+PatternMatcher = Callable[[str], object]
+
+
+def is_regex_pattern(raw_pattern: str) -> bool:
+  """
+  Checks if a raw pattern is declared as a Python regex literal: r'...'.
+  """
+  return raw_pattern.startswith('r\'') and raw_pattern.endswith('\'')
+
+
+def make_pattern_matcher(raw_pattern: str) -> PatternMatcher:
+  """
+  Compiles a transformer pattern into a matcher.
+
+  A pattern declared as a Python regex literal is matched at the beginning of
+  the cell. Any other pattern is literal and matches cells beginning with it.
+  """
+  raw_pattern = str(raw_pattern)
+  if is_regex_pattern(raw_pattern):
+    return re.compile(raw_pattern[2:-1]).match
+  return operator.methodcaller('startswith', raw_pattern)
+
+
+def resolve_term_variable(term: str, variable_names: List[str]) -> Optional[str]:
+  """
+  Resolves the variable a pattern term refers to: the first variable whose
+  name the term begins with.
+  """
+  for variable_name in variable_names:
+    if term.startswith(variable_name):
+      return variable_name
+  return None
+
+
+class BeanHeaderBinding(object):
+  """
+  The column slots variables of an importer are bound to in a table header.
+  Bound once per file.
+  """
+
+  def __init__(self, variable_names: List[str], variable_columns: Dict[str, int]):
+    self.variable_names = variable_names
+    self.variable_columns = variable_columns
+
+  def get_column_for_term(self, term: str) -> Optional[int]:
+    variable_name = resolve_term_variable(term, self.variable_names)
+    if variable_name is None:
+      return None
+    return self.variable_columns.get(variable_name)
+
+  @staticmethod
+  def make(importer: Importer, header: List[str]) -> 'BeanHeaderBinding':
+    variable_names: List[str] = list(importer.variable_map)
+    variable_columns: Dict[str, int] = dict()
+    missing_columns: List[str] = list()
+
+    column_indices: Dict[str, int] = dict()
+    for (index, column) in enumerate(header):
+      column_indices.setdefault(column, index)
+
+    for variable_name in variable_names:
+      column = importer.variable_map[variable_name]
+      column_index = column_indices.get(column)
+      if column_index is None:
+        missing_columns.append('{c!r} (${v})'.format(c=column, v=variable_name))
+      else:
+        variable_columns[variable_name] = column_index
+
+    if len(missing_columns) > 0:
+      logging.error('Columns are not found in table header of importer \"{n}\": {c}. Transformers referring to them never apply.'.format(n=importer.name, c=', '.join(missing_columns)))
+
+    return BeanHeaderBinding(variable_names, variable_columns)
+
+
+class BeanRowVariables(collections.abc.Mapping):
+  """
+  A read-only view of a row as variables, looked up through a header binding.
+  Rows are not copied: the view can be pointed at the next row.
+  """
+
+  __slots__ = ('variable_columns', 'row')
+
+  def __init__(self, header_binding: BeanHeaderBinding, row: Optional[List[str]] = None):
+    self.variable_columns = header_binding.variable_columns
+    self.row = row
+
+  def __getitem__(self, variable_name: str) -> str:
+    return self.row[self.variable_columns[variable_name]]
+
+  def __iter__(self) -> Iterator[str]:
+    return iter(self.variable_columns)
+
+  def __len__(self) -> int:
+    return len(self.variable_columns)
+
+
+def make_interpreted_rule(rule: RuleDecl, header_binding: BeanHeaderBinding) -> CompiledRule:
+  """
+  Evaluates a rule by walking its AST, as the reference for compiled rules.
+  """
+  variables = BeanRowVariables(header_binding)
+
+  def evaluate(row: List[str]) -> str:
+    variables.row = row
+    return rule.evaluate(variables)
+
+  return evaluate
+
+
+def make_rule_evaluators(transformer: Transformer, header_binding: BeanHeaderBinding, evaluator: Optional[str] = None) -> Dict[str, CompiledRule]:
+  """
+  Makes a callable evaluating rows for each rule of a transformer, compiled
+  unless the `interpreter` evaluator is selected.
+  """
+  rule_evaluators: Dict[str, CompiledRule] = dict()
+
+  for each_key in transformer.keys:
+    each_rule = transformer.rules[each_key]
+    if evaluator == 'interpreter':
+      rule_evaluators[each_key] = make_interpreted_rule(each_rule, header_binding)
+    else:
+      rule_evaluators[each_key] = compile_rule(each_rule, header_binding.variable_columns)
+
+  return rule_evaluators
+
+
+class BeanTransformerPlan(object):
+  """
+  A transformer with its patterns compiled against a table header.
+
+  `index` is the position of the transformer in the importer, which decides
+  the order transformers are applied in. `column_patterns` keeps the raw
+  pattern for each column the transformer matches on. `rule_evaluators`
+  evaluates the rules of the transformer against a row, and `rule_slots`
+  pairs them with the slots of their keys. `specificity` is the number of
+  patterns: a transformer only overrides keys set by less specific ones.
+  """
+
+  def __init__(
+    self, 
+    index: int, 
+    transformer: Transformer, 
+    column_patterns: Optional[List[Tuple[int, str]]],
+    rule_evaluators: Optional[Dict[str, CompiledRule]] = None
+  ):
+    self.index = index
+    self.transformer = transformer
+    self.column_patterns = column_patterns
+    self.specificity = len(column_patterns) if column_patterns is not None else 0
+    self.rule_evaluators = rule_evaluators if rule_evaluators is not None else dict()
+    self.rule_slots: List[Tuple[int, CompiledRule]] = [(TRANSACTION_PROPERTY_SLOTS[k], e) for (k, e) in self.rule_evaluators.items()]
+    if column_patterns is None:
+      self.pattern_matchers: Optional[List[Tuple[int, PatternMatcher]]] = None
+    else:
+      self.pattern_matchers = [(c, make_pattern_matcher(p)) for (c, p) in column_patterns]
+
+  def can_match(self) -> bool:
+    return self.pattern_matchers is not None
+
+  def matches(self, row: List[str]) -> bool:
+    if self.pattern_matchers is None:
+      return False
+    for (column_index, matcher) in self.pattern_matchers:
+      if not matcher(row[column_index]):
+        return False
+    return True
+
+  @staticmethod
+  def make(index: int, transformer: Transformer, header_binding: BeanHeaderBinding, evaluator: Optional[str] = None) -> 'BeanTransformerPlan':
+    patterns = transformer.patterns if transformer.patterns is not None else dict()
+
+    column_patterns: List[Tuple[int, str]] = list()
+
+    for each_term in patterns:
+      column_index = header_binding.get_column_for_term(each_term)
+
+      if column_index is None:
+        logging.info('Cannot find column index for term: {t!r}. Transformer \"{n}\" never applies.'.format(t=each_term, n=transformer.name))
+        return BeanTransformerPlan(index, transformer, None)
+
+      raw_pattern = patterns[each_term]
+
+      assert(raw_pattern is not None)
+
+      column_patterns.append((column_index, str(raw_pattern)))
+
+    rule_evaluators = make_rule_evaluators(transformer, header_binding, evaluator)
+
+    return BeanTransformerPlan(index, transformer, column_patterns, rule_evaluators)
@@ -5,18 +5,19 @@ import sys
 import logging
 import argparse
 
-logging.basicConfig(stream=sys.stderr, level=logging.INFO)
-
-from beancount.ingest.extract import extract
-
-from BeanPorter.BeanExtractImporter import BeanExtractImporter
+# Modules extracting import beancount.ingest, yaml and the like, which take
+# long to import. They are imported by `main` once arguments ask for an
+# extraction, so importing the package and printing usage stay fast.
+from BeanPorter.BeanDuplicateIndex import DEFAULT_DUPLICATE_ACTION, DUPLICATE_ACTIONS
 
 parser = argparse.ArgumentParser()
 
 parser.add_argument(
   "--file",
   type=str,
-  help="Bill file name.")
+  action='append',
+  default=None,
+  help="Bill file or directory names. Multiple files and directories are allowed.")
 
 parser.add_argument(
   "--config",
@@ -33,17 +34,63 @@ parser.add_argument(
   default=True,
   help="Ordering.")
 
+parser.add_argument(
+  "--jobs",
+  type=int,
+  default=1,
+  help="Number of processes extracting files in parallel.")
+
+parser.add_argument(
+  "--state",
+  type=str,
+  default=None,
+  help="SQLite file recording the rows extracted. Rows extracted before are skipped.")
+
+parser.add_argument(
+  "--ledger",
+  type=str,
+  default=None,
+  help="Beancount ledger to find duplicates of extracted transactions in. The ledger is indexed incrementally in the cache directory.")
+
+parser.add_argument(
+  "--duplicates",
+  type=str,
+  choices=sorted(DUPLICATE_ACTIONS),
+  default=DEFAULT_DUPLICATE_ACTION,
+  help="Flags duplicates of ledger transactions as beancount does, or drops them.")
+
 def main():
   args = parser.parse_args()
   if args.file is None or args.config is None:
     return
+
+  logging.basicConfig(stream=sys.stderr, level=logging.INFO)
+
+  from BeanPorter.bpcml.ConfigCache import ConfigCache
+  from BeanPorter.BeanFileDecoder import BeanEncodingCache
+  from BeanPorter.BeanParallelExtract import extract
+
+  duplicate_index = None
+  if args.ledger is not None:
+    from BeanPorter.BeanLedgerIndex import make_ledger_duplicate_index
+    duplicate_index = make_ledger_duplicate_index(args.ledger)
+
+  state_store = None
+  if args.state is not None:
+    from BeanPorter.BeanImportState import BeanImportStateStore
+    state_store = BeanImportStateStore(args.state)
   
   extract(
-    BeanExtractImporter.make_importers(args.config), 
-    [args.file],
+    args.config, 
+    args.file,
     sys.stdout,
+    jobs=args.jobs,
     entries=None,
-    options_map=None,
     mindate=None,
     ascending=args.ascending,
-    hooks=None)
+    hooks=None,
+    state_store=state_store,
+    duplicate_action=args.duplicates,
+    duplicate_index=duplicate_index,
+    config_cache=ConfigCache.make_default(),
+    encoding_cache=BeanEncodingCache.make_default())
@@ -2,17 +2,15 @@
 
 from typing import List, Optional
 
-import sys
 import logging
 
+from BeanPorter.bpcml.ConfigLoader import SourceMark
 from BeanPorter.bpcml.Tokenizer import Tokenizer
 from BeanPorter.bpcml.Token import Token, TokenKind
 from BeanPorter.bpcml.Decls import RuleDecl
 from BeanPorter.bpcml.Exprs import ArithmeticExpr, BoolExpr, Expr, CompoundExpr, FuncArgListExpr, NumExpr, StrLitExpr
 from BeanPorter.bpcml.Exprs import ValueExpr, VarRefExpr, FuncCallExpr
 
-logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
-
 """
 
 BNF
@@ -62,9 +60,11 @@ BoolExpr -> boolean_literal
 
 class ASTContext(object):
 
-  def __init__(self, tokenizer: Tokenizer, string: str):
+  def __init__(self, tokenizer: Tokenizer, string: str, mark: Optional[SourceMark] = None):
     self.tokenizer = tokenizer
     self.contents = string
+    # Where the string is in a config file, if known.
+    self.mark = mark
     self._tokens: Optional[Token] = None
     self._index = 0
     self._error: Optional[str] = None
@@ -91,7 +91,10 @@ class ASTContext(object):
   def make_syntax(self) -> Optional[RuleDecl]:
     top_level_decl = self._top_level_decl()
     if top_level_decl is None:
-      logging.fatal("Error happened while parsing \"{s}\": {e}".format(s=self.contents, e=self._error))
+      if self.mark is not None:
+        logging.fatal("{m}: Error happened while parsing \"{s}\": {e}".format(m=self.mark, s=self.contents, e=self._error))
+      else:
+        logging.fatal("Error happened while parsing \"{s}\": {e}".format(s=self.contents, e=self._error))
     return top_level_decl
 
   def _top_level_decl(self) -> Optional[RuleDecl]:
@@ -2,24 +2,26 @@
 
 from abc import abstractmethod
 
-from typing import List, Dict, Set, Optional
+from typing import TYPE_CHECKING, Deque, Iterable, Iterator, List, Dict, Mapping, Set, Optional
 
 import io
-import yaml
+import collections
 import csv
 import re
 import os
 import logging
 
 from BeanPorter.bpcml.ASTContext import ASTContext
+from BeanPorter.bpcml.ConfigCache import ConfigCache
+from BeanPorter.bpcml.ConfigLoader import SourceMark, get_mark, get_value_mark, load_config
 from BeanPorter.bpcml.Tokenizer import Tokenizer
 from BeanPorter.bpcml.Decls import RuleDecl
 
-from beancount.ingest import cache
+if TYPE_CHECKING:
+  # Importing beancount.ingest imports pytest.
+  from beancount.ingest import cache
 
 
-_DEFAULT_IMPORTER_COUNTER = 0
-
 REQUIRED_TRANSACTION_PROPERTY_KEYS: Set[str] = frozenset([
   'transaction_name',
   'timestamp',
@@ -45,13 +47,28 @@ OPTIONAL_TRANSACTION_PROPERTY_KEYS: Set[str] = frozenset([
 
 TRANSACTION_PROPERTY_KEYS: Set[str] = frozenset().union(*[REQUIRED_TRANSACTION_PROPERTY_KEYS, OPTIONAL_TRANSACTION_PROPERTY_KEYS])
 
-def make_default_impoter_name() -> str:
-  global _DEFAULT_IMPORTER_COUNTER
-  if _DEFAULT_IMPORTER_COUNTER == 0:
+# Fixed slots of transaction properties in evaluation states.
+TRANSACTION_PROPERTY_SLOTS: Dict[str, int] = {k: i for (i, k) in enumerate(sorted(TRANSACTION_PROPERTY_KEYS))}
+
+# Strategies an importer may select to match transformer patterns with.
+MATCHER_NAMES: Set[str] = frozenset(['naive', 'index', 'automaton'])
+
+# Ways an importer may select to evaluate transformer rules with. The
+# interpreter walks rule ASTs and is kept as the reference.
+EVALUATOR_NAMES: Set[str] = frozenset(['compiler', 'interpreter'])
+
+# Engines an importer may select to evaluate rows with: one row at a time,
+# or column-wise over batches of rows.
+ENGINE_NAMES: Set[str] = frozenset(['row', 'columnar'])
+
+def make_default_impoter_name(counter: int) -> str:
+  """
+  Returns the name of the `counter`-th unnamed importer of a config.
+  """
+  if counter == 0:
     name = 'Default'
   else:
-    name = 'Default-{c}'.format(c=(_DEFAULT_IMPORTER_COUNTER))
-  _DEFAULT_IMPORTER_COUNTER += 1
+    name = 'Default-{c}'.format(c=(counter))
   return name
 
 
@@ -66,6 +83,16 @@ def strip_blank(contents):
       rows.append(",".join(['"{}"'.format(x.strip()) for x in row]))
     return "\n".join(rows)
 
+
+def iter_stripped_rows(lines: Iterable[str]) -> Iterator[List[str]]:
+  """
+  Streaming counterpart of `strip_blank`: yields csv rows with redundant
+  blanks stripped from every cell, one row at a time.
+  """
+  csvreader = csv.reader(lines, delimiter=",", quotechar='"')
+  for row in csvreader:
+    yield [x.strip() for x in row]
+
 class Developer:
 
   def __init__(self, is_debug_enabled: bool = False):
@@ -107,7 +134,8 @@ class FileNameProbe:
     
     suffix = serialization.get('suffix')
     if suffix is not None:
-      assert(probe is None, "A probe may have only one kind of configuration for file_name! There have been {}".format(probe.kind()))
+      if probe is not None:
+        raise AssertionError("A probe may have only one kind of configuration for file_name! There have been {}".format(probe.kind()))
       assert(isinstance(suffix, str))
       probe = _FileNameSuffixProbe(suffix)
     
@@ -151,7 +179,7 @@ class _FileNameSuffixProbe(FileNameProbe):
     assert(isinstance(suffix, str))
     self.suffix = suffix
   
-  def kind() -> str:
+  def kind(self) -> str:
     return 'suffix'
   
   def test(self, file_name: str) -> bool:
@@ -165,33 +193,65 @@ class Probe:
     if serialization is None:
       return _NoProbe()
     
+    probes_header = serialization.get('header', False)
+    if not isinstance(probes_header, bool):
+      raise AssertionError('Invalid header probe: {}'.format(probes_header))
+
     return _HasProbe(
-      FileNameProbe.make_with_serialization(serialization.get('file_name'))
+      FileNameProbe.make_with_serialization(serialization.get('file_name')),
+      probes_header
     )
   
   @abstractmethod
-  def test(self, file: cache._FileMemo) -> bool:
+  def test(self, file: 'cache._FileMemo') -> bool:
+    """
+    Tests the file name. Files failing the test may still be identified by
+    their table headers when the header is probed.
+    """
+    pass
+
+  @abstractmethod
+  def get_file_name_probe(self) -> Optional[FileNameProbe]:
+    pass
+
+  @abstractmethod
+  def probes_header(self) -> bool:
     pass
 
 class _NoProbe(Probe):
   
-  def test(self, file: cache._FileMemo) -> bool:
+  def test(self, file: 'cache._FileMemo') -> bool:
     return True
 
+  def get_file_name_probe(self) -> Optional[FileNameProbe]:
+    return None
+
+  def probes_header(self) -> bool:
+    return False
+
 
 class _HasProbe(Probe):
 
-  def __init__(self, file_name_probe: Optional[FileNameProbe]):
+  def __init__(self, file_name_probe: Optional[FileNameProbe], is_header_probed: bool = False):
     self.file_name_probe = file_name_probe
+    self.is_header_probed = is_header_probed
   
-  def test(self, file: cache._FileMemo) -> bool:
-    is_file_name_matched = True
+  def test(self, file: 'cache._FileMemo') -> bool:
+    # Without a file name probe, a probed header is the only way to
+    # identify a file.
+    is_file_name_matched = not self.is_header_probed
     
     if self.file_name_probe is not None:
       is_file_name_matched = self.file_name_probe.test(file.name)
     
     return is_file_name_matched
 
+  def get_file_name_probe(self) -> Optional[FileNameProbe]:
+    return self.file_name_probe
+
+  def probes_header(self) -> bool:
+    return self.is_header_probed
+
 
 class TableHeader:
   
@@ -262,9 +322,38 @@ class Stripper:
     
     raise AssertionError('Unrecognized stripper action name: {}'.format(action_name))
   
-  @abstractmethod
-  def evaluate_in_file_contents(self, file_contents) -> Optional[int]:
-    pass
+  def get_leading_line_count(self) -> int:
+    """
+    Number of lines the stripper removes from the head of the file when it
+    can be known without reading the file.
+    """
+    return 0
+
+  def get_trailing_line_count(self) -> int:
+    """
+    Number of lines the stripper removes from the tail of the file when it
+    can be known without reading the file.
+    """
+    return 0
+
+  def looks_for_boundary(self) -> bool:
+    """
+    Checks if the stripper strips lines up to or from a boundary line which
+    can only be found by reading the file.
+    """
+    return False
+
+  def is_boundary(self, row: List[str]) -> bool:
+    """
+    Checks if the row is the boundary line the stripper is looking for.
+    """
+    return False
+
+  def includes_boundary(self) -> bool:
+    """
+    Checks if the boundary line itself is stripped.
+    """
+    return False
 
   @abstractmethod
   def is_leading_stripper(self) -> bool:
@@ -279,14 +368,8 @@ class _RemoveFirstKStripper(Stripper):
   
   def __init__(self, k: int):
     self.k = k
-  
-  def evaluate_in_file_contents(self, file_contents) -> Optional[int]:
-    reader = csv.reader(io.StringIO(strip_blank(file_contents)))
-    lines_count = sum(1 for _ in reader)
 
-    if lines_count < self.k:
-      return lines_count
-    
+  def get_leading_line_count(self) -> int:
     return self.k
 
   def is_leading_stripper(self) -> bool:
@@ -301,15 +384,9 @@ class _RemoveLastKStripper(Stripper):
 
   def __init__(self, k: int):
     self.k = k
-  
-  def evaluate_in_file_contents(self, file_contents) -> Optional[int]:
-    reader = csv.reader(io.StringIO(strip_blank(file_contents)))
-    lines_count = sum(1 for _ in enumerate(reader))
 
-    if lines_count < self.k:
-      return 0 - 1
-    
-    return (lines_count - self.k) - 1
+  def get_trailing_line_count(self) -> int:
+    return self.k
 
   def is_leading_stripper(self) -> bool:
     return False
@@ -320,12 +397,23 @@ class _RemoveLastKStripper(Stripper):
 
 
 class _RemoveBeforePatternStripper(Stripper):
-  """ Currently not implemented!
+  """
+  Removes lines before the first line matching the pattern.
   """
 
   def __init__(self, pattern: str, includes: bool):
     self.pattern = pattern
     self.includes = includes
+    self.re_pattern = re.compile(pattern)
+
+  def looks_for_boundary(self) -> bool:
+    return True
+
+  def is_boundary(self, row: List[str]) -> bool:
+    return self.re_pattern.search(','.join(row)) is not None
+
+  def includes_boundary(self) -> bool:
+    return self.includes
 
   def is_leading_stripper(self) -> bool:
     return True
@@ -336,12 +424,24 @@ class _RemoveBeforePatternStripper(Stripper):
     
 
 class _RemoveAfterPatternStripper(Stripper):
-  """ Currently not implemented!
+  """
+  Removes lines after the first line matching the pattern. Only lines which
+  survived leading strippers are looked at.
   """
 
   def __init__(self, pattern: str, includes: bool):
     self.pattern = pattern
     self.includes = includes
+    self.re_pattern = re.compile(pattern)
+
+  def looks_for_boundary(self) -> bool:
+    return True
+
+  def is_boundary(self, row: List[str]) -> bool:
+    return self.re_pattern.search(','.join(row)) is not None
+
+  def includes_boundary(self) -> bool:
+    return self.includes
 
   def is_leading_stripper(self) -> bool:
     return False
@@ -352,8 +452,10 @@ class _RemoveAfterPatternStripper(Stripper):
 
 
 class Transformer(object):
+
+  __slots__ = ('name', 'patterns', 'rules', 'keys', 'mark', 'rule_marks')
   
-  def __init__(self, name: str, patterns: Optional[Dict[str, str]], rules: Optional[Dict[str, RuleDecl]]):
+  def __init__(self, name: str, patterns: Optional[Dict[str, str]], rules: Optional[Dict[str, RuleDecl]], mark: Optional[SourceMark] = None, rule_marks: Optional[Dict[str, SourceMark]] = None):
     Transformer.validate_rules(rules)
     assert(isinstance(name, str))
     assert(patterns is None or isinstance(patterns, dict))
@@ -361,6 +463,11 @@ class Transformer(object):
     self.name = name
     self.patterns = patterns
     self.rules = rules
+    # Keys the transformer defines a rule for.
+    self.keys: List[str] = [k for k in rules if rules[k] is not None] if rules is not None else list()
+    # Where the transformer and its rules are in config files, if known.
+    self.mark = mark
+    self.rule_marks: Dict[str, SourceMark] = rule_marks if rule_marks is not None else dict()
   
   def __str__(self) -> str:
     patterns_desc: str = '\n'.join(['    {k} : {v}'.format(k=k, v=self.patterns[k]) for k in self.patterns])
@@ -397,12 +504,16 @@ class Transformer(object):
     assert(isinstance(raw_rule, dict), 'rules is {} in {}'.format(raw_rule, serialization))
 
     rules: Dict[str, RuleDecl] = dict()
+    rule_marks: Dict[str, SourceMark] = dict()
 
     for each_key in raw_rule:
-      ast_context = ASTContext(tokenizer, raw_rule[each_key])
+      rule_mark = get_value_mark(raw_rule, each_key)
+      if rule_mark is not None:
+        rule_marks[each_key] = rule_mark
+      ast_context = ASTContext(tokenizer, raw_rule[each_key], rule_mark)
       rules[each_key] = ast_context.make_syntax()
 
-    return Transformer(name, patterns, rules)
+    return Transformer(name, patterns, rules, get_mark(serialization), rule_marks)
   
   @staticmethod
   def validate_rules(rules: Optional[Dict[str, str]]):
@@ -413,9 +524,9 @@ class Transformer(object):
       if each_rule_name not in TRANSACTION_PROPERTY_KEYS:
         raise Exception('Unexpected rule name: {r}'.format(r=each_rule_name))
 
-  def map_value(self, name: str, variables: Dict[str, str]) -> Optional[str]:
+  def map_value(self, name: str, variables: Mapping[str, str]) -> Optional[str]:
     assert(isinstance(name, str))
-    assert(isinstance(variables, dict))
+    assert(isinstance(variables, Mapping))
     syntax = self.get_rule_syntax(name)
     if syntax is None:
       return None
@@ -446,6 +557,26 @@ class Importer:
     strippers = Stripper.make_strippers_with_serialization(config.get('strippers'))
     variable_map = config.get('variables', dict())
     transformers = Transformer.make_transformers_with_serialization(config.get('transformers'), Tokenizer())
+    matcher = config.get('matcher', None)
+    evaluator = config.get('evaluator', None)
+    engine = config.get('engine', None)
+    jobs = config.get('jobs', None)
+    chunk_size = config.get('chunk_size', None)
+
+    if matcher is not None and matcher not in MATCHER_NAMES:
+      raise AssertionError('Unrecognized matcher name: {}'.format(matcher))
+
+    if evaluator is not None and evaluator not in EVALUATOR_NAMES:
+      raise AssertionError('Unrecognized evaluator name: {}'.format(evaluator))
+
+    if engine is not None and engine not in ENGINE_NAMES:
+      raise AssertionError('Unrecognized engine name: {}'.format(engine))
+
+    if jobs is not None and (not isinstance(jobs, int) or jobs < 1):
+      raise AssertionError('Invalid jobs: {}'.format(jobs))
+
+    if chunk_size is not None and (not isinstance(chunk_size, int) or chunk_size < 1):
+      raise AssertionError('Invalid chunk size: {}'.format(chunk_size))
 
     return Importer(
       name, 
@@ -454,7 +585,12 @@ class Importer:
       table_header, 
       strippers, 
       variable_map, 
-      transformers
+      transformers,
+      matcher,
+      evaluator,
+      engine,
+      jobs,
+      chunk_size
     )
   
   def __init__(
@@ -465,15 +601,28 @@ class Importer:
     table_header: TableHeader, 
     strippers: List[Stripper], 
     variable_map: Dict[str, str], 
-    transformers: List[Transformer]
+    transformers: List[Transformer],
+    matcher: Optional[str] = None,
+    evaluator: Optional[str] = None,
+    engine: Optional[str] = None,
+    jobs: Optional[int] = None,
+    chunk_size: Optional[int] = None
   ):
-    self.name = name if name is not None else make_default_impoter_name()
+    # Unnamed importers are named when their config is resolved.
+    self.name = name
     self.probe = probe
     self.encoding = encoding
     self.table_header = table_header
     self.strippers = strippers
     self.variable_map = variable_map
     self.transformers = transformers
+    self.matcher = matcher
+    self.evaluator = evaluator
+    self.engine = engine
+    # Evaluates the rows of a file in chunks of `chunk_size` rows on `jobs`
+    # processes. One job evaluates serially.
+    self.jobs = jobs
+    self.chunk_size = chunk_size
   
   def extend_with_extension(self, extension: 'ImporterExtension'):
     assert(isinstance(extension, ImporterExtension))
@@ -488,60 +637,96 @@ class Importer:
     self.variable_map.update(extension.variable_map)
     self.transformers.extend(extension.transformers)
 
-  def normalize(self, file_contents) -> List[List[str]]:
-    reader = csv.reader(io.StringIO(strip_blank(file_contents)))
-
-    normalized_contents = list()
-
-    stripped_leading_lines = self._get_stripped_leading_lines(file_contents)
-    stripped_trailing_lines = self._get_stripped_trailing_lines(file_contents)
-
-    line = next(reader, None)
-    line_number = 0
-
-    while line is not None:
-      previous_line = line
-      previous_line_number = line_number
-
-      line = next(reader, None)
-      line_number += 1
-
-      if stripped_leading_lines is not None:
-        if previous_line_number < stripped_leading_lines:
-          continue
-      if stripped_trailing_lines is not None:
-        if previous_line_number > stripped_trailing_lines:
-          continue
-      
-      normalized_contents.append(previous_line)
+  def get_required_columns(self) -> List[str]:
+    """
+    Returns the columns the table header of a file must have for the header
+    probe to identify it: the columns of the importer's variables.
+    """
+    return sorted(set(self.variable_map.values()))
+
+  def find_header_row(self, lines: Iterable[str]) -> Optional[List[str]]:
+    """
+    Finds the table header row in the lines of a file: the first row
+    extraction keeps. Only reads as many lines as needed.
+    """
+    return next(self._iter_table_rows(lines, warns_unfound_boundaries=False), None)
+
+  def _iter_table_rows(self, lines: Iterable[str], warns_unfound_boundaries: bool) -> Iterator[List[str]]:
+    """
+    Streams the rows of the lines of a file from the table header on.
+
+    Leading lines are skipped as they are read until every leading stripper
+    has found its boundary. Lines before the line of the table header are
+    skipped as well when one is configured.
+    """
+    leading_line_count = max([s.get_leading_line_count() for s in self.strippers], default=0)
+    if isinstance(self.table_header, _LineSpecifiedTableHeader):
+      leading_line_count = max(leading_line_count, self.table_header.line - 1)
+
+    pending_leading_strippers = [s for s in self.strippers if s.looks_for_boundary() and s.is_leading_stripper()]
+
+    for (line_number, row) in enumerate(iter_stripped_rows(lines)):
+      is_stripped = line_number < leading_line_count
+
+      if len(pending_leading_strippers) > 0:
+        remaining_leading_strippers = list()
+        for each_stripper in pending_leading_strippers:
+          if each_stripper.is_boundary(row):
+            is_stripped = is_stripped or each_stripper.includes_boundary()
+          else:
+            remaining_leading_strippers.append(each_stripper)
+        pending_leading_strippers = remaining_leading_strippers
+        is_stripped = is_stripped or len(pending_leading_strippers) > 0
+
+      if not is_stripped:
+        yield row
+
+    if warns_unfound_boundaries:
+      for each_stripper in pending_leading_strippers:
+        logging.warning('Leading boundary {p!r} of importer \"{n}\" is not found. All lines are stripped.'.format(p=each_stripper.pattern, n=self.name))
 
-    return normalized_contents
-  
-  def _get_stripped_leading_lines(self, file_contents) -> Optional[int]:
-    line_to_strip = None
-
-    for each_stripper in self.strippers:
-      if each_stripper.is_leading_stripper():
-        line = each_stripper.evaluate_in_file_contents(file_contents)
-        if line_to_strip is not None:
-          line_to_strip = max(line, line_to_strip)
-        else:
-          line_to_strip = line
-    
-    return line_to_strip
-
-  def _get_stripped_trailing_lines(self, file_contents) -> Optional[int]:
-    line_to_strip = None
-
-    for each_stripper in self.strippers:
-      if each_stripper.is_trailing_stripper():
-        line = each_stripper.evaluate_in_file_contents(file_contents)
-        if line_to_strip is not None:
-          line_to_strip = min(line, line_to_strip)
-        else:
-          line_to_strip = line
-    
-    return line_to_strip
+  def normalize(self, file_contents) -> List[List[str]]:
+    return list(self.iter_normalized_rows(io.StringIO(file_contents)))
+
+  def iter_normalized_rows(self, lines: Iterable[str]) -> Iterator[List[str]]:
+    """
+    Streams normalized rows out of the lines of a file, resolving all the
+    strippers in a single scan.
+
+    Rows before the table header are skipped as `find_header_row` does.
+    Trailing lines are held back in a lookahead buffer as long as the longest
+    trailing stripper, so the total line count of the file never needs to be
+    known. Once a trailing boundary is found, only as many more lines as the
+    lookahead needs are read.
+    """
+    trailing_line_count = max([s.get_trailing_line_count() for s in self.strippers], default=0)
+
+    trailing_strippers = [s for s in self.strippers if s.looks_for_boundary() and s.is_trailing_stripper()]
+
+    # Lines after a trailing boundary are kept as None, which counts them
+    # for the lookahead without ever yielding them.
+    lookahead: Deque[Optional[List[str]]] = collections.deque()
+    is_truncated = False
+
+    for row in self._iter_table_rows(lines, warns_unfound_boundaries=True):
+      if is_truncated:
+        lookahead.append(None)
+      else:
+        for each_stripper in trailing_strippers:
+          if each_stripper.is_boundary(row):
+            is_truncated = True
+            if each_stripper.includes_boundary():
+              row = None
+
+        lookahead.append(row)
+
+      if len(lookahead) > trailing_line_count:
+        row = lookahead.popleft()
+        if row is not None:
+          yield row
+
+      if is_truncated and all(r is None for r in lookahead):
+        break
   
 
 class ImporterExtension(Importer):
@@ -590,13 +775,28 @@ class ImporterExtension(Importer):
 class BPCML:
 
   @staticmethod
-  def make_with_serialization_at_path(path: str) -> 'BPCML':
-    with open(path, 'r') as config_file:
-      serialization = yaml.safe_load(config_file)
-      config = BPCML.make_with_serialization(serialization)
-      config.cwd = os.path.dirname(path)
-      config.path = path
-      return config
+  def make_with_serialization_at_path(path: str, config_cache: Optional[ConfigCache] = None) -> 'BPCML':
+    """
+    Makes the config of a file. With a config cache, the config compiled
+    from the same path and contents before is loaded instead of parsing the
+    file, and the files it includes are loaded through the cache too.
+    """
+    with open(path, 'rb') as config_file:
+      contents = config_file.read()
+
+    if config_cache is None:
+      config = BPCML.make_with_serialization(load_config(contents, path))
+    else:
+      key = config_cache.make_key(contents, path)
+      config = config_cache.get(key)
+      if not isinstance(config, BPCML):
+        config = BPCML.make_with_serialization(load_config(contents, path))
+        config_cache.set(key, config)
+
+    config.cwd = os.path.dirname(path)
+    config.path = path
+    config.config_cache = config_cache
+    return config
 
   @staticmethod
   def make_with_serialization(serialization: Optional[Dict]) -> 'BPCML':
@@ -631,9 +831,19 @@ class BPCML:
     self.importers = importers
     self.importer_extensions = importer_extensions
     self._is_resolved = False
+    self._default_importer_counter = 0
+    self.config_cache: Optional[ConfigCache] = None
   
   def resolve(self):
+    self._name_default_importers(self.importers)
     self._resolve(self)
+
+  def _name_default_importers(self, importers: List[Importer]):
+    # Names unnamed importers in the order they join the root config.
+    for each_importer in importers:
+      if each_importer.name is None:
+        each_importer.name = make_default_impoter_name(self._default_importer_counter)
+        self._default_importer_counter += 1
   
   def _resolve(self, root: 'BPCML'):
     # Resolves the config. Extends the config's contents with include lists 
@@ -649,7 +859,7 @@ class BPCML:
     
     for each_include in self.include_list:
       full_include_path = os.path.join(cwd, each_include)
-      included_config = BPCML.make_with_serialization_at_path(full_include_path)
+      included_config = BPCML.make_with_serialization_at_path(full_include_path, self.config_cache)
       if included_config is not None:
         self._extend_with_config(included_config, root)
 
@@ -667,6 +877,9 @@ class BPCML:
     if config == self:
       return
     
+    root_config._name_default_importers(root_config.importers)
+    root_config._name_default_importers(config.importers)
+
     # Resolve the given config firstly. Thus we don't have to process configs
     # referred by its include-lists.
     config._resolve(root_config)
@@ -1,12 +1,15 @@
 #!/usr/bin/env python3
 
 from abc import abstractmethod
-import dateutil
 from typing import List, Optional
 
-from beancount.utils.date_utils import parse_date_liberally
+from BeanPorter.bpcml.TimestampParser import TimestampParser
 
 class BuiltinFunction(object):
+
+  # Whether results only depend on arguments, which allows calls on constants
+  # to be folded at compile time.
+  is_pure = False
   
   @abstractmethod
   def evaluate(self, args: List[str]) -> str:
@@ -24,20 +27,34 @@ class BuiltinFunction(object):
 
 
 class BuiltinFunctionDate(BuiltinFunction):
+  """
+  Not pure: timestamps missing parts are completed with the current date.
+  """
+
+  def __init__(self):
+    self.timestamp_parser = TimestampParser()
   
   def evaluate(self, args: List[str]) -> str:
-    return parse_date_liberally(args[0]).strftime('%Y-%m-%d')
+    return self.timestamp_parser.parse(args[0]).strftime('%Y-%m-%d')
 
 
 class BuiltinFunctionTime(BuiltinFunction):
+  """
+  Not pure: timestamps missing parts are completed with the current date.
+  """
+
+  def __init__(self):
+    self.timestamp_parser = TimestampParser()
   
   def evaluate(self, args: List[str]) -> str:
-    return dateutil.parser.parse(args[0]).time().strftime('%H:%M:%S')
+    return self.timestamp_parser.parse(args[0]).strftime('%H:%M:%S')
 
 class BuiltinFunctionDY(BuiltinFunction):
   """
   Drop prefixing CNY(¥) sign.
   """
+
+  is_pure = True
   
   def evaluate(self, args: List[str]) -> str:
     if args[0].startswith('¥'):
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+from typing import Any, Optional
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+from BeanPorter.BeanCache import get_cache_path
+
+_CONFIG_CACHE_NAME = 'configs'
+
+# Maximum number of compiled configs kept. The least recently written ones
+# are dropped first.
+_CONFIG_CACHE_CAPACITY = 256
+
+
+def _make_code_signature() -> bytes:
+  # Compiled configs are pickled BPCML objects, which are only valid for the
+  # code that made them.
+  package_dir = os.path.dirname(os.path.abspath(__file__))
+  hasher = hashlib.sha256()
+  for each_name in sorted(os.listdir(package_dir)):
+    if each_name.endswith('.py'):
+      stat = os.stat(os.path.join(package_dir, each_name))
+      hasher.update('{n}:{s}:{m};'.format(n=each_name, s=stat.st_size, m=stat.st_mtime_ns).encode('utf-8'))
+  return hasher.digest()
+
+
+class ConfigCache(object):
+  """
+  A persistent cache of compiled config files: each config file is parsed
+  into a BPCML object, with its rules tokenized and parsed, then pickled
+  under the hash of its path and contents. The path is hashed as compiled
+  configs keep it in the source marks of their values. Files are cached one
+  by one, so editing a config file only recompiles that file. Compiled
+  configs are unresolved, and resolved again each time they are loaded.
+
+  Loading a compiled config unpickles it, which may run any code. The cache
+  directory is trusted as the config files are: it is only made readable and
+  writable by its owner, and must not be shared with other users.
+  """
+
+  def __init__(self, directory: str):
+    self.directory = directory
+    self._code_signature: Optional[bytes] = None
+
+  @staticmethod
+  def make_default() -> Optional['ConfigCache']:
+    """
+    Makes the config cache in the default cache directory. Returns None when
+    persistent caches are disabled.
+    """
+    directory = get_cache_path(_CONFIG_CACHE_NAME)
+    if directory is None:
+      return None
+    return ConfigCache(directory)
+
+  def make_key(self, contents: bytes, path: Optional[str] = None) -> str:
+    if self._code_signature is None:
+      self._code_signature = _make_code_signature()
+    hasher = hashlib.sha256(self._code_signature)
+    if path is not None:
+      hasher.update(os.fsencode(path))
+    # Separates the path from the contents.
+    hasher.update(b'\0')
+    hasher.update(contents)
+    return hasher.hexdigest()
+
+  def _get_path(self, key: str) -> str:
+    return os.path.join(self.directory, key + '.pickle')
+
+  def get(self, key: str) -> Optional[Any]:
+    try:
+      with open(self._get_path(key), 'rb') as cache_file:
+        return pickle.load(cache_file)
+    except FileNotFoundError:
+      return None
+    except Exception as error:
+      logging.debug('Cannot read compiled config {k}: {e}'.format(k=key, e=error))
+      return None
+
+  def set(self, key: str, config: Any):
+    try:
+      os.makedirs(self.directory, mode=0o700, exist_ok=True)
+      (fd, temp_path) = tempfile.mkstemp(dir=self.directory)
+      with os.fdopen(fd, 'wb') as temp_file:
+        pickle.dump(config, temp_file, protocol=pickle.HIGHEST_PROTOCOL)
+      os.replace(temp_path, self._get_path(key))
+      self._evict()
+    except (OSError, pickle.PicklingError) as error:
+      logging.debug('Cannot write compiled config {k}: {e}'.format(k=key, e=error))
+
+  def _evict(self):
+    paths = [os.path.join(self.directory, n) for n in os.listdir(self.directory) if n.endswith('.pickle')]
+    if len(paths) <= _CONFIG_CACHE_CAPACITY:
+      return
+    paths.sort(key=lambda p: os.stat(p).st_mtime_ns)
+    for each_path in paths[:len(paths) - _CONFIG_CACHE_CAPACITY]:
+      try:
+        os.remove(each_path)
+      except OSError:
+        pass
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+from typing import Any, Dict, NamedTuple, Optional
+
+import functools
+
+
+class SourceMark(NamedTuple):
+  """
+  Where a value is found in a config file. Lines and columns start at 1.
+  """
+  path: Optional[str]
+  line: int
+  column: int
+
+  def __str__(self) -> str:
+    return '{p}:{l}:{c}'.format(p=self.path if self.path is not None else '<config>', l=self.line, c=self.column)
+
+
+class MarkedDict(dict):
+  """
+  A mapping loaded from a config file, with the marks of the mapping and of
+  the value of each key.
+  """
+
+  __slots__ = ('mark', 'value_marks')
+
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.mark: Optional[SourceMark] = None
+    self.value_marks: Dict[Any, SourceMark] = dict()
+
+
+def get_mark(serialization: Any) -> Optional[SourceMark]:
+  """
+  Returns the mark of a mapping loaded from a config file, if any.
+  """
+  return serialization.mark if isinstance(serialization, MarkedDict) else None
+
+
+def get_value_mark(serialization: Any, key: Any) -> Optional[SourceMark]:
+  """
+  Returns the mark of the value of a key in a mapping loaded from a config
+  file, if any.
+  """
+  return serialization.value_marks.get(key) if isinstance(serialization, MarkedDict) else None
+
+
+def _make_mark(loader, node) -> SourceMark:
+  return SourceMark(loader.path, node.start_mark.line + 1, node.start_mark.column + 1)
+
+
+def _construct_marked_mapping(loader, node):
+  mapping = MarkedDict()
+  mapping.mark = _make_mark(loader, node)
+  yield mapping
+  mapping.update(loader.construct_mapping(node))
+  # Merge keys have been flattened into the node, and keys are constructed
+  # objects already.
+  for (key_node, value_node) in node.value:
+    mapping.value_marks[loader.construct_object(key_node)] = _make_mark(loader, value_node)
+
+
+@functools.lru_cache(maxsize=None)
+def get_loader_class(uses_libyaml: Optional[bool] = None) -> type:
+  """
+  Returns the class loading config files: a safe loader keeping the marks of
+  mappings. It is built on libyaml when PyYAML has it, unless told not to.
+  """
+  import yaml
+
+  if uses_libyaml is None:
+    uses_libyaml = hasattr(yaml, 'CSafeLoader')
+
+  base = yaml.CSafeLoader if uses_libyaml else yaml.SafeLoader
+
+  class _MarkedLoader(base):
+    pass
+
+  _MarkedLoader.add_constructor(yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG, _construct_marked_mapping)
+  return _MarkedLoader
+
+
+def load_config(contents: bytes, path: Optional[str] = None, uses_libyaml: Optional[bool] = None) -> Any:
+  """
+  Loads the contents of a config file as `yaml.safe_load` does, with
+  mappings loaded as MarkedDict.
+  """
+  loader = get_loader_class(uses_libyaml)(contents)
+  loader.path = path
+  try:
+    return loader.get_single_data()
+  finally:
+    loader.dispose()
@@ -7,6 +7,8 @@ from BeanPorter.bpcml.Exprs import Expr
 
 class Decl(object):
 
+  __slots__ = ()
+
   def __init__(self):
     pass
   
@@ -15,6 +17,8 @@ class Decl(object):
     pass
 
 class RuleDecl(Decl):
+
+  __slots__ = ('expr',)
   
   def __init__(self, expr: Optional[Expr] = None):
     self.expr = expr
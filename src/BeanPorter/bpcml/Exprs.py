@@ -11,6 +11,8 @@ def _make_indents(indent: int) -> str:
 
 class AnyExpr(object):
 
+  __slots__ = ()
+
   def __init__(self):
     pass
   
@@ -27,6 +29,8 @@ class AnyExpr(object):
 
 class Expr(AnyExpr):
 
+  __slots__ = ('child',)
+
   def __init__(self, child: Optional['Expr'] = None):
     self.child = child
 
@@ -61,6 +65,8 @@ class Expr(AnyExpr):
     return Expr(child)
 
 class CompoundElement(object):
+
+  __slots__ = ()
   
   @abstractmethod
   def evaluate(self, variables: Dict[str, str]) -> str:
@@ -68,6 +74,8 @@ class CompoundElement(object):
 
 class CompoundElementExpr(CompoundElement):
 
+  __slots__ = ('expr',)
+
   def __init__(self, expr: Expr):
     assert(isinstance(expr, Expr))
     self.expr = expr
@@ -83,6 +91,8 @@ class CompoundElementExpr(CompoundElement):
 
 class CompoundElementSpace(CompoundElement):
 
+  __slots__ = ('token',)
+
   def __init__(self, token: Token):
     assert(token.kind == TokenKind.Space)
     self.token = token
@@ -94,6 +104,8 @@ class CompoundElementSpace(CompoundElement):
     return self.token.contents
 
 class CompoundExpr(AnyExpr):
+
+  __slots__ = ('elements',)
   
   def __init__(self, elements: List[CompoundElement] = {}):
     self.elements = elements
@@ -139,6 +151,8 @@ class CompoundExpr(AnyExpr):
 
 class ValueExpr(AnyExpr):
 
+  __slots__ = ()
+
   @staticmethod
   def make_paren(
     left_paren: Token, 
@@ -152,6 +166,8 @@ class ValueExpr(AnyExpr):
     return child
 
 class ParenExpr(ValueExpr):
+
+  __slots__ = ('left_paren', 'child', 'right_paren')
   
   def __init__(self, left_paren: Token, child: Expr, right_paren: Token):
     self.left_paren = left_paren
@@ -176,9 +192,14 @@ class ParenExpr(ValueExpr):
     )
 
 class FuncArgListElement(object):
+
+  __slots__ = ()
+
   pass
 
 class FuncArg(FuncArgListElement):
+
+  __slots__ = ('value_expr',)
   
   def __init__(self, value_expr: ValueExpr):
     assert(isinstance(value_expr, ValueExpr))
@@ -194,6 +215,8 @@ class FuncArg(FuncArgListElement):
     return '{}'.format(self.value_expr._recursive_description(indent))
 
 class FuncArgSeparator(FuncArgListElement):
+
+  __slots__ = ('space1', 'comma', 'space2')
   
   def __init__(self, space1: Token, comma: Token, space2: Token):
     assert(isinstance(space1, Token))
@@ -211,6 +234,8 @@ class FuncArgSeparator(FuncArgListElement):
 
 class FuncArgListExpr(AnyExpr):
 
+  __slots__ = ('elements',)
+
   def __init__(self, elements: List[FuncArgListElement] = {}):
     for each_element in elements:
       assert(isinstance(each_element, FuncArgListElement))
@@ -266,6 +291,8 @@ class FuncArgListExpr(AnyExpr):
     return FuncArgListExpr(elements)
 
 class FuncCallExpr(ValueExpr):
+
+  __slots__ = ('at_sign', 'func_name', 'left_paren', 'func_arg_list', 'right_paren', 'func')
   
   def __init__(
     self,
@@ -310,6 +337,8 @@ class FuncCallExpr(ValueExpr):
 
 class StrLitExpr(ValueExpr):
 
+  __slots__ = ('token',)
+
   def __init__(self, token: Token):
     assert(token.kind == TokenKind.StringLiteral)
     self.token = token
@@ -332,6 +361,8 @@ class StrLitExpr(ValueExpr):
 
 class NumExpr(ValueExpr):
 
+  __slots__ = ('token',)
+
   def __init__(self, token: Token):
     assert(token.kind == TokenKind.NumericLiteral)
     self.token = token
@@ -354,6 +385,8 @@ class NumExpr(ValueExpr):
 
 class BoolExpr(ValueExpr):
 
+  __slots__ = ('token',)
+
   def __init__(self, token: Token):
     assert(token.kind == TokenKind.BoolLiteral)
     self.token = token
@@ -376,6 +409,8 @@ class BoolExpr(ValueExpr):
 
 class VarRefExpr(ValueExpr):
 
+  __slots__ = ('leading_dollar', 'var_name', 'trailing_dollar')
+
   def __init__(
     self, 
     leading_dollar: Token, 
@@ -416,6 +451,8 @@ class VarRefExpr(ValueExpr):
 
 class ArithmeticExpr(ValueExpr):
 
+  __slots__ = ('prefix_operator', 'child')
+
   def __init__(self, prefix_operator: Token, child: Union[NumExpr, VarRefExpr]):
     self.prefix_operator = prefix_operator
     self.child = child
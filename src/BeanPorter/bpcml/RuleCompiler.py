@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+from typing import Callable, List, Mapping, Optional, Union
+
+import operator
+
+from BeanPorter.bpcml.Decls import RuleDecl
+from BeanPorter.bpcml.Exprs import AnyExpr, ArithmeticExpr, BoolExpr, CompoundElementExpr, CompoundElementSpace, CompoundExpr
+from BeanPorter.bpcml.Exprs import Expr, FuncArg, FuncCallExpr, NumExpr, ParenExpr, StrLitExpr, VarRefExpr
+from BeanPorter.bpcml.Token import TokenKind
+
+# A compiled rule evaluates a row directly, without looking variables up by
+# name.
+CompiledRule = Callable[[List[str]], str]
+
+
+class _Const(object):
+  """
+  A part of a rule known at compile time.
+  """
+
+  def __init__(self, value: str):
+    self.value = value
+
+
+class _Slot(object):
+  """
+  A part of a rule reading the cell at a row slot.
+  """
+
+  def __init__(self, index: int):
+    self.index = index
+
+
+# Lowered parts of a rule: constants, row slots and generic callables.
+_Part = Union[_Const, _Slot, CompiledRule]
+
+
+def compile_rule(rule: RuleDecl, variable_slots: Mapping[str, int]) -> CompiledRule:
+  """
+  Lowers a rule into one flat callable evaluating a row.
+
+  Variable references are resolved to row slots ahead of time, and compound
+  expressions made of constants and variables are turned into a single
+  format template. The result evaluates rows the same as `RuleDecl.evaluate`
+  evaluates their variables.
+  """
+  assert(isinstance(rule, RuleDecl))
+  if rule.expr is None:
+    return _make_callable(_Const(''))
+  return _make_callable(_lower(rule.expr, variable_slots))
+
+
+def fold_rule(rule: RuleDecl) -> Optional[str]:
+  """
+  Folds a rule into the constant it evaluates to for every row, or returns
+  None if the rule reads variables.
+  """
+  assert(isinstance(rule, RuleDecl))
+  if rule.expr is None:
+    return ''
+  part = _lower(rule.expr, dict())
+  if isinstance(part, _Const):
+    return part.value
+  return None
+
+
+def _make_callable(part: _Part) -> CompiledRule:
+  if isinstance(part, _Const):
+    value = part.value
+    return lambda row: value
+  if isinstance(part, _Slot):
+    return operator.itemgetter(part.index)
+  return part
+
+
+def _lower(expr: AnyExpr, variable_slots: Mapping[str, int]) -> _Part:
+  if isinstance(expr, CompoundExpr):
+    return _lower_compound(expr, variable_slots)
+
+  if isinstance(expr, Expr):
+    if expr.child is None:
+      return _Const('')
+    return _lower(expr.child, variable_slots)
+
+  if isinstance(expr, (StrLitExpr, NumExpr)):
+    return _Const(expr.token.contents)
+
+  if isinstance(expr, BoolExpr):
+    return _Const('{}'.format(expr.token.contents))
+
+  if isinstance(expr, VarRefExpr):
+    return _lower_var_ref(expr, variable_slots)
+
+  if isinstance(expr, ParenExpr):
+    return _lower(expr.child, variable_slots)
+
+  if isinstance(expr, ArithmeticExpr):
+    return _lower_arithmetic(expr, variable_slots)
+
+  if isinstance(expr, FuncCallExpr):
+    return _lower_func_call(expr, variable_slots)
+
+  raise Exception('Unexpected expression: {!r}'.format(expr))
+
+
+def _lower_compound(expr: CompoundExpr, variable_slots: Mapping[str, int]) -> _Part:
+  parts: List[_Part] = list()
+
+  for each_element in expr.elements:
+    if isinstance(each_element, CompoundElementSpace):
+      part: _Part = _Const(each_element.token.contents)
+    else:
+      assert(isinstance(each_element, CompoundElementExpr))
+      part = _lower(each_element.expr, variable_slots)
+
+    # Merge adjacent constants.
+    if isinstance(part, _Const) and len(parts) > 0 and isinstance(parts[-1], _Const):
+      parts[-1] = _Const(parts[-1].value + part.value)
+    else:
+      parts.append(part)
+
+  if len(parts) == 0:
+    return _Const('')
+
+  if len(parts) == 1:
+    return parts[0]
+
+  if all([isinstance(p, (_Const, _Slot)) for p in parts]):
+    return _make_template(parts)
+
+  callables = [_make_callable(p) for p in parts]
+  return lambda row: ''.join([c(row) for c in callables])
+
+
+def _make_template(parts: List[_Part]) -> CompiledRule:
+  template = ''.join(['{}' if isinstance(p, _Slot) else p.value.replace('{', '{{').replace('}', '}}') for p in parts])
+  slot_indices = [p.index for p in parts if isinstance(p, _Slot)]
+  render = template.format
+
+  if len(slot_indices) == 1:
+    slot_index = slot_indices[0]
+    return lambda row: render(row[slot_index])
+
+  get_cells = operator.itemgetter(*slot_indices)
+  return lambda row: render(*get_cells(row))
+
+
+def _lower_var_ref(expr: VarRefExpr, variable_slots: Mapping[str, int]) -> _Part:
+  variable_name = expr.var_name.contents
+  slot_index = variable_slots.get(variable_name)
+
+  if slot_index is not None:
+    return _Slot(slot_index)
+
+  # Fail at evaluation time as the interpreter does.
+  def raise_unbound_variable(row: List[str]) -> str:
+    raise KeyError(variable_name)
+
+  return raise_unbound_variable
+
+
+def _lower_arithmetic(expr: ArithmeticExpr, variable_slots: Mapping[str, int]) -> _Part:
+  child = _lower(expr.child, variable_slots)
+
+  if expr.prefix_operator.kind == TokenKind.Plus:
+    return child
+
+  if expr.prefix_operator.kind == TokenKind.Minus:
+    if isinstance(child, _Const):
+      return _Const('-' + child.value)
+    get_child = _make_callable(child)
+    return lambda row: '-' + get_child(row)
+
+  raise Exception('Unexpected token kind: {}'.format(expr.prefix_operator.kind))
+
+
+def _lower_func_call(expr: FuncCallExpr, variable_slots: Mapping[str, int]) -> _Part:
+  arg_parts = [_lower(e.value_expr, variable_slots) for e in expr.func_arg_list.elements if isinstance(e, FuncArg)]
+  evaluate = expr.func.evaluate
+
+  # Calls of pure builtin functions on constants are folded. Calls failing
+  # are left to fail at evaluation time.
+  if expr.func.is_pure and all([isinstance(p, _Const) for p in arg_parts]):
+    try:
+      return _Const(evaluate([p.value for p in arg_parts]))
+    except Exception:
+      pass
+
+  args = [_make_callable(p) for p in arg_parts]
+  return lambda row: evaluate([a(row) for a in args])
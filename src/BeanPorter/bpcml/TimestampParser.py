@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+from typing import List, Optional
+
+import datetime
+import functools
+
+# Formats tried when learning the format of timestamps. Only year-first
+# formats are listed, where strict parsing agrees with dateutil.
+CANDIDATE_FORMATS: List[str] = [
+  '%Y-%m-%d %H:%M:%S',
+  '%Y/%m/%d %H:%M:%S',
+  '%Y-%m-%d %H:%M:%S.%f',
+  '%Y/%m/%d %H:%M:%S.%f',
+  '%Y-%m-%dT%H:%M:%S',
+  '%Y-%m-%d %H:%M',
+  '%Y/%m/%d %H:%M',
+  '%Y-%m-%d',
+  '%Y/%m/%d',
+]
+
+DEFAULT_MEMO_CAPACITY = 64 * 1024
+
+
+class TimestampParser(object):
+  """
+  Parses timestamps as `dateutil.parser.parse` does, fast.
+
+  The format of timestamps is learned from the first one parsed, checked
+  against dateutil, then used with `datetime.strptime`. A timestamp not in
+  the learned format falls back to dateutil and the format is learned
+  again. Results are memoized, so each distinct string is parsed once.
+
+  A parser may be shared by threads: the memo is thread-safe, and a format
+  is only ever replaced by another one checked against dateutil. Parsers
+  are owned by what parses timestamps of one kind, a ruleset or a builtin
+  function call, so no format is learned across unrelated files.
+  """
+
+  def __init__(self, memo_capacity: int = DEFAULT_MEMO_CAPACITY):
+    self.memo_capacity = memo_capacity
+    self.learned_format: Optional[str] = None
+    self.parse = functools.lru_cache(maxsize=memo_capacity)(self._parse)
+
+  def __getstate__(self):
+    # The memo is not picklable. Parsers are pickled with compiled configs
+    # and start over once unpickled.
+    return self.memo_capacity
+
+  def __setstate__(self, state):
+    self.__init__(state)
+
+  def _parse(self, string: str) -> datetime.datetime:
+    learned_format = self.learned_format
+
+    if learned_format is not None:
+      try:
+        return datetime.datetime.strptime(string, learned_format)
+      except ValueError:
+        pass
+
+    # Loaded on demand: timestamps in the learned format need no dateutil.
+    import dateutil.parser
+
+    timestamp = dateutil.parser.parse(string)
+    self.learned_format = TimestampParser._learn_format(string, timestamp)
+    return timestamp
+
+  @staticmethod
+  def _learn_format(string: str, timestamp: datetime.datetime) -> Optional[str]:
+    for each_format in CANDIDATE_FORMATS:
+      try:
+        if datetime.datetime.strptime(string, each_format) == timestamp:
+          return each_format
+      except ValueError:
+        continue
+    return None
@@ -46,6 +46,8 @@ class TokenKind(enum.IntEnum):
 
 class Token(object):
 
+  __slots__ = ('kind', 'contents')
+
   def __init__(self, kind: TokenKind, contents: str):
     assert(isinstance(kind, TokenKind))
     assert(isinstance(contents, str), 'contents is type: {}'.format(type(contents)))
@@ -3,6 +3,7 @@
 from typing import Union, List, Optional
 
 import re
+import threading
 
 from BeanPorter.bpcml.Token import Token
 
@@ -11,11 +12,22 @@ class Tokenizer(object):
 
   _TOKEN_PATTERNS: Optional[re.Pattern] = None
 
+  # Guards the lazy compilation of token patterns across threads.
+  _TOKEN_PATTERNS_LOCK = threading.Lock()
+
   @staticmethod
   def _get_token_patterns() -> re.Pattern:
-    if Tokenizer._TOKEN_PATTERNS is not None:
+    token_patterns = Tokenizer._TOKEN_PATTERNS
+    if token_patterns is not None:
+      return token_patterns
+
+    with Tokenizer._TOKEN_PATTERNS_LOCK:
+      if Tokenizer._TOKEN_PATTERNS is None:
+        Tokenizer._TOKEN_PATTERNS = Tokenizer._compile_token_patterns()
       return Tokenizer._TOKEN_PATTERNS
 
+  @staticmethod
+  def _compile_token_patterns() -> re.Pattern:
     space           = "(?P<space>\s+)"
     plus            = "(?P<plus>\+)"
     minus           = "(?P<minus>\-)"
@@ -44,11 +56,7 @@ class Tokenizer(object):
     patterns.append(numeric_literal)
     patterns.append(string_literal)
 
-    token_patterns = re.compile("|".join(patterns))
-
-    Tokenizer._TOKEN_PATTERNS = token_patterns
-
-    return token_patterns
+    return re.compile("|".join(patterns))
 
   def make_tokens(self, contents: Union[str, bool]) -> List[Token]:
     if isinstance(contents, bool):
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from BeanPorter.bpcml.BPCML import Importer
+from BeanPorter.BeanChunkedEvaluation import iter_chunks, iter_evaluate_chunks, iter_evaluate_rows
+from BeanPorter.BeanExtractRuleset import BeanExtractRuleset
+
+from TestSupport import BILL_HEADER as HEADER, BILL_TRANSFORMERS, BILL_VARIABLES, make_importer
+
+
+ROWS = [
+  ['全家', '交易成功', '{}.00'.format(i), '2021-10-{:02} 12:00:00'.format(i % 28 + 1)] if i % 3 != 0 else
+  ['罗森', '交易关闭', '{}.00'.format(i), '2021-11-{:02} 08:30:00'.format(i % 28 + 1)]
+  for i in range(50)
+]
+
+
+TRANSFORMERS = BILL_TRANSFORMERS + [
+  {'patterns': {'status': '交易关闭'}, 'rules': {'complete': True, 'debit_account': 'Expenses:Closed', 'debit_amount': '$amount', 'credit_account': 'Assets:Cash', 'credit_amount': '-$amount'}},
+]
+
+
+class BeanChunkedEvaluationTests(unittest.TestCase):
+
+  def test_chunks_cover_rows_in_order(self):
+    chunks = list(iter_chunks(ROWS, 16))
+    self.assertEqual([len(c) for c in chunks], [16, 16, 16, 2])
+    self.assertEqual([r for c in chunks for r in c], ROWS)
+
+  def test_same_transactions_as_serial_evaluation(self):
+    for engine in ['row', 'columnar']:
+      importer = make_importer(TRANSFORMERS, BILL_VARIABLES, engine=engine)
+      ruleset = BeanExtractRuleset.make(importer, HEADER)
+
+      expected = list(iter_evaluate_rows(importer, HEADER, ruleset, ROWS, '*'))
+      self.assertEqual(len(expected), len(ROWS))
+
+      for chunk_size in [7, 50]:
+        actual = list(iter_evaluate_chunks(importer, HEADER, ruleset, ROWS, '*', 2, chunk_size))
+        self.assertEqual(actual, expected)
+
+  def test_importer_validates_jobs(self):
+    with self.assertRaises(AssertionError):
+      Importer.make_importer({'name': 'Test', 'jobs': 0})
+    with self.assertRaises(AssertionError):
+      Importer.make_importer({'name': 'Test', 'chunk_size': 'all'})
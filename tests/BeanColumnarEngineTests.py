@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from BeanPorter.BeanColumnarEngine import BeanColumnarEngine, import_numpy
+from BeanPorter.BeanExtractContext import BeanExtractContext
+from BeanPorter.BeanExtractRuleset import BeanExtractRuleset
+
+from TestSupport import BILL_HEADER as HEADER, BILL_TRANSFORMERS, BILL_VARIABLES, make_importer
+
+
+ROWS = [
+  ['全家', '交易成功', '12.00', '2021-10-01 12:00:00'],
+  ['全家便利店', '交易成功', '3.50', '2021-10-02 08:30:00'],
+  ['罗森', '交易关闭', '7.00', '2021-10-03 09:00:00'],
+  ['罗森', '交易成功', '1.00', '2021-10-04 10:00:00'],
+  ['美团', '退款成功', '20.00', '2021-10-05 11:00:00'],
+]
+
+
+TRANSFORMERS = BILL_TRANSFORMERS + [
+  {'patterns': {'status': "r'.*成功'"}, 'rules': {'complete': True, 'payee': 'Refund'}},
+  {'patterns': {'status': '交易关闭'}, 'rules': {'complete': False}},
+  {'patterns': {'status': '交易成功', 'counterparty': '全家'}, 'rules': {'debit_account': 'Expenses:Food', 'payee': 'FamilyMart'}},
+  {'patterns': {'status': '交易成功', 'counterparty': '全家便利'}, 'rules': {'debit_account': 'Expenses:Snack'}},
+  {'patterns': None, 'rules': {'payee': 'Nobody', 'time': '@time($time)'}},
+]
+
+
+class BeanColumnarEngineTests(unittest.TestCase):
+
+  def _assert_same_as_rows(self, evaluator, uses_numpy):
+    importer = make_importer(TRANSFORMERS, BILL_VARIABLES, evaluator=evaluator)
+    ruleset = BeanExtractRuleset.make(importer, HEADER)
+    context = BeanExtractContext('*', importer, HEADER, ruleset)
+
+    expected = [context.evaluate(r, '*') for r in ROWS]
+    actual = list(BeanColumnarEngine(ruleset, batch_size=2, uses_numpy=uses_numpy).iter_evaluate_rows(ROWS, '*'))
+
+    self.assertEqual(actual, expected)
+    self.assertEqual(len([t for t in actual if t is not None]), 4)
+
+  def test_same_transactions_as_row_engine(self):
+    for evaluator in ['compiler', 'interpreter']:
+      self._assert_same_as_rows(evaluator, False)
+
+  @unittest.skipIf(import_numpy() is None, 'NumPy is not installed')
+  def test_same_transactions_as_row_engine_with_numpy(self):
+    for evaluator in ['compiler', 'interpreter']:
+      self._assert_same_as_rows(evaluator, True)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+import datetime
+import unittest
+
+from beancount.core import data
+from beancount.core.amount import Amount
+from beancount.core.number import D
+from beancount.ingest.extract import DUPLICATE_META
+
+from BeanPorter.BeanDuplicateIndex import BeanDuplicateIndex, normalize_payee
+
+
+def _make_txn(day: int, payee: str, debit_account: str, number: str, fingerprint=None) -> data.Transaction:
+  meta = data.new_metadata('', 0)
+  if fingerprint is not None:
+    meta['fingerprint'] = fingerprint
+  postings = [
+    data.Posting(debit_account, Amount(D(number), 'CNY'), None, None, None, None),
+    data.Posting('Assets:Cash', Amount(-D(number), 'CNY'), None, None, None, None),
+  ]
+  return data.Transaction(meta, datetime.date(2021, 10, day), '*', payee, 'Bill', set(), set(), postings)
+
+
+class BeanDuplicateIndexTests(unittest.TestCase):
+
+  def test_normalizes_payees(self):
+    self.assertEqual(normalize_payee('  Family  Mart '), 'family mart')
+    self.assertEqual(normalize_payee(None), '')
+
+  def test_finds_duplicates_by_fingerprint_or_posting(self):
+    index = BeanDuplicateIndex.make([
+      _make_txn(1, 'FamilyMart', 'Expenses:Food', '12.00'),
+      _make_txn(2, 'Lawson', 'Expenses:Food', '7.00', 'T2'),
+      data.Open(data.new_metadata('', 0), datetime.date(2021, 1, 1), 'Assets:Cash', None, None),
+    ])
+
+    # Categorized in the ledger, still sharing the cash posting.
+    self.assertTrue(index.is_duplicate(_make_txn(1, 'familymart ', 'Expenses:Unknown', '12.0')))
+    self.assertTrue(index.is_duplicate(_make_txn(3, 'Renamed', 'Expenses:Unknown', '1.00', 'T2')))
+
+    self.assertFalse(index.is_duplicate(_make_txn(2, 'FamilyMart', 'Expenses:Food', '12.00')))
+    self.assertFalse(index.is_duplicate(_make_txn(1, 'FamilyMart', 'Expenses:Food', '12.50')))
+    self.assertFalse(index.is_duplicate(_make_txn(1, 'Lawson', 'Expenses:Food', '12.00', 'T3')))
+
+  def test_flags_or_drops_duplicates(self):
+    index = BeanDuplicateIndex.make([_make_txn(1, 'FamilyMart', 'Expenses:Food', '12.00')])
+    txns = [_make_txn(1, 'FamilyMart', 'Expenses:Food', '12.00'), _make_txn(2, 'Lawson', 'Expenses:Food', '7.00')]
+
+    flagged = index.apply(txns, 'flag')
+    self.assertEqual([t.meta.get(DUPLICATE_META, False) for t in flagged], [True, False])
+    self.assertNotIn(DUPLICATE_META, txns[0].meta)
+
+    dropped = index.apply(txns, 'drop')
+    self.assertEqual([t.payee for t in dropped], ['Lawson'])
+
+    with self.assertRaises(AssertionError):
+      index.apply(txns, 'unknown')
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from TestSupport import make_context
+
+
+class BeanExtractContextTests(unittest.TestCase):
+
+  def test_only_winning_rules_are_evaluated(self):
+    for evaluator in ['compiler', 'interpreter']:
+      context = make_context([
+        {'patterns': None, 'rules': {'payee': '$unknown', 'debit_currency': 'CNY'}},
+        {'patterns': {'status': '成功'}, 'rules': {'payee': '$unknown'}},
+        {'patterns': {'status': '成功', 'counterparty': '全家'}, 'rules': {'payee': '$counterparty'}},
+        {'patterns': {'status': '成功', 'counterparty': '全'}, 'rules': {'payee': '$unknown'}},
+      ], evaluator=evaluator)
+
+      self.assertIsNone(context.evaluate(['全家', '成功'], '*'))
+      self.assertEqual(context.get_value('payee'), '全家')
+      self.assertEqual(context.get_value('debit_currency'), 'CNY')
+
+  def test_transformers_list_defined_keys(self):
+    context = make_context([
+      {'patterns': None, 'rules': {'payee': 'A', 'debit_currency': 'CNY'}},
+    ])
+    self.assertEqual(context.importer.transformers[0].keys, ['payee', 'debit_currency'])
+
+  def test_state_is_reset_between_rows(self):
+    context = make_context([
+      {'patterns': None, 'rules': {'debit_currency': 'CNY'}},
+      {'patterns': {'status': '成功'}, 'rules': {'payee': '$counterparty', 'debit_currency': 'USD'}},
+    ])
+    state = context.state
+
+    context.evaluate(['全家', '成功'], '*')
+    self.assertEqual((context.get_value('payee'), context.get_value('debit_currency')), ('全家', 'USD'))
+
+    context.evaluate(['罗森', '关闭'], '*')
+    self.assertEqual((context.get_value('payee'), context.get_value('debit_currency')), (None, 'CNY'))
+    self.assertIs(context.state, state)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+import concurrent.futures
+import tempfile
+import unittest
+
+from beancount.ingest import cache
+
+from BeanPorter.bpcml.BPCML import BPCML
+from BeanPorter.BeanExtractImporter import BeanExtractImporter
+from BeanPorter.BeanFileDecoder import BeanDecodedContentsCache
+
+from TestSupport import BILL_TRANSFORMERS, BILL_VARIABLES, make_importer, write_file
+
+
+TRANSFORMERS = BILL_TRANSFORMERS + [
+  {'patterns': {'status': '交易成功', 'counterparty': '全家'}, 'rules': {'debit_account': 'Expenses:Food', 'time': '@time($time)'}},
+]
+
+
+class BeanExtractImporterTests(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    self.temp_dir.cleanup()
+
+  def test_threads_extract_same_transactions(self):
+    paths = list()
+    for i in range(4):
+      lines = ['Counterparty,Status,Amount,Time']
+      for j in range(200):
+        counterparty = '全家' if j % 2 == 0 else '罗森'
+        status = '交易成功' if j % 3 != 0 else '交易关闭'
+        lines.append('{c},{s},{a}.00,2021-{m:02}-{d:02} 12:{j:02}:00'.format(c=counterparty, s=status, a=i * 1000 + j, m=i + 1, d=j % 28 + 1, j=j % 60))
+      paths.append(write_file(self.temp_dir.name, 'bill_{}.csv'.format(i), '\n'.join(lines) + '\n'))
+
+    expected = [BeanExtractImporter(make_importer(TRANSFORMERS, BILL_VARIABLES, encoding='utf-8')).extract(cache.get_file(p)) for p in paths]
+
+    # Threads share one importer, its rulesets and its contents cache.
+    shared_importer = BeanExtractImporter(make_importer(TRANSFORMERS, BILL_VARIABLES, encoding='utf-8'), BeanDecodedContentsCache())
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+      futures = [(i % len(paths), executor.submit(shared_importer.extract, cache.get_file(paths[i % len(paths)]))) for i in range(64)]
+      for (path_index, each_future) in futures:
+        self.assertEqual(each_future.result(), expected[path_index])
+
+    self.assertEqual(len(shared_importer._rulesets), 1)
+
+  def test_unnamed_importers_are_named_per_config(self):
+    path = write_file(self.temp_dir.name, 'config.yaml', 'importers:\n  - encoding: utf-8\n  - encoding: utf-8\n')
+
+    for _ in range(2):
+      config = BPCML.make_with_serialization_at_path(path)
+      config.resolve()
+      self.assertEqual([i.name for i in config.importers], ['Default', 'Default-1'])
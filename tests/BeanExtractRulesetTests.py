@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from BeanPorter.BeanExtractRuleset import BeanExtractRuleset
+from BeanPorter.BeanTransformerPlan import make_pattern_matcher
+
+from TestSupport import STATUS_HEADER, make_importer
+
+
+class BeanExtractRulesetTests(unittest.TestCase):
+
+  def test_literal_pattern_matches_prefix(self):
+    matcher = make_pattern_matcher('交易成功')
+    self.assertTrue(matcher('交易成功'))
+    self.assertTrue(matcher('交易成功(已退款)'))
+    self.assertFalse(matcher('未交易成功'))
+
+  def test_literal_pattern_is_not_regex(self):
+    matcher = make_pattern_matcher('a.c')
+    self.assertTrue(matcher('a.c'))
+    self.assertFalse(matcher('abc'))
+
+  def test_regex_pattern_matches_at_beginning(self):
+    matcher = make_pattern_matcher("r'a.c'")
+    self.assertTrue(matcher('abcd'))
+    self.assertFalse(matcher('zabc'))
+
+  def test_plans_resolve_columns_once(self):
+    importer = make_importer([
+      {'patterns': None, 'rules': {'payee': 'A'}},
+      {'patterns': {'status': '成功'}, 'rules': {'payee': 'B'}},
+      {'patterns': {'status': '成功', 'counterparty_name': "r'全家\\d'"}, 'rules': {'payee': 'C'}},
+    ])
+    ruleset = BeanExtractRuleset.make(importer, STATUS_HEADER)
+
+    row = ['全家1', '成功']
+    self.assertEqual([p.matches(row) for p in ruleset.transformer_plans], [True, True, True])
+    self.assertEqual([c for (c, _) in ruleset.transformer_plans[2].pattern_matchers], [1, 0])
+
+    row = ['全家', '成功']
+    self.assertEqual([p.matches(row) for p in ruleset.transformer_plans], [True, True, False])
+
+  def test_plan_with_unknown_term_never_matches(self):
+    importer = make_importer([
+      {'patterns': {'unknown': 'x'}, 'rules': {'payee': 'A'}},
+    ])
+    ruleset = BeanExtractRuleset.make(importer, ['Status', 'Counterparty'])
+    self.assertFalse(ruleset.transformer_plans[0].matches(['x', 'x']))
+
+  def test_row_variables_view_rows_through_binding(self):
+    importer = make_importer([])
+    ruleset = BeanExtractRuleset.make(importer, ['Counterparty', 'Other', 'Status'])
+    variables = ruleset.make_row_variables()
+
+    variables.row = ['全家', 'x', '成功']
+    self.assertEqual(dict(variables), {'status': '成功', 'counterparty': '全家'})
+
+    variables.row = ['罗森', 'y', '关闭']
+    self.assertEqual(variables['counterparty'], '罗森')
+    self.assertEqual(len(variables), 2)
+
+  def test_missing_columns_are_reported_once_at_bind_time(self):
+    importer = make_importer([
+      {'patterns': {'status': 'x'}, 'rules': {'payee': 'A'}},
+      {'patterns': {'counterparty': 'x'}, 'rules': {'payee': 'B'}},
+    ])
+
+    with self.assertLogs(level='ERROR') as logs:
+      ruleset = BeanExtractRuleset.make(importer, ['Counterparty'])
+    self.assertEqual(len(logs.records), 1)
+    self.assertIn("'Status'", logs.output[0])
+
+    self.assertEqual([p.matches(['x']) for p in ruleset.transformer_plans], [False, True])
+    self.assertNotIn('status', ruleset.make_row_variables())
+
+  def test_unconditional_transformers_are_hoisted(self):
+    importer = make_importer([
+      {'patterns': None, 'rules': {'debit_currency': 'CNY', 'payee': '$counterparty'}},
+      {'patterns': {'status': '成功'}, 'rules': {'complete': True}},
+      {'patterns': None, 'rules': {'debit_currency': 'USD', 'credit_currency': 'CNY', 'payee': 'Nobody'}},
+    ])
+    ruleset = BeanExtractRuleset.make(importer, STATUS_HEADER)
+
+    self.assertEqual({k: v for (k, (v, _)) in ruleset.prototype_values.items()}, {'debit_currency': 'CNY', 'credit_currency': 'CNY'})
+    self.assertEqual([(k, e(['全家', '成功'])) for (k, e, _) in ruleset.unconditional_rules], [('payee', '全家')])
+    self.assertEqual([p.index for p in ruleset.dispatcher.get_matching_plans(['全家', '成功'])], [1])
+
+  def test_interpreter_does_not_hoist_transformers(self):
+    importer = make_importer([
+      {'patterns': None, 'rules': {'debit_currency': 'CNY'}},
+    ], evaluator='interpreter')
+    ruleset = BeanExtractRuleset.make(importer, STATUS_HEADER)
+
+    self.assertEqual(ruleset.prototype_values, {})
+    self.assertEqual([p.index for p in ruleset.dispatcher.get_matching_plans(['全家', '成功'])], [0])
+
+  def test_rulesets_learn_timestamp_formats_apart(self):
+    importer = make_importer([])
+    rulesets = [BeanExtractRuleset.make(importer, STATUS_HEADER) for _ in range(2)]
+    rulesets[0].timestamp_parser.parse('2021-10-01 12:34:56')
+    rulesets[1].timestamp_parser.parse('2021/10/01 12:34')
+    self.assertEqual([r.timestamp_parser.learned_format for r in rulesets], ['%Y-%m-%d %H:%M:%S', '%Y/%m/%d %H:%M'])
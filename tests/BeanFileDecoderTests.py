@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+import os
+import pickle
+import tempfile
+import unittest
+from unittest import mock
+
+import chardet
+
+from BeanPorter import BeanFileDecoder
+from BeanPorter.BeanCache import CACHE_DIRECTORY_ENVIRONMENT_VARIABLE
+from BeanPorter.BeanFileDecoder import BeanDecodedContentsCache, BeanDecodedFile, BeanEncodingCache
+from BeanPorter.BeanFileDecoder import detect_encoding, hash_file
+
+from TestSupport import write_file
+
+
+class BeanFileDecoderTests(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    self.temp_dir.cleanup()
+
+  def test_detects_encoding_from_bounded_sample(self):
+    contents = '交易时间,金额\n'.encode('gb18030') * 20000
+    path = write_file(self.temp_dir.name, 'bill.csv', contents)
+    self.assertGreater(len(contents), BeanFileDecoder.HEAD_DETECT_MAX_BYTES)
+
+    detected_samples = []
+    detect = chardet.detect
+
+    def spy_detect(sample):
+      detected_samples.append(sample)
+      return detect(sample)
+
+    with mock.patch.object(chardet, 'detect', spy_detect):
+      (encoding, content_hash) = detect_encoding(path)
+
+    self.assertEqual(encoding, 'gb18030')
+    self.assertIsNone(content_hash)
+    self.assertEqual(len(detected_samples), 1)
+    self.assertEqual(len(detected_samples[0]), BeanFileDecoder.HEAD_DETECT_MAX_BYTES)
+
+  def test_cached_encoding_skips_detection(self):
+    path = write_file(self.temp_dir.name, 'bill.csv', 'a,b\n'.encode('utf-8'))
+    cache_path = os.path.join(self.temp_dir.name, 'encodings.json')
+
+    encoding_cache = BeanEncodingCache(cache_path)
+    encoding_cache.set(hash_file(path), 'gb18030')
+
+    with mock.patch.object(chardet, 'detect') as detect:
+      (encoding, _) = detect_encoding(path, BeanEncodingCache(cache_path))
+      detect.assert_not_called()
+
+    self.assertEqual(encoding, 'gb18030')
+
+  def test_detected_encoding_is_cached(self):
+    path = write_file(self.temp_dir.name, 'bill.csv', '交易时间,金额\n'.encode('gb18030') * 100)
+    cache_path = os.path.join(self.temp_dir.name, 'encodings.json')
+
+    (encoding, content_hash) = detect_encoding(path, BeanEncodingCache(cache_path))
+
+    self.assertEqual(BeanEncodingCache(cache_path).get(content_hash), encoding)
+
+  def test_falls_back_when_a_later_line_cannot_be_decoded(self):
+    contents = b'a,b\n' * 10 + '交易,成功\n'.encode('utf-8')
+    path = write_file(self.temp_dir.name, 'bill.csv', contents)
+
+    with BeanDecodedFile(path, 'ascii', ['utf-8']) as lines:
+      results = list(lines)
+
+    self.assertEqual(results[-1], '交易,成功\n')
+    self.assertEqual(len(results), 11)
+
+  def test_raises_without_fallbacks(self):
+    path = write_file(self.temp_dir.name, 'bill.csv', b'a,b\n' + '交易\n'.encode('utf-8'))
+
+    with BeanDecodedFile(path, 'ascii') as lines:
+      with self.assertRaises(UnicodeDecodeError):
+        list(lines)
+
+  def test_decodes_byte_order_mark_once(self):
+    path = write_file(self.temp_dir.name, 'bill.csv', 'a\r\nb\r\n'.encode('utf-8-sig'))
+
+    with BeanDecodedFile(path, 'utf-8-sig') as lines:
+      self.assertEqual(list(lines), ['a\n', 'b\n'])
+
+  def test_contents_cache_decodes_each_file_once(self):
+    path = write_file(self.temp_dir.name, 'bill.csv', 'a,b\nc,d\n'.encode('utf-8'))
+    contents_cache = BeanDecodedContentsCache(max_cached_file_size=1024, capacity=1024)
+
+    with mock.patch.object(BeanFileDecoder, 'open_decoded', wraps=BeanFileDecoder.open_decoded) as open_decoded:
+      for _ in range(3):
+        with contents_cache.open(path, 'utf-8') as lines:
+          self.assertEqual(list(lines), ['a,b\n', 'c,d\n'])
+      self.assertEqual(open_decoded.call_count, 1)
+
+  def test_contents_cache_is_invalidated_by_modification(self):
+    path = write_file(self.temp_dir.name, 'bill.csv', b'a,b\n')
+    contents_cache = BeanDecodedContentsCache(max_cached_file_size=1024, capacity=1024)
+
+    with contents_cache.open(path, 'utf-8') as lines:
+      self.assertEqual(list(lines), ['a,b\n'])
+
+    write_file(self.temp_dir.name, 'bill.csv', b'c,d\n')
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+    with contents_cache.open(path, 'utf-8') as lines:
+      self.assertEqual(list(lines), ['c,d\n'])
+
+  def test_contents_cache_streams_large_files(self):
+    path = write_file(self.temp_dir.name, 'bill.csv', b'a,b\n' * 100)
+
+    for contents_cache in [BeanDecodedContentsCache(), BeanDecodedContentsCache(max_cached_file_size=16, capacity=1024)]:
+      with mock.patch.object(BeanFileDecoder, 'open_decoded', wraps=BeanFileDecoder.open_decoded) as open_decoded:
+        for _ in range(2):
+          with contents_cache.open(path, 'utf-8') as lines:
+            self.assertEqual(len(list(lines)), 100)
+        self.assertEqual(open_decoded.call_count, 2)
+
+  def test_fallback_decodes_the_whole_file_with_one_codec(self):
+    # Early lines decode with GB18030 into wrong characters; only the last
+    # one tells that the file is UTF-8.
+    contents = '交易,成功\n'.encode('utf-8') * 3 + '中\n'.encode('utf-8')
+    path = write_file(self.temp_dir.name, 'bill.csv', contents)
+    cache_path = os.path.join(self.temp_dir.name, 'encodings.json')
+    expected = ['交易,成功\n'] * 3 + ['中\n']
+
+    with mock.patch.object(chardet, 'detect', return_value={'encoding': 'GB18030'}):
+      for _ in range(2):
+        with BeanFileDecoder.open_decoded(path, None, BeanEncodingCache(cache_path)) as lines:
+          self.assertEqual(list(lines), expected)
+
+    with BeanDecodedFile(path, 'gb18030', ['utf-8']) as lines:
+      self.assertEqual(list(lines), expected)
+
+  def test_cached_encoding_is_trusted(self):
+    path = write_file(self.temp_dir.name, 'bill.csv', '交易,成功\n'.encode('utf-8') * 3)
+    encoding_cache = BeanEncodingCache(os.path.join(self.temp_dir.name, 'encodings.json'))
+    encoding_cache.set(hash_file(path), 'utf-8')
+
+    with mock.patch.object(BeanDecodedFile, '_find_decode_error') as find_decode_error:
+      with BeanFileDecoder.open_decoded(path, None, encoding_cache) as lines:
+        self.assertEqual(list(lines), ['交易,成功\n'] * 3)
+      find_decode_error.assert_not_called()
+
+  def test_cached_encoding_falls_back_while_streaming(self):
+    contents = b'a,b\n' * 3 + '交易,成功\n'.encode('gb18030')
+    path = write_file(self.temp_dir.name, 'bill.csv', contents)
+    encoding_cache = BeanEncodingCache(os.path.join(self.temp_dir.name, 'encodings.json'))
+    encoding_cache.set(hash_file(path), 'utf-8')
+
+    with self.assertLogs(level='WARNING'):
+      with BeanFileDecoder.open_decoded(path, None, encoding_cache) as lines:
+        self.assertEqual(list(lines), ['a,b\n'] * 3 + ['交易,成功\n'])
+
+    self.assertEqual(encoding_cache.get(hash_file(path)), 'gb18030')
+
+  def test_contents_cache_records_encodings_only_in_given_cache(self):
+    path = write_file(self.temp_dir.name, 'bill.csv', '交易时间,金额\n'.encode('gb18030') * 100)
+    default_dir = os.path.join(self.temp_dir.name, 'default')
+
+    with mock.patch.dict(os.environ, {CACHE_DIRECTORY_ENVIRONMENT_VARIABLE: default_dir}):
+      with BeanDecodedContentsCache().open(path, None) as lines:
+        self.assertEqual(len(list(lines)), 100)
+      self.assertFalse(os.path.exists(default_dir))
+
+    encoding_cache = BeanEncodingCache(os.path.join(self.temp_dir.name, 'encodings.json'))
+    with BeanDecodedContentsCache(encoding_cache=pickle.loads(pickle.dumps(encoding_cache))).open(path, None) as lines:
+      self.assertEqual(len(list(lines)), 100)
+    self.assertEqual(BeanEncodingCache(encoding_cache.path).get(hash_file(path)), 'gb18030')
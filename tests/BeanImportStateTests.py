@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+
+from beancount.ingest import cache
+
+from BeanPorter.BeanExtractImporter import BeanExtractImporter
+from BeanPorter.BeanImportState import FINGERPRINT_META_KEY, BeanImportStateStore, hash_row, make_row_fingerprinter
+from BeanPorter.BeanTransformerPlan import BeanHeaderBinding
+
+from TestSupport import make_importer
+
+
+VARIABLES = {
+  'system_transaction_id': 'Id',
+  'amount': 'Amount',
+  'time': 'Time',
+}
+
+TRANSFORMERS = [
+  {'patterns': None, 'rules': {'transaction_name': 'Bill', 'timestamp': '$time', 'complete': True, 'debit_account': 'Expenses:Unknown', 'debit_amount': '$amount', 'debit_currency': 'CNY'}},
+]
+
+
+class BeanImportStateTests(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    self.temp_dir.cleanup()
+
+  def _write_bill(self, name: str, ids) -> str:
+    path = os.path.join(self.temp_dir.name, name)
+    with open(path, 'w', encoding='utf-8') as file:
+      file.write('Id,Amount,Time\n')
+      for (i, each_id) in enumerate(ids):
+        file.write('{},{}.00,2021-10-{:02} 12:00:00\n'.format(each_id, i + 1, i + 1))
+    return path
+
+  def test_fingerprints_are_ids_or_row_hashes(self):
+    importer = make_importer(TRANSFORMERS, VARIABLES, encoding='utf-8')
+
+    fingerprint_row = make_row_fingerprinter(BeanHeaderBinding.make(importer, ['Id', 'Amount', 'Time']))
+    self.assertEqual(fingerprint_row(['T1', '1.00', '2021-10-01']), 'T1')
+    self.assertEqual(fingerprint_row(['', '1.00', '2021-10-01']), hash_row(['', '1.00', '2021-10-01']))
+
+    fingerprint_row = make_row_fingerprinter(BeanHeaderBinding.make(importer, ['Amount', 'Time']))
+    self.assertEqual(fingerprint_row(['1.00', '2021-10-01']), hash_row(['1.00', '2021-10-01']))
+    self.assertNotEqual(hash_row(['1.00', '2021-10-01']), hash_row(['1.00', '2021-10-02']))
+
+  def test_store_keeps_fingerprints_per_importer(self):
+    path = os.path.join(self.temp_dir.name, 'state.db')
+    BeanImportStateStore(path).add_fingerprints('A', ['1', '2'])
+    BeanImportStateStore(path).add_fingerprints('A', ['2', '3'])
+
+    store = BeanImportStateStore(path)
+    self.assertEqual(store.get_fingerprints('A'), set(['1', '2', '3']))
+    self.assertEqual(store.get_fingerprints('B'), set())
+
+  def test_extract_skips_rows_extracted_before(self):
+    store = BeanImportStateStore(os.path.join(self.temp_dir.name, 'state.db'))
+    importer = BeanExtractImporter(make_importer(TRANSFORMERS, VARIABLES, encoding='utf-8'), state_store=store)
+
+    first_txns = importer.extract(cache.get_file(self._write_bill('october.csv', ['T1', 'T2', 'T3'])))
+    self.assertEqual([t.meta[FINGERPRINT_META_KEY] for t in first_txns], ['T1', 'T2', 'T3'])
+    self.assertEqual(store.get_fingerprints('Test'), set())
+    importer.record_extracted(first_txns)
+
+    overlapping_bill = cache.get_file(self._write_bill('november.csv', ['T2', 'T3', 'T4', 'T5']))
+    self.assertIsNone(importer.file_date(overlapping_bill))
+
+    second_txns = importer.extract(overlapping_bill)
+    self.assertEqual([t.meta[FINGERPRINT_META_KEY] for t in second_txns], ['T4', 'T5'])
+    self.assertEqual(importer.file_date(overlapping_bill).day, 4)
+    importer.record_extracted(second_txns)
+    self.assertEqual(importer.extract(overlapping_bill), [])
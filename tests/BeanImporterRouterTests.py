@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from beancount.ingest import cache
+
+from BeanPorter.bpcml.BPCML import Importer
+from BeanPorter.BeanExtractImporter import BeanExtractImporter
+from BeanPorter.BeanFileDecoder import HEAD_PROBE_MAX_BYTES, BeanDecodedContentsCache, BeanFileHead
+from BeanPorter.BeanImporterRouter import BeanImporterRouter
+
+
+PROBES = [
+  {'file_name': {'prefix': 'bill_'}},
+  {'file_name': {'prefix': 'bill_2021'}},
+  {'file_name': {'prefix': '账单'}},
+  {'file_name': {'suffix': '_export.csv'}},
+  {'file_name': {'suffix': '.csv'}},
+  {'file_name': {'pattern': '/no/such/dir/'}},
+  None,
+]
+
+FILE_NAMES = [
+  'bill_2021.csv',
+  'bill_2020_export.csv',
+  '账单(20210401).csv',
+  'other_export.csv',
+  'bill_2021.txt',
+  'notes.txt',
+]
+
+HEADER_IMPORTERS = [
+  {'name': 'Alipay', 'encoding': 'gb18030', 'probe': {'header': True, 'file_name': {'prefix': 'alipay_'}}, 'strippers': {'remove_first': 1}, 'variables': {'payee': '交易对方', 'amount': '金额'}},
+  {'name': 'WeChat', 'probe': {'header': True}, 'strippers': {'remove_before_and_include': '^----'}, 'variables': {'payee': '交易对方', 'amount': '金额(元)'}},
+  {'name': 'Line', 'probe': {'header': True}, 'table_header': {'line': 2}, 'variables': {'payee': '交易对方'}},
+  {'name': 'Empty', 'probe': {'header': True}},
+]
+
+ALIPAY_ROW = '支出,全家{i},acc,商品{i},余额宝,{i}.00,交易成功,餐饮,T{i}\t,V{i},2021-03-0{d} 12:00:00\n'
+
+WECHAT_ROW = '2021/4/{d} 12:00,商户消费,商户{i},商品{i},支出,¥{i}.50,零钱,支付成功,W{i}\t,M{i},/\n'
+
+# Bills shaped as the built-in importers expect, by original file name.
+BUILTIN_BILLS = [
+  ('alipay_record_20210301.csv', 'gb18030', '支付宝交易记录明细查询\n'
+    + '收/支,交易对方,对方账号,商品说明,收/付款方式,金额,交易状态,交易分类,交易订单号,商家订单号,交易时间\n'
+    + ''.join([ALIPAY_ROW.format(i=i, d=i + 1) for i in range(3)])
+    + ''.join(['footer {}\n'.format(i) for i in range(21)])),
+  ('微信支付账单(20210401-20210430).csv', 'utf-8', '微信支付账单明细\n'
+    + ''.join(['line {}\n'.format(i) for i in range(15)])
+    + '交易时间,交易类型,交易对方,商品,收/支,金额(元),支付方式,当前状态,交易单号,商户单号,备注\n'
+    + ''.join([WECHAT_ROW.format(i=i, d=i + 1) for i in range(4)])),
+]
+
+HEADER_FILES = [
+  ('renamed_alipay.csv', 'gb18030', '支付宝交易记录\n交易号,交易对方,金额\n1,Shop,1.00\n'),
+  ('renamed_wechat.csv', 'utf-8', '微信支付账单\n----\n交易对方,金额(元)\nShop,1.00\n'),
+  ('unrelated.csv', 'utf-8', 'Payee,Amount\nShop,1.00\n'),
+  ('long_preamble.csv', 'utf-8', '\n' * HEAD_PROBE_MAX_BYTES + '----\n交易对方,金额(元)\nShop,1.00\n'),
+]
+
+
+class BeanImporterRouterTests(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.contents_cache = BeanDecodedContentsCache()
+    self.importers = [BeanExtractImporter(Importer.make_importer({'name': 'Importer {}'.format(i), 'probe': p}), self.contents_cache) for (i, p) in enumerate(PROBES)]
+    self.router = BeanImporterRouter(self.importers)
+    self.filenames = list()
+    for each_name in FILE_NAMES:
+      path = os.path.join(self.temp_dir.name, each_name)
+      with open(path, 'w', encoding='utf-8') as file:
+        file.write('Payee,Amount\nShop,1.00\n')
+      self.filenames.append(path)
+
+  def tearDown(self):
+    self.temp_dir.cleanup()
+
+  def test_identifies_as_importers(self):
+    for each_filename in self.filenames + [os.path.join('/no/such/dir', 'bill_2021.csv')]:
+      if os.path.exists(each_filename):
+        expected = [i for i in self.importers if i.identify(cache.get_file(each_filename))]
+        self.assertEqual(self.router.identify(each_filename), expected, each_filename)
+      else:
+        self.assertEqual([i.importer.name for i in self.router.get_candidates(each_filename)], ['Importer 0', 'Importer 1', 'Importer 4', 'Importer 5', 'Importer 6'])
+
+  def test_guesses_mimetype_only_for_candidates(self):
+    router = BeanImporterRouter(self.importers[:-1])
+    with mock.patch.object(self.contents_cache, 'mimetype', wraps=self.contents_cache.mimetype) as mimetype:
+      self.assertEqual(router.identify(self.filenames[-1]), [])
+      self.assertEqual(mimetype.call_count, 0)
+
+      self.assertEqual(len(router.identify(self.filenames[1])), 3)
+      self.assertEqual(mimetype.call_count, 1)
+
+  def test_identifies_headers_as_importers(self):
+    importers = [BeanExtractImporter(Importer.make_importer(c), self.contents_cache) for c in HEADER_IMPORTERS]
+    router = BeanImporterRouter(importers)
+    identified_names = dict()
+
+    for (each_name, each_encoding, each_contents) in HEADER_FILES:
+      path = os.path.join(self.temp_dir.name, each_name)
+      with open(path, 'w', encoding=each_encoding) as file:
+        file.write(each_contents)
+      identified_names[each_name] = [i.importer.name for i in router.identify(path)]
+      self.assertEqual(router.identify(path), [i for i in importers if i.identify(cache.get_file(path))], each_name)
+
+    self.assertEqual(identified_names, {
+      'renamed_alipay.csv': ['Alipay', 'Line'],
+      'renamed_wechat.csv': ['WeChat'],
+      'unrelated.csv': [],
+      'long_preamble.csv': [],
+    })
+
+  def test_failing_header_probe_is_isolated(self):
+    configs = [dict(HEADER_IMPORTERS[1], name='Broken', encoding='no-such-encoding')] + HEADER_IMPORTERS[1:2]
+    importers = [BeanExtractImporter(Importer.make_importer(c), self.contents_cache) for c in configs]
+    (each_name, each_encoding, each_contents) = HEADER_FILES[1]
+    path = os.path.join(self.temp_dir.name, each_name)
+    with open(path, 'w', encoding=each_encoding) as file:
+      file.write(each_contents)
+
+    with self.assertLogs(level='ERROR') as logs:
+      self.assertEqual([i.importer.name for i in BeanImporterRouter(importers).identify(path)], ['WeChat'])
+    self.assertIn('Broken', logs.output[0])
+
+  def test_builtin_bills_are_identified_by_name_only(self):
+    importers = BeanExtractImporter.make_importers(None)
+    router = BeanImporterRouter(importers)
+
+    for (i, (each_name, each_encoding, each_contents)) in enumerate(BUILTIN_BILLS):
+      path = os.path.join(self.temp_dir.name, each_name)
+      renamed_path = os.path.join(self.temp_dir.name, 'renamed_{}.csv'.format(i))
+      for each_path in [path, renamed_path]:
+        with open(each_path, 'w', encoding=each_encoding) as file:
+          file.write(each_contents)
+
+      [importer] = router.identify(path)
+      self.assertEqual(len(importer.extract(cache.get_file(path))), [3, 4][i], each_name)
+
+      with mock.patch('BeanPorter.BeanFileDecoder.BeanFileHead', wraps=BeanFileHead) as file_head:
+        self.assertEqual(router.identify(renamed_path), [])
+        self.assertEqual(file_head.call_count, 0)
+
+  def test_heads_are_read_once_per_file(self):
+    importers = [BeanExtractImporter(Importer.make_importer(c), self.contents_cache) for c in HEADER_IMPORTERS]
+    router = BeanImporterRouter(importers)
+    (each_name, each_encoding, each_contents) = HEADER_FILES[1]
+    path = os.path.join(self.temp_dir.name, each_name)
+    with open(path, 'w', encoding=each_encoding) as file:
+      file.write(each_contents)
+
+    with mock.patch('BeanPorter.BeanFileDecoder.BeanFileHead', wraps=BeanFileHead) as file_head:
+      router.identify(path)
+      for each_importer in importers:
+        each_importer.identify(cache.get_file(path))
+      self.assertEqual(file_head.call_count, 1)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+
+from decimal import Decimal
+
+from unittest import mock
+
+from beancount import loader
+
+from BeanPorter import BeanLedgerIndex as BeanLedgerIndexModule
+from BeanPorter.BeanDuplicateIndex import BeanDuplicateIndex
+from BeanPorter.BeanLedgerIndex import BeanLedgerIndex
+
+from TestSupport import write_file
+
+
+LEDGER = """\
+option "operating_currency" "CNY"
+
+include "accounts.beancount"
+
+2021-10-01 * "FamilyMart" "Lunch"
+  fingerprint: "T1"
+  Expenses:Food        12.00 CNY
+  Assets:Cash         -12.00 CNY
+
+2021-10-02 * "Coffee"
+  Expenses:Food         3.50 CNY
+  Assets:Cash
+
+; 2021-10-03 * "Commented" "Out"
+;   Expenses:Food       1.00 CNY
+"""
+
+ACCOUNTS = """\
+2021-01-01 open Assets:Cash
+2021-01-01 open Expenses:Food
+"""
+
+APPENDED = """
+2021-10-04 ! "Lawson \\"Shop\\"" "Snack" #tag
+  fingerprint: "T4"
+  Expenses:Food      1,000.00 CNY
+  Assets:Cash       -1,000.00 CNY
+"""
+
+
+class BeanLedgerIndexTests(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.ledger_path = write_file(self.temp_dir.name, 'main.beancount', LEDGER)
+    write_file(self.temp_dir.name, 'accounts.beancount', ACCOUNTS)
+    self.index = BeanLedgerIndex(os.path.join(self.temp_dir.name, 'index.sqlite3'))
+
+  def tearDown(self):
+    self.temp_dir.cleanup()
+
+  def _assert_same_keys_as_loader(self):
+    (entries, errors, _) = loader.load_file(self.ledger_path)
+    self.assertEqual(errors, [])
+    expected = BeanDuplicateIndex.make(entries).keys
+
+    # Postings with interpolated amounts are not indexed.
+    expected = set([k for k in expected if not (len(k) == 5 and k[1] == 'Assets:Cash' and k[2] == -3.5)])
+
+    self.assertEqual(self.index.make_duplicate_index(self.ledger_path).keys, expected)
+
+  def test_indexes_same_keys_as_loaded_ledger(self):
+    self._assert_same_keys_as_loader()
+    self.assertEqual(len(self.index.update(self.ledger_path)), 2)
+
+    write_file(self.temp_dir.name, 'main.beancount', APPENDED, 'a')
+    self._assert_same_keys_as_loader()
+    self.assertTrue(self.index.make_duplicate_index(self.ledger_path).has_fingerprint('T4'))
+
+  def test_appended_ledger_is_scanned_from_last_transaction(self):
+    self.index.update(self.ledger_path)
+    last_offset = LEDGER.encode('utf-8').index(b'2021-10-02')
+
+    with mock.patch.object(BeanLedgerIndexModule, 'scan_ledger_file', wraps=BeanLedgerIndexModule.scan_ledger_file) as scan_ledger_file:
+      self.index.update(self.ledger_path)
+      self.assertEqual(scan_ledger_file.call_count, 0)
+
+      write_file(self.temp_dir.name, 'main.beancount', APPENDED, 'a')
+      self.index.update(self.ledger_path)
+      self.assertEqual([c.args[1] for c in scan_ledger_file.call_args_list], [last_offset])
+
+      write_file(self.temp_dir.name, 'main.beancount', LEDGER.replace('FamilyMart', 'Lawson'))
+      self.index.update(self.ledger_path)
+      self.assertEqual(scan_ledger_file.call_args_list[-1].args[1], 0)
+
+    self._assert_same_keys_as_loader()
+
+  def test_early_edit_of_grown_ledger_is_scanned_again(self):
+    transactions = ''.join(['\n2021-10-{d:02d} * "Shop" "Item {i}"\n  Expenses:Food  1.00 CNY\n  Assets:Cash  -1.00 CNY\n'.format(d=i % 28 + 1, i=i) for i in range(2000)])
+    write_file(self.temp_dir.name, 'main.beancount', LEDGER + transactions)
+    self.index.update(self.ledger_path)
+
+    contents = LEDGER.replace('12.00 CNY', '19.00 CNY').replace('-12.00 CNY', '-19.00 CNY') + transactions
+    write_file(self.temp_dir.name, 'main.beancount', contents + APPENDED)
+
+    with mock.patch.object(BeanLedgerIndexModule, 'scan_ledger_file', wraps=BeanLedgerIndexModule.scan_ledger_file) as scan_ledger_file:
+      self.index.update(self.ledger_path)
+      self.assertEqual(scan_ledger_file.call_args_list[0].args[1], 0)
+
+    first_transaction = next(self.index.iter_transactions([os.path.abspath(self.ledger_path)]))
+    self.assertEqual([n for (_, n, _) in first_transaction.postings], [Decimal('19.00'), Decimal('-19.00')])
+    self._assert_same_keys_as_loader()
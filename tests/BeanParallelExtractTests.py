@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from beancount.ingest import cache, identify
+from beancount.ingest.extract import extract as serial_extract
+
+from BeanPorter.BeanExtractImporter import BeanExtractImporter
+from BeanPorter.BeanImportState import BeanImportStateStore
+from BeanPorter.BeanParallelExtract import extract
+
+from TestSupport import write_file
+
+
+CONFIG = """\
+disabled_importers:
+  - Alipay
+  - WeChatPay
+importers:
+  -
+    name: Bill
+    encoding: utf-8
+    probe:
+      file_name:
+        prefix: bill_
+    variables:
+      payee: Payee
+      amount: Amount
+      timestamp: Time
+    transformers:
+      -
+        patterns:
+        rules:
+          payee: $payee
+          transaction_name: Bill
+          timestamp: $timestamp
+          complete: True
+          debit_account: Expenses:Unknown
+          debit_amount: $amount
+          debit_currency: CNY
+          credit_account: Assets:Cash
+          credit_amount: -$amount
+          credit_currency: CNY
+"""
+
+
+class BeanParallelExtractTests(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.config_path = write_file(self.temp_dir.name, 'config.yaml', CONFIG)
+    for i in range(4):
+      write_file(self.temp_dir.name, os.path.join('bills', 'bill_{}.csv'.format(i)), 'Payee,Amount,Time\nShop{i},{i}.00,2021-10-0{d} 12:00:00\n'.format(i=i, d=i + 1))
+    write_file(self.temp_dir.name, os.path.join('bills', 'nested', 'bill_9.csv'), 'Payee,Amount,Time\nShop9,9.00,2021-09-01 12:00:00\n')
+
+  def tearDown(self):
+    self.temp_dir.cleanup()
+
+  def test_parallel_output_is_same_as_serial(self):
+    files = [os.path.join(self.temp_dir.name, 'bills')]
+
+    expected = io.StringIO()
+    serial_extract(BeanExtractImporter.make_importers([self.config_path]), files, expected)
+
+    for jobs in [1, 3]:
+      actual = io.StringIO()
+      extract([self.config_path], files, actual, jobs=jobs)
+      self.assertEqual(actual.getvalue(), expected.getvalue())
+
+    self.assertEqual(expected.getvalue().count('Expenses:Unknown'), 5)
+
+  def test_state_is_recorded_once_output_is_written(self):
+    files = [os.path.join(self.temp_dir.name, 'bills')]
+    store = BeanImportStateStore(os.path.join(self.temp_dir.name, 'state.db'))
+
+    class _FailingOutput(io.StringIO):
+      def write(self, s):
+        raise OSError('No space left on device')
+
+    for jobs in [1, 3]:
+      with self.assertRaises(OSError):
+        extract([self.config_path], files, _FailingOutput(), jobs=jobs, state_store=store)
+      self.assertEqual(store.get_fingerprints('Bill'), set())
+
+    output = io.StringIO()
+    extract([self.config_path], files, output, jobs=3, state_store=store)
+    self.assertEqual(output.getvalue().count('Expenses:Unknown'), 5)
+    self.assertEqual(len(store.get_fingerprints('Bill')), 5)
+
+    output = io.StringIO()
+    extract([self.config_path], files, output, state_store=store)
+    self.assertEqual(output.getvalue().count('Expenses:Unknown'), 0)
+
+  def test_large_files_are_extracted_by_importers_with_jobs(self):
+    files = [os.path.join(self.temp_dir.name, 'bills')]
+    jobs_config_path = write_file(self.temp_dir.name, 'jobs_config.yaml', CONFIG.replace('    encoding: utf-8\n', '    encoding: utf-8\n    jobs: 2\n'))
+
+    with mock.patch.object(identify, 'FILE_TOO_LARGE_THRESHOLD', 16):
+      output = io.StringIO()
+      with self.assertLogs(level='WARNING'):
+        extract([self.config_path], files, output)
+      self.assertEqual(output.getvalue().count('Expenses:Unknown'), 0)
+
+      output = io.StringIO()
+      extract([jobs_config_path], files, output)
+      self.assertEqual(output.getvalue().count('Expenses:Unknown'), 5)
+
+  def test_jobs_of_importers_are_capped(self):
+    jobs_config_path = write_file(self.temp_dir.name, 'jobs_config.yaml', CONFIG.replace('    encoding: utf-8\n', '    encoding: utf-8\n    jobs: 4\n'))
+    self.assertEqual([i.get_jobs() for i in BeanExtractImporter.make_importers([jobs_config_path]) if i.name() == 'Bill'], [4])
+    self.assertEqual([i.get_jobs() for i in BeanExtractImporter.make_importers([jobs_config_path], max_jobs=1) if i.name() == 'Bill'], [1])
+
+  def test_similar_entries_are_flagged_by_default(self):
+    files = [os.path.join(self.temp_dir.name, 'bills', 'bill_1.csv')]
+    [importer] = [i for i in BeanExtractImporter.make_importers([self.config_path]) if i.name() == 'Bill']
+    # Another payee and no fingerprint, so only similarity finds them.
+    entries = [t._replace(payee='Other', meta=dict()) for t in importer.extract(cache.get_file(files[0]))]
+
+    for (hooks, duplicate_count) in [(None, 1), ([], 0)]:
+      output = io.StringIO()
+      extract([self.config_path], files, output, entries=entries, hooks=hooks)
+      self.assertEqual(output.getvalue().count('; 2021-'), duplicate_count)
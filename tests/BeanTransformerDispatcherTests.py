@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from BeanPorter.BeanExtractRuleset import BeanExtractRuleset
+from BeanPorter.BeanTransformerDispatcher import _AutomatonTransformerDispatcher, _IndexedTransformerDispatcher, _NaiveTransformerDispatcher
+
+from TestSupport import make_ruleset
+
+
+class BeanTransformerDispatcherTests(unittest.TestCase):
+
+  def _assert_same_as_naive(self, ruleset: BeanExtractRuleset, rows):
+    naive = _NaiveTransformerDispatcher(ruleset.transformer_plans)
+    indexed = _IndexedTransformerDispatcher(ruleset.transformer_plans)
+    automaton = _AutomatonTransformerDispatcher(ruleset.transformer_plans)
+    for each_row in rows:
+      expected = [p.index for p in naive.get_matching_plans(each_row)]
+      self.assertEqual([p.index for p in indexed.get_matching_plans(each_row)], expected, each_row)
+      self.assertEqual([p.index for p in automaton.get_matching_plans(each_row)], expected, each_row)
+
+  def test_dispatchers_agree_with_naive_dispatch(self):
+    ruleset = make_ruleset([
+      {'patterns': None, 'rules': {'payee': 'A'}},
+      {'patterns': {'counterparty': '全家'}, 'rules': {'payee': 'B'}},
+      {'patterns': {'counterparty': '全家便利店'}, 'rules': {'payee': 'C'}},
+      {'patterns': {'counterparty': "r'.*便利'"}, 'rules': {'payee': 'D'}},
+      {'patterns': {'status': '成功', 'counterparty': '罗森'}, 'rules': {'payee': 'E'}},
+      {'patterns': {'status': '成功'}, 'rules': {'payee': 'F'}},
+      {'patterns': {'unknown': '成功'}, 'rules': {'payee': 'G'}},
+      {'patterns': {'counterparty': ''}, 'rules': {'payee': 'H'}},
+    ])
+    rows = [
+      ['全家便利店', '成功'],
+      ['全家', '关闭'],
+      ['罗森', '成功'],
+      ['罗森便利', '失败'],
+      ['', ''],
+    ]
+    self._assert_same_as_naive(ruleset, rows)
+
+  def test_indexed_dispatch_keeps_transformer_order(self):
+    ruleset = make_ruleset([
+      {'patterns': {'status': '成功'}, 'rules': {'payee': 'A'}},
+      {'patterns': {'counterparty': '全家'}, 'rules': {'payee': 'B'}},
+      {'patterns': None, 'rules': {'payee': 'C'}},
+      {'patterns': {'counterparty': '全'}, 'rules': {'payee': 'D'}},
+    ])
+    dispatcher = _IndexedTransformerDispatcher(ruleset.transformer_plans)
+    plans = dispatcher.get_matching_plans(['全家', '成功'])
+    self.assertEqual([p.index for p in plans], [0, 1, 2, 3])
+
+  def test_automaton_dispatch_matches_regex_patterns_at_once(self):
+    ruleset = make_ruleset([
+      {'patterns': {'counterparty': "r'全家\\d'"}, 'rules': {'payee': 'A'}},
+      {'patterns': {'counterparty': "r'(全|罗)'"}, 'rules': {'payee': 'B'}},
+      {'patterns': {'counterparty': "r'(.)\\1'"}, 'rules': {'payee': 'C'}},
+      {'patterns': {'counterparty': "r'全家\\d'", 'status': "r'成'"}, 'rules': {'payee': 'D'}},
+      {'patterns': {'status': '成功', 'counterparty': '全家'}, 'rules': {'payee': 'E'}},
+    ])
+    rows = [
+      ['全家1', '成功'],
+      ['全全', '失败'],
+      ['罗森', '成功'],
+      ['便利', ''],
+    ]
+    self._assert_same_as_naive(ruleset, rows)
+
+  def test_automaton_falls_back_when_regexes_cannot_be_merged(self):
+    ruleset = make_ruleset([
+      {'patterns': {'counterparty': "r'(?i)abc'"}, 'rules': {'payee': 'A'}},
+      {'patterns': {'counterparty': "r'(?i)ab'"}, 'rules': {'payee': 'B'}},
+    ])
+    self._assert_same_as_naive(ruleset, [['ABCD', ''], ['aB', ''], ['b', '']])
+
+  def test_importer_selects_matcher(self):
+    for matcher in ['naive', 'index', 'automaton']:
+      ruleset = make_ruleset([{'patterns': {'status': '成功'}, 'rules': {'payee': 'A'}}], matcher=matcher)
+      self.assertEqual(len(ruleset.dispatcher.get_matching_plans(['', '成功'])), 1)
+
+    with self.assertRaises(AssertionError):
+      make_ruleset([], matcher='unknown')
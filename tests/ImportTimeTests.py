@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+from typing import List, Optional
+
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import BeanPorter
+
+# Modules slow to import, which importing the package must leave to the
+# paths that need them.
+HEAVY_MODULES = [
+  'beancount.ingest',
+  'beancount.loader',
+  'chardet',
+  'dateutil.parser',
+  'distutils',
+  'numpy',
+  'pytest',
+  'yaml',
+  'BeanPorter.bpcml.BPCML',
+  'BeanPorter.BeanParallelExtract',
+]
+
+# Budget of the cumulative import time of the package, in microseconds.
+IMPORT_TIME_BUDGET = 100 * 1000
+
+# Set to run tests timing the code, whose results depend on the machine.
+BENCHMARKS_ENVIRONMENT_VARIABLE = 'BEAN_PORTER_BENCHMARKS'
+
+# Rows of the bill extracted by the cold extraction benchmark.
+EXTRACTION_ROW_COUNT = 30
+
+WECHAT_BILL = ('微信支付账单明细\n'
+  + ''.join(['line {}\n'.format(i) for i in range(15)])
+  + '交易时间,交易类型,交易对方,商品,收/支,金额(元),支付方式,当前状态,交易单号,商户单号,备注\n'
+  + ''.join(['2021/4/{d} 12:00,商户消费,商户{i},商品{i},支出,¥{i}.50,零钱,支付成功,W{i}\t,M{i},/\n'.format(i=i, d=i % 28 + 1) for i in range(EXTRACTION_ROW_COUNT)]))
+
+# Runs the command line as the shell does.
+EXTRACTION_CODE = 'import sys, BeanPorter; sys.argv = ["bean-porter", "--config", sys.argv[1], "--file", sys.argv[2]]; BeanPorter.main()'
+
+
+def _get_import_time(stderr: str, module: str) -> int:
+  pattern = r'import time:\s+\d+\s+\|\s+(\d+)\s+\|\s*' + re.escape(module) + '$'
+  return int(re.search(pattern, stderr, re.MULTILINE).group(1))
+
+
+def _run_cold(code: str, *options: str, args: Optional[List[str]] = None, cache_dir: Optional[str] = None) -> subprocess.CompletedProcess:
+  env = dict(os.environ)
+  source_dir = os.path.dirname(os.path.dirname(os.path.abspath(BeanPorter.__file__)))
+  env['PYTHONPATH'] = os.pathsep.join([source_dir, env.get('PYTHONPATH', '')])
+  if cache_dir is not None:
+    env['BEAN_PORTER_CACHE_DIR'] = cache_dir
+  return subprocess.run([sys.executable, *options, '-c', code, *(args or [])], env=env, capture_output=True, text=True, check=True)
+
+
+class ImportTimeTests(unittest.TestCase):
+
+  def test_import_leaves_heavy_modules_unloaded(self):
+    code = 'import sys, BeanPorter; print("\\n".join(sorted(sys.modules)))'
+    loaded = set(_run_cold(code).stdout.split())
+    self.assertEqual([m for m in HEAVY_MODULES if m in loaded], [])
+
+  @unittest.skipUnless(os.environ.get(BENCHMARKS_ENVIRONMENT_VARIABLE), 'Set {} to run benchmarks'.format(BENCHMARKS_ENVIRONMENT_VARIABLE))
+  def test_cold_import_time(self):
+    # The best of a few runs, as other processes may slow a single one.
+    import_times = list()
+    for _ in range(3):
+      stderr = _run_cold('import BeanPorter', '-X', 'importtime').stderr
+      import_times.append(_get_import_time(stderr, 'BeanPorter'))
+    self.assertLess(min(import_times), IMPORT_TIME_BUDGET)
+
+  @unittest.skipUnless(os.environ.get(BENCHMARKS_ENVIRONMENT_VARIABLE), 'Set {} to run benchmarks'.format(BENCHMARKS_ENVIRONMENT_VARIABLE))
+  def test_cold_extraction_time(self):
+    # Reports the time of extracting a small bill from the command line, and
+    # how much of it importing beancount.ingest takes: the package imports
+    # pytest, and its extract module imports beancount.loader.
+    with tempfile.TemporaryDirectory() as temp_dir:
+      config_path = os.path.join(temp_dir, 'config.yaml')
+      with open(config_path, 'w', encoding='utf-8') as config_file:
+        config_file.write('importers: []\n')
+      bill_path = os.path.join(temp_dir, '微信支付账单(20210401-20210430).csv')
+      with open(bill_path, 'w', encoding='utf-8') as bill_file:
+        bill_file.write(WECHAT_BILL)
+
+      run_times = list()
+      ingest_import_times = list()
+      extract_import_times = list()
+      for _ in range(3):
+        start = time.perf_counter()
+        result = _run_cold(EXTRACTION_CODE, '-X', 'importtime', args=[config_path, bill_path], cache_dir=os.path.join(temp_dir, 'cache'))
+        run_times.append(time.perf_counter() - start)
+        ingest_import_times.append(_get_import_time(result.stderr, 'beancount.ingest'))
+        extract_import_times.append(_get_import_time(result.stderr, 'beancount.ingest.extract'))
+        self.assertEqual(result.stdout.count('fingerprint:'), EXTRACTION_ROW_COUNT)
+
+    sys.stderr.write('\nCold extraction of {r} rows: {t:.0f} ms, of which importing beancount.ingest: {i:.0f} ms, beancount.ingest.extract: {e:.0f} ms\n'.format(
+      r=EXTRACTION_ROW_COUNT,
+      t=min(run_times) * 1000,
+      i=min(ingest_import_times) / 1000,
+      e=min(extract_import_times) / 1000))
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+"""
+Fixtures shared by the tests.
+"""
+
+from typing import Dict, List, Optional
+
+import os
+
+from BeanPorter.bpcml.BPCML import Importer
+from BeanPorter.BeanExtractContext import BeanExtractContext
+from BeanPorter.BeanExtractRuleset import BeanExtractRuleset
+
+
+# Variables of importers evaluating rows of STATUS_HEADER.
+STATUS_VARIABLES: Dict[str, str] = {
+  'status': 'Status',
+  'counterparty': 'Counterparty',
+}
+
+STATUS_HEADER: List[str] = ['Counterparty', 'Status']
+
+# Variables of importers extracting bills of BILL_HEADER.
+BILL_VARIABLES: Dict[str, str] = {
+  'counterparty': 'Counterparty',
+  'status': 'Status',
+  'amount': 'Amount',
+  'time': 'Time',
+}
+
+BILL_HEADER: List[str] = ['Counterparty', 'Status', 'Amount', 'Time']
+
+# Transformers making a transaction of each successful bill row.
+BILL_TRANSFORMERS: List[dict] = [
+  {'patterns': None, 'rules': {'debit_currency': 'CNY', 'credit_currency': 'CNY', 'payee': '$counterparty', 'transaction_name': '$status', 'timestamp': '$time'}},
+  {'patterns': {'status': '交易成功'}, 'rules': {'complete': True, 'debit_account': 'Expenses:Unknown', 'debit_amount': '$amount', 'credit_account': 'Assets:Cash', 'credit_amount': '-$amount'}},
+]
+
+
+def make_importer(transformers: Optional[List[dict]] = None, variables: Optional[Dict[str, str]] = None, **settings) -> Importer:
+  """
+  Makes an importer named "Test" with the given transformers and variables,
+  the status ones by default. Other settings are passed as they are.
+  """
+  serialization = {
+    'name': 'Test',
+    'variables': dict(variables if variables is not None else STATUS_VARIABLES),
+    'transformers': transformers,
+  }
+  serialization.update(settings)
+  return Importer.make_importer(serialization)
+
+
+def make_context(transformers: List[dict], **settings) -> BeanExtractContext:
+  return BeanExtractContext('*', make_importer(transformers, **settings), STATUS_HEADER)
+
+
+def make_ruleset(transformers: List[dict], **settings) -> BeanExtractRuleset:
+  return BeanExtractRuleset.make(make_importer(transformers, **settings), STATUS_HEADER)
+
+
+def write_file(directory: str, name: str, contents, mode: Optional[str] = None) -> str:
+  """
+  Writes a file in a directory, making its parent directories, and returns
+  its path. Text is written in UTF-8, and bytes as they are.
+  """
+  if mode is None:
+    mode = 'wb' if isinstance(contents, bytes) else 'w'
+  path = os.path.join(directory, name)
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  with open(path, mode, encoding=None if 'b' in mode else 'utf-8') as file:
+    file.write(contents)
+  return path
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from BeanPorter.bpcml.BPCML import BPCML
+from BeanPorter.bpcml.ConfigCache import ConfigCache
+from BeanPorter.bpcml.ConfigLoader import SourceMark
+from BeanPorter.BeanCache import CACHE_DIRECTORY_ENVIRONMENT_VARIABLE
+from BeanPorter.BeanExtractImporter import BeanExtractImporter
+
+from TestSupport import write_file
+
+
+ROOT_CONFIG = """\
+include:
+  - included.yaml
+importers:
+  -
+    name: Root
+    transformers:
+      -
+        patterns:
+        rules:
+          payee: Root
+"""
+
+INCLUDED_CONFIG = """\
+importers:
+  -
+    name: Included
+    transformers:
+      -
+        patterns:
+        rules:
+          payee: {}
+extends_Root:
+  transformers:
+    -
+      patterns:
+      rules:
+        payee: Extended
+"""
+
+
+class ConfigCacheTests(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.root_path = write_file(self.temp_dir.name, 'root.yaml', ROOT_CONFIG)
+    write_file(self.temp_dir.name, 'included.yaml', INCLUDED_CONFIG.format('Included'))
+    self.config_cache = ConfigCache(os.path.join(self.temp_dir.name, 'configs'))
+
+  def tearDown(self):
+    self.temp_dir.cleanup()
+
+  def _load(self):
+    with mock.patch.object(BPCML, 'make_with_serialization', wraps=BPCML.make_with_serialization) as make_with_serialization:
+      config = BPCML.make_with_serialization_at_path(self.root_path, self.config_cache)
+      config.resolve()
+    payees = {i.name: [t.rules['payee'].evaluate(dict()) for t in i.transformers] for i in config.importers}
+    return (make_with_serialization.call_count, payees)
+
+  def _load_uncached(self):
+    config = BPCML.make_with_serialization_at_path(self.root_path)
+    config.resolve()
+    return {i.name: [t.rules['payee'].evaluate(dict()) for t in i.transformers] for i in config.importers}
+
+  def test_compiles_each_file_once(self):
+    expected_payees = self._load_uncached()
+    self.assertEqual(expected_payees['Included'], ['Included'])
+
+    self.assertEqual(self._load(), (2, expected_payees))
+
+    # Resolving extends importers loaded from the cache, which must not leak
+    # into later loads.
+    self.assertEqual(self._load(), (0, expected_payees))
+    self.assertEqual(self._load(), (0, expected_payees))
+
+  def test_edited_file_is_compiled_alone(self):
+    self._load()
+    write_file(self.temp_dir.name, 'included.yaml', INCLUDED_CONFIG.format('Edited'))
+    self.assertEqual(self._load(), (1, self._load_uncached()))
+    self.assertEqual(self._load()[1]['Included'], ['Edited'])
+
+  def test_copied_file_keeps_its_own_marks(self):
+    copy_path = write_file(self.temp_dir.name, 'copy.yaml', INCLUDED_CONFIG.format('Included'))
+    self._load()
+    for each_path in [os.path.join(self.temp_dir.name, 'included.yaml'), copy_path]:
+      config = BPCML.make_with_serialization_at_path(each_path, self.config_cache)
+      self.assertEqual(config.importers[0].transformers[0].mark, SourceMark(each_path, 6, 9))
+
+  def test_importers_are_made_with_given_cache_only(self):
+    default_dir = os.path.join(self.temp_dir.name, 'default')
+    with mock.patch.dict(os.environ, {CACHE_DIRECTORY_ENVIRONMENT_VARIABLE: default_dir}):
+      BeanExtractImporter.make_importers([self.root_path])
+      self.assertFalse(os.path.exists(default_dir))
+
+      BeanExtractImporter.make_importers([self.root_path], config_cache=self.config_cache)
+      self.assertFalse(os.path.exists(default_dir))
+
+    self.assertEqual(len(os.listdir(self.config_cache.directory)), 3)
+    self.assertEqual(os.stat(self.config_cache.directory).st_mode & 0o777, 0o700)
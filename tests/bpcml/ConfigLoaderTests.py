@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import time
+import unittest
+
+import yaml
+
+from BeanPorter.bpcml.BPCML import BPCML
+from BeanPorter.bpcml.ConfigLoader import SourceMark, load_config
+
+# Set to run tests timing the code, whose results depend on the machine.
+BENCHMARKS_ENVIRONMENT_VARIABLE = 'BEAN_PORTER_BENCHMARKS'
+
+CONFIG = """\
+importers:
+  -
+    name: Shop
+    transformers:
+      -
+        patterns:
+          payee: Shop
+        rules:
+          payee: Shop
+          transaction_name: ($narration
+"""
+
+TRANSFORMER = """\
+      -
+        name: Transformer {i}
+        patterns:
+          payee: "^Shop {i}$"
+          amount: "{i}.00"
+        rules:
+          payee: "Shop {i}"
+          transaction_name: $narration + " #{i}"
+          debit_account: Expenses:Shop{i}
+          credit_account: Assets:Cash
+          debit_amount: $amount
+"""
+
+
+def _make_large_config(transformer_count: int) -> bytes:
+  transformers = ''.join([TRANSFORMER.format(i=i) for i in range(transformer_count)])
+  return ('importers:\n  -\n    name: Large\n    transformers:\n' + transformers).encode('utf-8')
+
+
+def _time_loading(contents: bytes, uses_libyaml: bool) -> float:
+  # The best of a few runs, as other processes may slow a single one.
+  durations = list()
+  for _ in range(3):
+    start = time.perf_counter()
+    load_config(contents, uses_libyaml=uses_libyaml)
+    durations.append(time.perf_counter() - start)
+  return min(durations)
+
+
+class ConfigLoaderTests(unittest.TestCase):
+
+  def test_loads_as_safe_load(self):
+    contents = _make_large_config(50)
+    expected = yaml.safe_load(contents)
+    self.assertEqual(load_config(contents, uses_libyaml=False), expected)
+    if hasattr(yaml, 'CSafeLoader'):
+      self.assertEqual(load_config(contents, uses_libyaml=True), expected)
+
+  def test_keeps_marks_of_transformers_and_rules(self):
+    with tempfile.TemporaryDirectory() as temp_dir:
+      path = os.path.join(temp_dir, 'config.yaml')
+      with open(path, 'w', encoding='utf-8') as config_file:
+        config_file.write(CONFIG)
+
+      with self.assertLogs(level='CRITICAL') as logs:
+        config = BPCML.make_with_serialization_at_path(path)
+
+      transformer = config.importers[0].transformers[0]
+      self.assertEqual(transformer.mark, SourceMark(path, 6, 9))
+      self.assertEqual(transformer.rule_marks['payee'], SourceMark(path, 9, 18))
+      self.assertEqual(transformer.rule_marks['transaction_name'], SourceMark(path, 10, 29))
+      self.assertEqual(len(logs.output), 1)
+      self.assertIn('{}:10:29: '.format(path), logs.output[0])
+
+  @unittest.skipUnless(os.environ.get(BENCHMARKS_ENVIRONMENT_VARIABLE), 'Set {} to run benchmarks'.format(BENCHMARKS_ENVIRONMENT_VARIABLE))
+  @unittest.skipIf(not hasattr(yaml, 'CSafeLoader'), 'PyYAML is built without libyaml')
+  def test_libyaml_loads_large_configs_faster(self):
+    contents = _make_large_config(500)
+    self.assertLess(_time_loading(contents, True), _time_loading(contents, False))
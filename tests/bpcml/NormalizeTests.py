@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+import io
+import unittest
+
+from BeanPorter.bpcml.BPCML import Importer
+
+from TestSupport import make_importer
+
+
+def _make_importer(strippers) -> Importer:
+  return make_importer(strippers=strippers)
+
+
+def _make_file_contents(lines_count: int) -> str:
+  return '\n'.join(['a{i}, b{i} ,c{i}'.format(i=i) for i in range(lines_count)])
+
+
+class NormalizeTests(unittest.TestCase):
+
+  def _make_rows(self, indices) -> list:
+    return [['a{}'.format(i), 'b{}'.format(i), 'c{}'.format(i)] for i in indices]
+
+  def test_remove_first_and_last(self):
+    file_contents = _make_file_contents(30)
+    for (strippers, expected_indices) in [
+      (None, range(30)),
+      ({'remove_first': 4}, range(4, 30)),
+      ({'remove_last': 7}, range(0, 23)),
+      ({'remove_first': 3, 'remove_last': 5}, range(3, 25)),
+    ]:
+      importer = _make_importer(strippers)
+      self.assertEqual(importer.normalize(file_contents), self._make_rows(expected_indices))
+
+  def test_remove_before(self):
+    importer = _make_importer({'remove_before': r'^a1\d'})
+    self.assertEqual(importer.normalize(_make_file_contents(20)), self._make_rows(range(10, 20)))
+
+  def test_remove_before_and_include(self):
+    importer = _make_importer({'remove_before_and_include': 'b5'})
+    self.assertEqual(importer.normalize(_make_file_contents(10)), self._make_rows(range(6, 10)))
+
+  def test_remove_after(self):
+    importer = _make_importer({'remove_after': 'c7'})
+    self.assertEqual(importer.normalize(_make_file_contents(10)), self._make_rows(range(0, 8)))
+
+  def test_remove_after_and_include(self):
+    importer = _make_importer({'remove_after_and_include': 'c7'})
+    self.assertEqual(importer.normalize(_make_file_contents(10)), self._make_rows(range(0, 7)))
+
+  def test_remove_after_only_looks_after_leading_strippers(self):
+    importer = _make_importer({'remove_first': 3, 'remove_after_and_include': 'a'})
+    self.assertEqual(importer.normalize(_make_file_contents(10)), [])
+    importer = _make_importer({'remove_first': 3, 'remove_after_and_include': 'a[0-2]'})
+    self.assertEqual(importer.normalize(_make_file_contents(10)), self._make_rows(range(3, 10)))
+
+  def test_combined_strippers_take_the_narrowest_range(self):
+    importer = _make_importer({
+      'remove_first': 2,
+      'remove_before': 'a4',
+      'remove_last': 3,
+      'remove_after_and_include': 'a9',
+    })
+    self.assertEqual(importer.normalize(_make_file_contents(20)), self._make_rows(range(4, 9)))
+    importer = _make_importer({
+      'remove_before': 'a4',
+      'remove_last': 13,
+      'remove_after': 'a9',
+    })
+    self.assertEqual(importer.normalize(_make_file_contents(20)), self._make_rows(range(4, 7)))
+
+  def test_missing_leading_boundary_strips_everything(self):
+    importer = _make_importer({'remove_before': 'z'})
+    self.assertEqual(importer.normalize(_make_file_contents(5)), [])
+
+  def test_trailing_boundary_stops_reading(self):
+    importer = _make_importer({'remove_after': 'row3', 'remove_last': 2})
+    lines_read = []
+
+    def lines():
+      for i in range(100):
+        lines_read.append(i)
+        yield 'row{}\n'.format(i)
+
+    rows = list(importer.iter_normalized_rows(lines()))
+    self.assertEqual(rows, [['row0'], ['row1'], ['row2'], ['row3']])
+    self.assertEqual(len(lines_read), 6)
+
+  def test_streamed_rows_are_stripped(self):
+    importer = _make_importer(None)
+    results = list(importer.iter_normalized_rows(io.StringIO(' a ,"b ", c\n')))
+    self.assertEqual(results, [['a', 'b', 'c']])
+
+  def test_remove_last_more_than_lines_count(self):
+    importer = _make_importer({'remove_last': 50})
+    results = list(importer.iter_normalized_rows(io.StringIO(_make_file_contents(10))))
+    self.assertEqual(results, [])
+
+  def test_remove_last_does_not_read_ahead_of_lookahead(self):
+    importer = _make_importer({'remove_last': 2})
+    lines_read = []
+
+    def lines():
+      for i in range(10):
+        lines_read.append(i)
+        yield 'row{}\n'.format(i)
+
+    rows = importer.iter_normalized_rows(lines())
+    self.assertEqual(next(rows), ['row0'])
+    self.assertEqual(len(lines_read), 3)
+
+  def test_header_row_is_first_normalized_row(self):
+    file_contents = _make_file_contents(30)
+    for strippers in [None, {'remove_first': 4}, {'remove_before': r'^a1\d'}, {'remove_first': 3, 'remove_last': 5, 'remove_after': 'c7'}]:
+      importer = _make_importer(strippers)
+      self.assertEqual(importer.find_header_row(io.StringIO(file_contents)), importer.normalize(file_contents)[0])
+
+    importer = make_importer(table_header={'line': 3})
+    self.assertEqual(importer.find_header_row(io.StringIO(file_contents)), self._make_rows([2])[0])
+    self.assertEqual(importer.normalize(file_contents), self._make_rows(range(2, 30)))
+
+    importer = make_importer(table_header={'line': 3}, strippers={'remove_first': 5})
+    self.assertEqual(importer.find_header_row(io.StringIO(file_contents)), self._make_rows([5])[0])
+    self.assertEqual(importer.normalize(file_contents), self._make_rows(range(5, 30)))
+    self.assertIsNone(_make_importer({'remove_before': 'x'}).find_header_row(io.StringIO(file_contents)))
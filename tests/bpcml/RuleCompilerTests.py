@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from BeanPorter.bpcml.ASTContext import ASTContext
+from BeanPorter.bpcml.RuleCompiler import compile_rule, fold_rule
+from BeanPorter.bpcml.Tokenizer import Tokenizer
+
+
+VARIABLE_SLOTS = {
+  'timestamp': 0,
+  'amount': 1,
+  'payee': 2,
+}
+
+ROWS = [
+  ['2021-10-01 12:34:56', '¥12.50', '全家'],
+  ['2021/1/2 3:04', '100', '{罗森}'],
+]
+
+
+class RuleCompilerTests(unittest.TestCase):
+
+  def _assert_same_as_interpreter(self, contents):
+    rule = ASTContext(Tokenizer(), contents).make_syntax()
+    compiled_rule = compile_rule(rule, VARIABLE_SLOTS)
+    for each_row in ROWS:
+      variables = {k: each_row[v] for (k, v) in VARIABLE_SLOTS.items()}
+      self.assertEqual(compiled_rule(each_row), rule.evaluate(variables), contents)
+
+  def test_constants(self):
+    for contents in ['CNY', 'Expenses:Food', '100', '-100', '+12.5', True, False]:
+      self._assert_same_as_interpreter(contents)
+
+  def test_variable_references(self):
+    for contents in ['$payee', '-$amount', '+$amount']:
+      self._assert_same_as_interpreter(contents)
+
+  def test_compound_expressions(self):
+    for contents in ['$payee $amount', 'Paid  $payee at $timestamp', '{0} $payee {}', 'a b c']:
+      self._assert_same_as_interpreter(contents)
+
+  def test_function_calls(self):
+    for contents in ['@date($timestamp)', '@time($timestamp)', '@dy($amount)', '@dy($amount) CNY']:
+      self._assert_same_as_interpreter(contents)
+
+  def test_unbound_variable_fails_at_evaluation(self):
+    rule = ASTContext(Tokenizer(), '$unknown').make_syntax()
+    compiled_rule = compile_rule(rule, VARIABLE_SLOTS)
+    with self.assertRaises(KeyError):
+      compiled_rule(ROWS[0])
+
+  def test_folds_constant_rules(self):
+    def fold(contents):
+      return fold_rule(ASTContext(Tokenizer(), contents).make_syntax())
+
+    self.assertEqual(fold('CNY'), 'CNY')
+    self.assertEqual(fold(True), 'True')
+    self.assertEqual(fold('-100 CNY'), '-100 CNY')
+    self.assertEqual(fold('@dy(¥12)'), '12')
+    self.assertIsNone(fold('$payee'))
+    self.assertIsNone(fold('@dy($amount)'))
+
+  def test_date_and_time_calls_are_not_folded(self):
+    # Dates missing parts, as '1000' missing its month and day, depend on
+    # the current date.
+    for contents in ['@date(1000)', '@time(20211001)']:
+      rule = ASTContext(Tokenizer(), contents).make_syntax()
+      self.assertIsNone(fold_rule(rule))
+      self.assertEqual(compile_rule(rule, VARIABLE_SLOTS)(ROWS[0]), rule.evaluate(dict()))
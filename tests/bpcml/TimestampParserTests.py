@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+import pickle
+import unittest
+from unittest import mock
+
+import dateutil.parser
+
+from BeanPorter.bpcml.TimestampParser import TimestampParser
+
+
+class TimestampParserTests(unittest.TestCase):
+
+  def test_agrees_with_dateutil(self):
+    parser = TimestampParser()
+    for string in ['2021-10-01 12:34:56', '2021-1-2 3:04:05', '2021/1/2 3:04', '2021-10-01', '2021-10-01T01:02:03', 'Oct 1 2021 10:00', '2021-10-01 12:34:56+08:00']:
+      self.assertEqual(parser.parse(string), dateutil.parser.parse(string), string)
+
+  def test_learns_format_from_first_timestamp(self):
+    parser = TimestampParser()
+    parser.parse('2021-10-01 12:34:56')
+    self.assertEqual(parser.learned_format, '%Y-%m-%d %H:%M:%S')
+
+    with mock.patch.object(dateutil.parser, 'parse') as parse:
+      parser.parse('2021-10-02 00:00:01')
+      parse.assert_not_called()
+
+  def test_falls_back_and_relearns_on_mismatch(self):
+    parser = TimestampParser()
+    parser.parse('2021-10-01 12:34:56')
+    self.assertEqual(parser.parse('2021/10/02 08:00'), dateutil.parser.parse('2021/10/02 08:00'))
+    self.assertEqual(parser.learned_format, '%Y/%m/%d %H:%M')
+
+  def test_memoizes_results(self):
+    parser = TimestampParser()
+    parser.parse('Oct 1 2021 10:00')
+    self.assertIsNone(parser.learned_format)
+
+    with mock.patch.object(dateutil.parser, 'parse') as parse:
+      parser.parse('Oct 1 2021 10:00')
+      parse.assert_not_called()
+
+  def test_pickled_parser_starts_over(self):
+    parser = TimestampParser(memo_capacity=16)
+    parser.parse('2021-10-01 12:34:56')
+    unpickled = pickle.loads(pickle.dumps(parser))
+    self.assertEqual(unpickled.memo_capacity, 16)
+    self.assertIsNone(unpickled.learned_format)
+    self.assertEqual(unpickled.parse('2021/10/02 08:00'), dateutil.parser.parse('2021/10/02 08:00'))